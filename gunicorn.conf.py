@@ -0,0 +1,74 @@
+# 智能答題系統 Gunicorn 設定（SERVER_MODE=production 時由 docker-entrypoint.sh 使用）
+#
+# 平滑重啟：kill -HUP <master pid> 會依新設定啟動新 worker 後再結束舊 worker；
+# 啟用 GUNICORN_PRELOAD 時程式碼已在 master 載入，更新程式碼需重新啟動容器（或 USR2 + QUIT 熱升級）
+
+import os
+import threading
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))  # 大於 1 時使用 gthread worker
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# SERVER_INTERFACE=asgi 時以 uvicorn worker 執行 quiz_system.asgi：
+# 出題、評分等非同步視圖在等待 LLM 時不佔用執行緒，一個 worker 可同時保持多個生成請求；
+# 同步視圖則在每個 worker 的單一執行緒中依序執行
+server_interface = os.getenv('SERVER_INTERFACE', 'wsgi')
+if server_interface == 'asgi':
+    worker_class = 'uvicorn_worker.UvicornWorker'
+
+# LLM 出題與評分可能需要數十秒
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '180'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# 處理一定數量的請求後回收 worker，避免記憶體逐漸增長；jitter 讓 worker 不會同時重啟
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+# 在 master 預先載入 Django，worker 以 fork 共用已載入的程式碼（copy-on-write）
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+# 另外在 master 載入嵌入模型權重，所有 worker 共用同一份記憶體（僅 torch 後端、未使用嵌入伺服器時）
+preload_embedding = os.getenv('GUNICORN_PRELOAD_EMBEDDING', 'False') == 'True'
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+# worker 心跳檔放在記憶體檔案系統，避免容器磁碟 I/O 造成誤判逾時
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# 預先載入時 apps.ready() 在 master 執行；推論預熱改到每個 worker 啟動後進行，
+# 避免 master 在 fork 前初始化 torch 的執行緒池（fork 後的子行程可能因此卡住）
+warm_up_workers = os.getenv('EMBEDDING_WARMUP', 'False') == 'True'
+if preload_app:
+    os.environ['EMBEDDING_WARMUP'] = 'False'
+
+def when_ready(server):
+    """master 已載入程式、尚未建立 worker 時執行"""
+    if not (preload_app and preload_embedding):
+        return
+
+    from django.conf import settings
+
+    if settings.EMBEDDING_SERVER_URL:
+        server.log.info("已設定 EMBEDDING_SERVER_URL，不在 master 預先載入嵌入模型")
+        return
+    if settings.EMBEDDING_BACKEND != 'torch':
+        # ONNX Runtime 建立 session 時即啟動執行緒池，不適合在 fork 前建立
+        server.log.info(f"{settings.EMBEDDING_BACKEND} 後端不支援預先載入，改由各 worker 載入")
+        return
+
+    from quiz.rag_utils import EmbeddingService
+
+    # 只載入權重，不執行推論
+    EmbeddingService()
+    server.log.info("嵌入模型已在 master 載入，worker 以 copy-on-write 共用")
+
+def post_fork(server, worker):
+    if preload_app and warm_up_workers:
+        from quiz.rag_utils import warm_up_query_cache
+
+        threading.Thread(target=warm_up_query_cache, name='embedding-warmup', daemon=True).start()
@@ -4,6 +4,9 @@
 -- 建立 pgvector 擴展
 CREATE EXTENSION IF NOT EXISTS vector;
 
+-- 建立 pg_trgm 擴展（混合檢索的關鍵字比對）
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- 建立索引優化查詢效能
 -- 注意：這些索引會在 Django 遷移後建立
 
@@ -15,7 +15,7 @@ class KnowledgeBaseAdmin(admin.ModelAdmin):
     summary_preview.short_description = '摘要'
     
     def content_length(self, obj):
-        return f"{len(obj.content):,} 字"
+        return f"{obj.content_length:,} 字"
     content_length.short_description = '內容長度'
     
     def chunks_count(self, obj):
@@ -76,12 +76,26 @@ class KnowledgeChunkAdmin(admin.ModelAdmin):
         return "無向量數據"
     embedding_info.short_description = '向量資訊'
 
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    """知識庫建立任務管理"""
+    list_display = ['knowledge_base', 'status', 'stage', 'progress_display', 'created_at', 'finished_at']
+    list_filter = ['status', 'stage', 'created_at']
+    search_fields = ['knowledge_base__name', 'knowledge_base__user__username']
+    readonly_fields = ['created_at', 'started_at', 'embedding_started_at', 'finished_at']
+    
+    def progress_display(self, obj):
+        if obj.total_chunks:
+            return f"{obj.embedded_chunks}/{obj.total_chunks}"
+        return '-'
+    progress_display.short_description = '嵌入進度'
+
 @admin.register(QuizSession)
 class QuizSessionAdmin(admin.ModelAdmin):
     """答題會話管理"""
     list_display = ['user', 'quiz_type_display', 'total_questions', 'current_question', 
                     'score_display', 'status_display', 'created_at']
-    list_filter = ['quiz_type', 'is_completed', 'difficulty', 'created_at']
+    list_filter = ['quiz_type', 'is_completed', 'generation_status', 'difficulty', 'created_at']
     search_fields = ['user__username']
     readonly_fields = ['questions_preview', 'created_at', 'completed_at']
     filter_horizontal = ['knowledge_bases']
@@ -147,7 +161,7 @@ class QuestionAnswerAdmin(admin.ModelAdmin):
     """題目回答管理"""
     list_display = ['session_info', 'question_index', 'question_preview', 
                     'question_type', 'score_display', 'answered_at']
-    list_filter = ['question_type', 'score', 'session__quiz_type', 'answered_at']
+    list_filter = ['question_type', 'grading_status', 'score', 'session__quiz_type', 'answered_at']
     search_fields = ['question_text', 'user_answer', 'session__user__username']
     ordering = ['-answered_at']
     
@@ -160,6 +174,8 @@ class QuestionAnswerAdmin(admin.ModelAdmin):
     question_preview.short_description = '題目內容'
     
     def score_display(self, obj):
+        if obj.score is None:
+            return obj.get_grading_status_display()
         color = 'green' if obj.score == 100 else 'orange' if obj.score >= 60 else 'red'
         return format_html(
             '<span style="color: {}; font-weight: bold;">{}</span>',
@@ -201,6 +217,30 @@ class HistoryQuestionAdmin(admin.ModelAdmin):
         return "無題目資料"
     question_preview_detail.short_description = '完整題目資料'
 
+@admin.register(PooledQuestion)
+class PooledQuestionAdmin(admin.ModelAdmin):
+    """題庫題目管理"""
+    list_display = ['knowledge_base', 'question_type', 'difficulty', 'question_preview', 'times_served', 'created_at']
+    list_filter = ['question_type', 'difficulty', 'knowledge_base']
+    search_fields = ['knowledge_base__name', 'question_hash']
+    readonly_fields = ['created_at']
+    
+    def question_preview(self, obj):
+        text = obj.question_data.get('question_text', '') if obj.question_data else ''
+        return text[:50] + '...' if len(text) > 50 else text
+    question_preview.short_description = '題目預覽'
+
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    """使用者統計管理（由訊號增量更新，可用 rebuild_user_stats 重建）"""
+    list_display = ['user', 'total_sessions', 'completed_sessions', 'avg_score_display', 'knowledge_bases', 'updated_at']
+    search_fields = ['user__username']
+    readonly_fields = ['updated_at']
+    
+    def avg_score_display(self, obj):
+        return f"{obj.avg_score:.1f}"
+    avg_score_display.short_description = '平均分數'
+
 # 自定義管理介面標題
 admin.site.site_header = "智能答題系統 管理後台"
 admin.site.site_title = "智能答題系統"
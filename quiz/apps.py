@@ -0,0 +1,18 @@
+import threading
+from django.apps import AppConfig
+from django.conf import settings
+
+class QuizConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'quiz'
+    verbose_name = '智能答題系統'
+
+    def ready(self):
+        # 註冊 UserStats 增量更新的訊號
+        from . import signals  # noqa: F401
+
+        if settings.EMBEDDING_WARMUP:
+            # 在背景載入模型並預先計算固定查詢向量，不阻塞啟動
+            from .rag_utils import warm_up_query_cache
+
+            threading.Thread(target=warm_up_query_cache, name='embedding-warmup', daemon=True).start()
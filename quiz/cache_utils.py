@@ -0,0 +1,76 @@
+import time
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """執行緒安全的行程內 LRU 快取，支援 TTL 與命中統計"""
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (value, 過期時間或 None)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """寫入快取；ttl 為 None 時使用預設 TTL，為 0 時永不過期"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0,
+            'size': len(self._data),
+        }
+
+_redis_clients = {}
+_redis_lock = threading.Lock()
+
+def get_redis_client(redis_url):
+    """取得共用的 Redis 連線（未設定或無法連線時返回 None）"""
+    if not redis_url:
+        return None
+    with _redis_lock:
+        if redis_url not in _redis_clients:
+            try:
+                import redis
+
+                _redis_clients[redis_url] = redis.Redis.from_url(redis_url)
+            except Exception:
+                _redis_clients[redis_url] = None
+        return _redis_clients[redis_url]
@@ -0,0 +1,181 @@
+import re
+import logging
+from collections import deque
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_DELIMITERS = re.compile(r'[。！？\n]')
+# 長句沒有句號時，優先在逗號、分號等次要標點或空白後切開
+CLAUSE_PATTERN = re.compile(r'[^，,；;、：:\s]+[，,；;、：:\s]*|[，,；;、：:\s]+')
+
+SPECIAL_TOKENS = 2  # [CLS] 與 [SEP]
+MIN_CHUNK_CHARS = 10  # 過濾太短的片段
+
+def iter_sentences(blocks, max_length=5000):
+    """將文字區塊切成句子，跨區塊的句子會接續組合；過長且沒有分隔符號的內容強制切斷"""
+    pending = ''
+    for block in blocks:
+        parts = SENTENCE_DELIMITERS.split(pending + block)
+        pending = parts.pop()
+        yield from parts
+        while len(pending) > max_length:
+            yield pending[:max_length]
+            pending = pending[max_length:]
+    yield pending
+
+def iter_batches(iterable, size):
+    """將迭代器分成固定大小的批次"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def embedding_token_counter(texts):
+    """以嵌入模型的分詞器計算 token 數（不含特殊 token）"""
+    from .rag_utils import get_embedding_service
+
+    return get_embedding_service().count_tokens(texts, add_special_tokens=False)
+
+class SentenceChunker:
+    """依句子組成片段，片段長度以字元數計算（原 split_text 的規則）"""
+    name = 'sentence'
+
+    def __init__(self, chunk_size=500):
+        self.chunk_size = chunk_size
+
+    def iter_chunks(self, blocks):
+        current = []
+        current_length = 0
+
+        for sentence in iter_sentences(blocks):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+
+            if current_length + len(sentence) < self.chunk_size:
+                current.append(sentence + "。")
+                current_length += len(sentence) + 1
+            else:
+                if current:
+                    chunk = ''.join(current).strip()
+                    if len(chunk) > MIN_CHUNK_CHARS:
+                        yield chunk
+                current = [sentence + "。"]
+                current_length = len(sentence) + 1
+
+        if current:
+            chunk = ''.join(current).strip()
+            if len(chunk) > MIN_CHUNK_CHARS:
+                yield chunk
+
+class TokenChunker:
+    """依嵌入模型 token 數組成片段
+
+    每個片段不超過 max_tokens（含特殊 token），相鄰片段以句子為單位重疊約 overlap_tokens；
+    超過預算的長句先依次要標點切開，仍過長時依 token 比例切斷
+    """
+    name = 'token'
+
+    def __init__(self, max_tokens=384, overlap_tokens=48, count_tokens=None):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens 必須小於 max_tokens")
+        self.budget = max_tokens - SPECIAL_TOKENS
+        self.overlap_tokens = overlap_tokens
+        # 單一單位（句子或長句切出的段落）的上限，確保加上重疊部分後仍放得進片段
+        self.unit_budget = self.budget - overlap_tokens
+        self.count_tokens = count_tokens or embedding_token_counter
+
+    def iter_units(self, blocks):
+        """將句子串流轉為 (文字, token 數)，並確保每個單位都不超過單位上限"""
+        sentences = (s.strip() + "。" for s in iter_sentences(blocks) if s.strip())
+        for batch in iter_batches(sentences, 256):
+            for text, tokens in zip(batch, self.count_tokens(batch)):
+                if tokens <= self.unit_budget:
+                    yield text, tokens
+                else:
+                    yield from self.split_long(text)
+
+    def split_long(self, text):
+        """切開超過預算的長句"""
+        clauses = CLAUSE_PATTERN.findall(text)
+        if len(clauses) <= 1:
+            yield from self.split_by_tokens(text, self.count_tokens([text])[0])
+            return
+
+        for clause, tokens in zip(clauses, self.count_tokens(clauses)):
+            if tokens <= self.unit_budget:
+                yield clause, tokens
+            else:
+                yield from self.split_by_tokens(clause, tokens)
+
+    def split_by_tokens(self, text, tokens):
+        """依 token 與字元的比例估算切點，切出的片段再以實際 token 數確認"""
+        size = max(1, len(text) * self.unit_budget // max(tokens, 1))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        for piece, piece_tokens in zip(pieces, self.count_tokens(pieces)):
+            if piece_tokens > self.unit_budget and len(piece) > 1:
+                yield from self.split_by_tokens(piece, piece_tokens)
+            else:
+                yield piece, piece_tokens
+
+    def iter_chunks(self, blocks):
+        window = deque()
+        window_tokens = 0
+        has_new = False  # 視窗中是否有尚未輸出的內容（不只是重疊部分）
+
+        for text, tokens in self.iter_units(blocks):
+            if has_new and window_tokens + tokens > self.budget:
+                chunk = ''.join(t for t, _ in window).strip()
+                if len(chunk) > MIN_CHUNK_CHARS:
+                    yield chunk
+
+                # 保留尾端不超過 overlap_tokens 的單位作為下一個片段的開頭
+                overlap = deque()
+                overlap_tokens = 0
+                for unit in reversed(window):
+                    if overlap_tokens + unit[1] > self.overlap_tokens:
+                        if not overlap:
+                            # 最後一個單位就超過重疊量時，改取其尾端的部分文字
+                            tail = unit[0][-max(1, len(unit[0]) * self.overlap_tokens // max(unit[1], 1)):]
+                            overlap_tokens = self.count_tokens([tail])[0]
+                            overlap.append((tail, overlap_tokens))
+                        break
+                    overlap.appendleft(unit)
+                    overlap_tokens += unit[1]
+                window, window_tokens, has_new = overlap, overlap_tokens, False
+
+            # 重疊部分加上新單位仍超過預算時，從開頭捨棄
+            while window and window_tokens + tokens > self.budget:
+                window_tokens -= window.popleft()[1]
+
+            window.append((text, tokens))
+            window_tokens += tokens
+            has_new = True
+
+        if has_new:
+            chunk = ''.join(t for t, _ in window).strip()
+            if len(chunk) > MIN_CHUNK_CHARS:
+                yield chunk
+
+CHUNKERS = {
+    SentenceChunker.name: SentenceChunker,
+    TokenChunker.name: TokenChunker,
+}
+
+def get_chunker(name=None, **options):
+    """依名稱建立切分器，未指定的參數使用 settings 中的設定"""
+    name = name or settings.CHUNKER
+    if name not in CHUNKERS:
+        raise ValueError(f"不支援的切分策略: {name}（可用：{', '.join(CHUNKERS)}）")
+
+    if name == TokenChunker.name:
+        options.setdefault('max_tokens', settings.CHUNK_MAX_TOKENS)
+        options.setdefault('overlap_tokens', settings.CHUNK_OVERLAP_TOKENS)
+    else:
+        options.setdefault('chunk_size', settings.CHUNK_SIZE)
+    return CHUNKERS[name](**options)
@@ -0,0 +1,86 @@
+import os
+import logging
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+class TorchBackend:
+    """以 PyTorch 執行 HuggingFace 模型（模型自帶的 encode：mean pooling）"""
+    name = 'torch'
+
+    def __init__(self, model_name=None, dtype=None):
+        import torch
+        from transformers import AutoModel
+
+        self.torch = torch
+        self.model = AutoModel.from_pretrained(
+            model_name or settings.EMBEDDING_MODEL,
+            trust_remote_code=True,
+            # 沒有 AMX 的 CPU 上 bfloat16 通常比 float32 慢，可由 EMBEDDING_TORCH_DTYPE 調整
+            torch_dtype=getattr(torch, dtype or settings.EMBEDDING_TORCH_DTYPE)
+        )
+
+    def encode(self, texts):
+        with self.torch.no_grad():
+            # 由呼叫端控制批次大小，避免模型內部再次切分
+            embeddings = self.model.encode(texts, batch_size=len(texts))
+
+        if self.torch.is_tensor(embeddings):
+            embeddings = embeddings.float().cpu().numpy()
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+
+class OnnxBackend:
+    """以 ONNX Runtime 在 CPU 上執行匯出的模型（可為動態 int8 量化版本）"""
+    name = 'onnx'
+
+    def __init__(self, model_path=None, model_name=None, threads=None, max_length=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("EMBEDDING_BACKEND=onnx 需要安裝 onnxruntime")
+        from transformers import AutoTokenizer
+
+        model_path = model_path or settings.EMBEDDING_ONNX_PATH
+        if not os.path.exists(model_path):
+            raise RuntimeError(f"找不到 ONNX 模型 {model_path}，請先執行 python manage.py export_onnx_embedding")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = settings.EMBEDDING_ONNX_THREADS if threads is None else threads
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name or settings.EMBEDDING_MODEL)
+        self.max_length = max_length or settings.EMBEDDING_MAX_LENGTH
+
+    def encode(self, texts):
+        encoded = self.tokenizer(list(texts), padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors='np')
+        inputs = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+        hidden = self.session.run(None, inputs)[0]
+
+        # 與模型的 encode 相同：依 attention mask 做 mean pooling
+        mask = encoded['attention_mask'][..., None].astype(np.float32)
+        return ((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)).astype(np.float32)
+
+EMBEDDING_BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+def get_embedding_backend(name=None, **options):
+    """依名稱建立推論後端（預設取自 EMBEDDING_BACKEND）"""
+    name = name or settings.EMBEDDING_BACKEND
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"不支援的嵌入推論後端: {name}（可用：{', '.join(EMBEDDING_BACKENDS)}）")
+    return EMBEDDING_BACKENDS[name](**options)
+
+def cosine_similarities(a, b):
+    """兩組向量逐列的餘弦相似度"""
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return (a * b).sum(axis=1) / np.where(norms == 0, 1, norms)
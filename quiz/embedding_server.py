@@ -0,0 +1,316 @@
+import os
+import json
+import time
+import queue
+import base64
+import socket
+import logging
+import socketserver
+import threading
+import http.client
+import numpy as np
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSIONS = 768
+
+def encode_array(vectors):
+    """float32 二維數組序列化為 JSON 可傳輸的格式（base64 比逐一列出浮點數小且快）"""
+    vectors = np.ascontiguousarray(vectors, dtype='<f4')
+    return {'shape': list(vectors.shape), 'data': base64.b64encode(vectors.tobytes()).decode('ascii')}
+
+def decode_array(payload):
+    return np.frombuffer(base64.b64decode(payload['data']), dtype='<f4').reshape(payload['shape'])
+
+class DynamicBatcher:
+    """動態批次：收集同時到達的請求合併為一次模型呼叫
+
+    第一個請求到達後最多等待 max_wait 秒，或累積到 max_batch 筆文本就送出
+    """
+
+    def __init__(self, encode_fn, max_batch=64, max_wait=0.01):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        """加入待編碼文本，返回 Future（結果為二維數組）"""
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future
+
+    def encode(self, texts, timeout=None):
+        return self.submit(texts).result(timeout=timeout)
+
+    def _collect(self):
+        pending = [self._queue.get()]
+        count = len(pending[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(item)
+            count += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            texts = [text for item_texts, _ in pending for text in item_texts]
+            try:
+                vectors = self.encode_fn(texts)
+            except Exception as e:
+                logger.error(f"嵌入伺服器批次編碼失敗: {e}")
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, future in pending:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+            with self._lock:
+                self.requests += len(pending)
+                self.batches += 1
+                self.texts += len(texts)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'batches': self.batches,
+                'texts': self.texts,
+                'avg_batch_size': round(self.texts / self.batches, 2) if self.batches else 0,
+                'queued': self._queue.qsize(),
+            }
+
+class EmbeddingRequestHandler(BaseHTTPRequestHandler):
+    """嵌入伺服器的 HTTP 介面：POST /encode、POST /tokens、GET /health"""
+    protocol_version = 'HTTP/1.1'  # 保持連線，客戶端可重複使用
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self.send_json(404, {'error': 'not found'})
+        self.send_json(200, {
+            'status': 'ok',
+            'model': settings.EMBEDDING_MODEL,
+            'model_loaded': self.server.service.is_available(),
+            **self.server.batcher.stats(),
+        })
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            texts = body['texts']
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError('texts 必須是字串列表')
+        except (ValueError, KeyError) as e:
+            return self.send_json(400, {'error': str(e)})
+
+        if self.path == '/encode':
+            try:
+                vectors = self.server.batcher.encode(texts, timeout=settings.EMBEDDING_SERVER_TIMEOUT)
+            except Exception as e:
+                return self.send_json(500, {'error': str(e)})
+            return self.send_json(200, encode_array(vectors))
+        if self.path == '/tokens':
+            with self.server.tokenizer_lock:
+                counts = self.server.service.count_tokens(texts, add_special_tokens=body.get('add_special_tokens', True))
+            return self.send_json(200, {'counts': counts})
+        self.send_json(404, {'error': 'not found'})
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket 的 client_address 為空字串
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+class EmbeddingHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, batcher, tokenizer_lock):
+        self.service = service
+        self.batcher = batcher
+        # 分詞器不可同時被多個執行緒使用
+        self.tokenizer_lock = tokenizer_lock
+        super().__init__(address, EmbeddingRequestHandler)
+
+class UnixEmbeddingHTTPServer(EmbeddingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer.server_bind 假設位址為 (host, port)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+def create_server(url, service, max_batch=None, max_wait_ms=None):
+    """依網址建立嵌入伺服器（http://host:port 或 unix:///path/to.sock）"""
+    max_batch = max_batch or settings.EMBEDDING_SERVER_MAX_BATCH
+    max_wait_ms = settings.EMBEDDING_SERVER_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+    tokenizer_lock = threading.Lock()
+
+    def encode(texts):
+        with tokenizer_lock:
+            return service.encode_batch(texts, log_stats=False)
+
+    batcher = DynamicBatcher(encode, max_batch=max_batch, max_wait=max_wait_ms / 1000)
+
+    parts = urlsplit(url)
+    if parts.scheme == 'unix':
+        return UnixEmbeddingHTTPServer(parts.path, service, batcher, tokenizer_lock)
+    if parts.scheme == 'http':
+        return EmbeddingHTTPServer((parts.hostname or '127.0.0.1', parts.port or 80), service, batcher, tokenizer_lock)
+    raise ValueError(f"不支援的嵌入伺服器網址: {url}")
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """經由 Unix socket 連線的 HTTPConnection"""
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class RemoteEmbeddingService:
+    """嵌入伺服器的客戶端，介面與 EmbeddingService 相同
+
+    每個執行緒保持一條連線；伺服器無法連線時與模型未載入相同，返回零向量
+    """
+
+    def __init__(self, url, timeout=None):
+        self.url = url
+        self.timeout = timeout or settings.EMBEDDING_SERVER_TIMEOUT
+        self._local = threading.local()
+
+    def _connect(self):
+        parts = urlsplit(self.url)
+        if parts.scheme == 'unix':
+            return UnixHTTPConnection(parts.path, timeout=self.timeout)
+        return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=self.timeout)
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        for attempt in range(2):
+            connection = getattr(self._local, 'connection', None) or self._connect()
+            self._local.connection = connection
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = json.loads(response.read())
+            except TimeoutError:
+                connection.close()
+                self._local.connection = None
+                raise
+            except (http.client.HTTPException, OSError):
+                # 閒置連線被伺服器關閉時重新連線一次
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+                continue
+            if response.status != 200:
+                raise RuntimeError(f"嵌入伺服器錯誤 {response.status}: {data.get('error')}")
+            return data
+
+    def _zeros(self, count):
+        return np.zeros((count, EMBEDDING_DIMENSIONS), dtype=np.float32)
+
+    def is_available(self):
+        try:
+            return bool(self._request('GET', '/health').get('model_loaded'))
+        except Exception as e:
+            logger.warning(f"無法連線嵌入伺服器 {self.url}: {e}")
+            return False
+
+    def _encode(self, texts):
+        try:
+            return decode_array(self._request('POST', '/encode', {'texts': list(texts)}))
+        except Exception as e:
+            logger.error(f"嵌入伺服器編碼失敗: {e}")
+            return self._zeros(len(texts))
+
+    def encode(self, texts):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        embeddings = self._encode(texts)
+        return embeddings[0] if single or len(texts) == 1 else embeddings
+
+    def encode_query(self, text):
+        """查詢文本轉向量（經過查詢向量快取）"""
+        from .rag_utils import TYPE_QUERIES, get_embedding_cache
+
+        cache = get_embedding_cache()
+        vector = cache.get(text)
+        if vector is not None:
+            return vector
+
+        vector = self.encode(text)
+        if vector.any():
+            cache.set(text, vector, pin=text in TYPE_QUERIES.values())
+        return vector
+
+    def count_tokens(self, texts, add_special_tokens=True):
+        try:
+            return self._request('POST', '/tokens', {
+                'texts': list(texts), 'add_special_tokens': add_special_tokens
+            })['counts']
+        except Exception as e:
+            logger.warning(f"嵌入伺服器計算 token 長度失敗，改用字元長度: {e}")
+            return [len(text) for text in texts]
+
+    def encode_batch(self, texts, batch_size=None, progress_callback=None, log_stats=True):
+        """分段送出，伺服器端依 token 長度分桶並與其他請求合併"""
+        if not texts:
+            return self._zeros(0)
+
+        step = settings.EMBEDDING_SERVER_MAX_BATCH
+        embeddings = self._zeros(len(texts))
+        for start in range(0, len(texts), step):
+            embeddings[start:start + step] = self._encode(texts[start:start + step])
+            if progress_callback:
+                progress_callback(min(start + step, len(texts)), len(texts))
+        return embeddings
+
+_remote_services = {}
+_remote_lock = threading.Lock()
+
+def get_remote_embedding_service(url):
+    """取得指定嵌入伺服器共用的客戶端"""
+    with _remote_lock:
+        if url not in _remote_services:
+            _remote_services[url] = RemoteEmbeddingService(url)
+        return _remote_services[url]
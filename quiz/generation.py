@@ -0,0 +1,234 @@
+import queue
+import asyncio
+import logging
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from .utils import iter_questions, aiter_questions
+from .rag_utils import generate_content_hash
+
+logger = logging.getLogger(__name__)
+
+# 所有模型共用的生成執行緒池，實際並行數由各模型的 semaphore 控制
+_executor = None
+_executor_lock = threading.Lock()
+
+# (model_type, base_url, model_id) -> BoundedSemaphore
+_model_semaphores = {}
+_semaphore_lock = threading.Lock()
+
+# 非同步生成使用的 asyncio.Semaphore 綁定事件迴圈：事件迴圈 -> {模型鍵: Semaphore}
+_async_semaphores = weakref.WeakKeyDictionary()
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.LLM_GENERATION_WORKERS,
+                thread_name_prefix='quiz-llm'
+            )
+    return _executor
+
+def get_model_concurrency(model):
+    """單一模型允許同時進行的請求數"""
+    return max(1, settings.LLM_MAX_CONCURRENCY.get(model.model_type, 1))
+
+def get_model_semaphore(model):
+    """取得模型後端共用的並行上限（同一 Ollama 服務上的同一模型共用）"""
+    key = (model.model_type, model.base_url or '', model.model_id)
+    with _semaphore_lock:
+        if key not in _model_semaphores:
+            _model_semaphores[key] = threading.BoundedSemaphore(get_model_concurrency(model))
+        return _model_semaphores[key]
+
+def get_async_model_semaphore(model):
+    """取得目前事件迴圈中模型後端的並行上限（ASGI worker 內的所有請求共用）"""
+    key = (model.model_type, model.base_url or '', model.model_id)
+    loop = asyncio.get_running_loop()
+    with _semaphore_lock:
+        semaphores = _async_semaphores.setdefault(loop, {})
+        if key not in semaphores:
+            semaphores[key] = asyncio.Semaphore(get_model_concurrency(model))
+        return semaphores[key]
+
+def split_batches(total, batch_size=10):
+    """將題數切成多個批次，例如 25 -> [10, 10, 5]"""
+    return [min(batch_size, total - start) for start in range(0, total, batch_size)]
+
+def _run_batch(model, prompt, batch_size, results):
+    """在工作執行緒中串流生成一個批次，逐題放入結果佇列"""
+    count = 0
+    try:
+        with get_model_semaphore(model):
+            for question in iter_questions(model.generate_content_stream(prompt)):
+                results.put(('question', question))
+                count += 1
+                if count >= batch_size:
+                    break
+        results.put(('done', count))
+    except Exception as e:
+        results.put(('error', e))
+
+async def _arun_batch(model, prompt, batch_size, results):
+    """_run_batch 的非同步版本，等待模型輸出時不佔用執行緒"""
+    count = 0
+    try:
+        async with get_async_model_semaphore(model):
+            async for question in aiter_questions(model.agenerate_content_stream(prompt)):
+                await results.put(('question', question))
+                count += 1
+                if count >= batch_size:
+                    break
+        await results.put(('done', count))
+    except Exception as e:
+        await results.put(('error', e))
+
+def progress_event(round_index, batches, finished, questions, error=None):
+    """生成進度（on_progress 回呼的參數）"""
+    progress = {
+        'round': round_index + 1,
+        'batches_total': len(batches),
+        'batches_done': finished,
+        'questions': len(questions),
+    }
+    if error is not None:
+        progress['error'] = str(error)
+    return progress
+
+def generate_questions_parallel(model, total, build_prompt, on_question=None,
+                                batch_size=10, max_rounds=3, on_progress=None, exclude_hashes=None):
+    """並行生成題目
+
+    將 total 切成多個批次同時送出，以題目內容雜湊去除批次間的重複；
+    不足的題數會以已生成的題目作為歷史，再補生成最多 max_rounds 輪。
+    build_prompt(批次題數, 歷史題目) 返回提示詞；on_question(題目, 目前題數) 在主執行緒呼叫；
+    on_progress(進度) 在每輪開始與每個批次結束時呼叫；
+    exclude_hashes 為已取得題目（例如題庫抽出的題目）的內容雜湊，生成結果中相同的題目會被略過
+    """
+    questions = []
+    seen_hashes = set(exclude_hashes or ())
+    last_error = None
+
+    for round_index in range(max_rounds):
+        shortfall = total - len(questions)
+        if shortfall <= 0:
+            break
+
+        history = [{
+            'question_text': q['question_text'],
+            'question_type': q['question_type']
+        } for q in questions[-20:]]
+        batches = split_batches(shortfall, batch_size)
+        logger.info(f"第 {round_index + 1} 輪：並行生成 {len(batches)} 個批次，共 {shortfall} 題"
+                    f"（並行上限 {get_model_concurrency(model)}）")
+
+        results = queue.Queue()
+        for size in batches:
+            get_executor().submit(_run_batch, model, build_prompt(size, history), size, results)
+
+        # 在主執行緒彙整結果，資料庫操作都留在呼叫端的執行緒
+        finished = 0
+        if on_progress:
+            on_progress(progress_event(round_index, batches, finished, questions))
+        while finished < len(batches):
+            kind, payload = results.get()
+            if kind == 'question':
+                question_hash = generate_content_hash(payload['question_text'])
+                if question_hash in seen_hashes or len(questions) >= total:
+                    continue
+                seen_hashes.add(question_hash)
+                questions.append(payload)
+                if on_question:
+                    on_question(payload, len(questions))
+            elif kind == 'done':
+                finished += 1
+                logger.info(f"批次完成：{payload} 題，目前共 {len(questions)} 題")
+                if on_progress:
+                    on_progress(progress_event(round_index, batches, finished, questions))
+            else:
+                finished += 1
+                last_error = payload
+                logger.warning(f"批次生成失敗：{payload}")
+                if on_progress:
+                    on_progress(progress_event(round_index, batches, finished, questions, error=payload))
+
+    if not questions:
+        raise Exception(f"使用模型 {model.name} 生成題目失敗: {last_error or '無法生成有效題目'}")
+
+    if len(questions) < total:
+        logger.warning(f"模型 {model.name} 僅生成 {len(questions)}/{total} 題")
+
+    return questions[:total]
+
+async def _acall(callback, *args):
+    """呼叫一般函式或協程函式的回呼"""
+    result = callback(*args)
+    if asyncio.iscoroutine(result):
+        await result
+
+async def agenerate_questions_parallel(model, total, build_prompt, on_question=None,
+                                       batch_size=10, max_rounds=3, on_progress=None, exclude_hashes=None):
+    """generate_questions_parallel 的非同步版本
+
+    各批次為同一事件迴圈中的協程，不需要生成執行緒池；回呼可為一般函式或協程函式
+    """
+    questions = []
+    seen_hashes = set(exclude_hashes or ())
+    last_error = None
+
+    for round_index in range(max_rounds):
+        shortfall = total - len(questions)
+        if shortfall <= 0:
+            break
+
+        history = [{
+            'question_text': q['question_text'],
+            'question_type': q['question_type']
+        } for q in questions[-20:]]
+        batches = split_batches(shortfall, batch_size)
+        logger.info(f"第 {round_index + 1} 輪：非同步生成 {len(batches)} 個批次，共 {shortfall} 題"
+                    f"（並行上限 {get_model_concurrency(model)}）")
+
+        results = asyncio.Queue()
+        tasks = [asyncio.create_task(_arun_batch(model, build_prompt(size, history), size, results))
+                 for size in batches]
+
+        try:
+            finished = 0
+            if on_progress:
+                await _acall(on_progress, progress_event(round_index, batches, finished, questions))
+            while finished < len(batches):
+                kind, payload = await results.get()
+                if kind == 'question':
+                    question_hash = generate_content_hash(payload['question_text'])
+                    if question_hash in seen_hashes or len(questions) >= total:
+                        continue
+                    seen_hashes.add(question_hash)
+                    questions.append(payload)
+                    if on_question:
+                        await _acall(on_question, payload, len(questions))
+                elif kind == 'done':
+                    finished += 1
+                    logger.info(f"批次完成：{payload} 題，目前共 {len(questions)} 題")
+                    if on_progress:
+                        await _acall(on_progress, progress_event(round_index, batches, finished, questions))
+                else:
+                    finished += 1
+                    last_error = payload
+                    logger.warning(f"批次生成失敗：{payload}")
+                    if on_progress:
+                        await _acall(on_progress, progress_event(round_index, batches, finished, questions, error=payload))
+        finally:
+            # 請求被取消（例如使用者關閉頁面）時一併取消尚在生成的批次
+            for task in tasks:
+                task.cancel()
+
+    if not questions:
+        raise Exception(f"使用模型 {model.name} 生成題目失敗: {last_error or '無法生成有效題目'}")
+
+    if len(questions) < total:
+        logger.warning(f"模型 {model.name} 僅生成 {len(questions)}/{total} 題")
+
+    return questions[:total]
@@ -0,0 +1,84 @@
+import json
+import time
+import asyncio
+from django.conf import settings
+from django.db.models import F, Func, IntegerField
+from .models import QuizSession
+
+def session_state(session_id):
+    """查詢會話的生成狀態（題數由資料庫計算，不讀取整份題目資料）"""
+    return QuizSession.objects.filter(id=session_id).annotate(
+        question_count=Func(F('questions_data'), function='jsonb_array_length', output_field=IntegerField())
+    ).values('generation_status', 'generation_progress', 'generation_error', 'total_questions', 'question_count')
+
+def format_event(event, data):
+    """SSE 訊息格式"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+class GenerationEventTracker:
+    """比較前後兩次查詢的會話狀態，產生需推送的 SSE 事件
+
+    progress：批次進度變化；question：已生成題數增加；error / done：生成結束
+    """
+
+    def __init__(self):
+        self.progress = None
+        self.questions = None
+        self.finished = False
+
+    def update(self, state):
+        if state is None:
+            self.finished = True
+            return [format_event('error', {'error': '答題會話不存在'})]
+
+        events = []
+        status, count, total = state['generation_status'], state['question_count'] or 0, state['total_questions']
+        if state['generation_progress'] != self.progress:
+            self.progress = state['generation_progress']
+            events.append(format_event('progress', {**self.progress, 'status': status, 'questions': count, 'total': total}))
+        if count != self.questions:
+            self.questions = count
+            events.append(format_event('question', {'questions': count, 'total': total}))
+
+        if status == 'failed':
+            events.append(format_event('error', {'error': state['generation_error'], 'questions': count}))
+            self.finished = True
+        elif status == 'completed':
+            events.append(format_event('done', {'questions': count, 'total': total}))
+            self.finished = True
+        return events
+
+def generation_event_stream(session_id):
+    """同步 SSE 串流（WSGI，每條連線佔用一個執行緒）"""
+    tracker = GenerationEventTracker()
+    yield "retry: 3000\n\n"
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < settings.QUIZ_EVENTS_TIMEOUT:
+        events = tracker.update(session_state(session_id).first())
+        if events:
+            yield ''.join(events)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= settings.QUIZ_EVENTS_KEEPALIVE:
+            # 註解行作為心跳，避免代理伺服器關閉閒置連線
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        if tracker.finished:
+            return
+        time.sleep(settings.QUIZ_EVENTS_POLL_INTERVAL)
+
+async def ageneration_event_stream(session_id):
+    """非同步 SSE 串流（ASGI，等待期間不佔用執行緒）"""
+    tracker = GenerationEventTracker()
+    yield "retry: 3000\n\n"
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < settings.QUIZ_EVENTS_TIMEOUT:
+        events = tracker.update(await session_state(session_id).afirst())
+        if events:
+            yield ''.join(events)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= settings.QUIZ_EVENTS_KEEPALIVE:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        if tracker.finished:
+            return
+        await asyncio.sleep(settings.QUIZ_EVENTS_POLL_INTERVAL)
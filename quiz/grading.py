@@ -0,0 +1,108 @@
+import time
+import logging
+from django.conf import settings
+from django.db.models import Avg
+from .models import QuestionAnswer
+
+logger = logging.getLogger(__name__)
+
+def compute_session_score(session):
+    """計算會話總分（評分失敗的答案不計入）
+
+    仍有評分中的答案，或沒有任何評分成功的答案（例如主觀題全部評分失敗）時返回 None，
+    避免把評分失敗記成 0 分寫入歷史與使用者統計
+    """
+    answers = session.answers.all()
+    if answers.filter(grading_status='pending').exists():
+        return None
+    avg_score = answers.filter(grading_status='graded').aggregate(avg_score=Avg('score'))['avg_score']
+    if avg_score is None:
+        return None
+    return round(avg_score, 1)
+
+def refresh_session_score(session):
+    """已完成的會話在所有評分結束後補上總分"""
+    if session.is_completed and session.score is None:
+        score = compute_session_score(session)
+        if score is not None:
+            session.score = score
+            session.save(update_fields=['score'])
+    return session.score
+
+def grade_with_retries(answer):
+    """以 LLM 評分一筆主觀題答案（不寫入資料庫），失敗時重試並標記為評分失敗，返回實際呼叫次數"""
+    from .utils import grade_subjective_answer
+
+    question = answer.session.questions_data[answer.question_index]
+
+    for attempt in range(settings.GRADING_MAX_RETRIES):
+        try:
+            answer.score = grade_subjective_answer(question, answer.user_answer)
+            answer.grading_status = 'graded'
+            return attempt + 1
+        except Exception as e:
+            logger.warning(f"答案 {answer.id} 第 {attempt + 1} 次評分失敗: {e}")
+            # 最後一次失敗後直接標記，不再等待
+            if attempt < settings.GRADING_MAX_RETRIES - 1:
+                time.sleep(2 ** attempt)
+
+    answer.grading_status = 'failed'
+    return settings.GRADING_MAX_RETRIES
+
+def grade_pending_answer(answer):
+    """評分一筆待評分的主觀題答案並更新會話總分"""
+    grade_with_retries(answer)
+    answer.save(update_fields=['score', 'grading_status'])
+
+    # 重新讀取會話，避免覆蓋答題流程剛寫入的完成狀態
+    session = answer.session
+    session.refresh_from_db()
+    refresh_session_score(session)
+    return answer.score
+
+def grade_session_answers(session, batch_size=None):
+    """批次評分會話中所有待評分的主觀題，返回評分統計
+
+    每批次以單次 LLM 呼叫評分多題，批次失敗或個別題目解析失敗時改以單題評分補救
+    """
+    from .utils import grade_subjective_answers_batch
+
+    batch_size = batch_size or settings.GRADING_BATCH_SIZE
+    pending = list(session.answers.filter(grading_status='pending').order_by('question_index'))
+    stats = {'answers': len(pending), 'batch_calls': 0, 'fallback_answers': 0, 'fallback_calls': 0, 'saved_calls': 0}
+
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        items = [(session.questions_data[a.question_index], a.user_answer) for a in batch]
+
+        try:
+            stats['batch_calls'] += 1
+            scores = grade_subjective_answers_batch(items)
+        except Exception as e:
+            logger.warning(f"會話 {session.id} 批次評分失敗，改為逐題評分: {e}")
+            scores = [None] * len(batch)
+
+        graded = []
+        for answer, score in zip(batch, scores):
+            if score is None:
+                continue
+            answer.score = score
+            answer.grading_status = 'graded'
+            graded.append(answer)
+        QuestionAnswer.objects.bulk_update(graded, ['score', 'grading_status'])
+
+        for answer in batch:
+            if answer.grading_status == 'pending':
+                stats['fallback_answers'] += 1
+                stats['fallback_calls'] += grade_with_retries(answer)
+                answer.save(update_fields=['score', 'grading_status'])
+
+    # 相較逐題評分（每題一次呼叫）節省的 LLM 呼叫次數，單題補救的重試也計入
+    stats['saved_calls'] = stats['answers'] - stats['batch_calls'] - stats['fallback_calls']
+    logger.info(f"會話 {session.id} 批次評分 {stats['answers']} 題："
+                f"{stats['batch_calls']} 次批次呼叫、{stats['fallback_answers']} 題單題補救"
+                f"（{stats['fallback_calls']} 次呼叫），節省 {stats['saved_calls']} 次 LLM 呼叫")
+
+    session.refresh_from_db()
+    refresh_session_score(session)
+    return stats
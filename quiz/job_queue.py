@@ -0,0 +1,135 @@
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# 已註冊的背景任務：名稱 -> 函數
+TASKS = {}
+
+def task(name):
+    """註冊背景任務的裝飾器"""
+    def decorator(func):
+        TASKS[name] = func
+        func.task_name = name
+        return func
+    return decorator
+
+def run_task(name, kwargs):
+    """在目前的行程中執行一個已註冊的任務"""
+    # 確保任務模組已載入並完成註冊
+    from . import tasks  # noqa: F401
+
+    func = TASKS.get(name)
+    if func is None:
+        logger.error(f"未知的背景任務: {name}")
+        return None
+
+    close_old_connections()
+    try:
+        return func(**kwargs)
+    except Exception as e:
+        logger.exception(f"背景任務 {name} 執行失敗: {e}")
+        return None
+    finally:
+        close_old_connections()
+
+class LocalJobQueue:
+    """行程內的任務佇列（開發與測試用的替代方案）"""
+
+    def __init__(self, max_workers=2, eager=False):
+        self.eager = eager
+        self._executor = None
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+
+    def enqueue(self, name, **kwargs):
+        job_id = uuid.uuid4().hex
+        if self.eager:
+            # 測試時同步執行，方便斷言結果
+            run_task(name, kwargs)
+            return job_id
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers,
+                    thread_name_prefix='quiz-job'
+                )
+        self._executor.submit(run_task, name, kwargs)
+        return job_id
+
+class RedisJobQueue:
+    """以 Redis list 作為 broker 的任務佇列"""
+
+    def __init__(self, redis_url, queue_name):
+        import redis
+
+        self.redis = redis.Redis.from_url(redis_url)
+        self.queue_name = queue_name
+
+    def enqueue(self, name, **kwargs):
+        job_id = uuid.uuid4().hex
+        message = json.dumps({
+            'id': job_id,
+            'task': name,
+            'kwargs': kwargs,
+            'enqueued_at': time.time(),
+        }, ensure_ascii=False)
+        self.redis.lpush(self.queue_name, message)
+        return job_id
+
+    def dequeue(self, timeout=5):
+        """阻塞取出下一個任務，逾時返回 None"""
+        item = self.redis.brpop(self.queue_name, timeout=timeout)
+        if item is None:
+            return None
+        return json.loads(item[1])
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """依設定取得任務佇列（redis 或 local）"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                if settings.JOB_QUEUE_BACKEND == 'redis':
+                    _queue = RedisJobQueue(settings.REDIS_URL, settings.JOB_QUEUE_NAME)
+                else:
+                    _queue = LocalJobQueue(
+                        max_workers=settings.JOB_QUEUE_LOCAL_WORKERS,
+                        eager=settings.JOB_QUEUE_EAGER
+                    )
+    return _queue
+
+def enqueue(name, **kwargs):
+    """將任務排入佇列"""
+    return get_job_queue().enqueue(name, **kwargs)
+
+def run_worker(poll_timeout=5, max_jobs=None):
+    """Worker 主迴圈：從 Redis 取出任務並執行"""
+    queue = get_job_queue()
+    if not isinstance(queue, RedisJobQueue):
+        raise RuntimeError("JOB_QUEUE_BACKEND 不是 redis，任務會在 Web 行程內執行，不需要獨立 worker")
+
+    processed = 0
+    logger.info(f"Worker 啟動，監聽佇列 {queue.queue_name}")
+    while max_jobs is None or processed < max_jobs:
+        message = queue.dequeue(timeout=poll_timeout)
+        if message is None:
+            continue
+
+        start_time = time.perf_counter()
+        logger.info(f"開始執行任務 {message['task']} ({message['id']})")
+        run_task(message['task'], message.get('kwargs', {}))
+        logger.info(f"任務 {message['task']} ({message['id']}) 完成，耗時 {time.perf_counter() - start_time:.1f}s")
+        processed += 1
+
+    return processed
@@ -0,0 +1,211 @@
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .cache_utils import LRUCache, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'quiz:llm:stats'
+
+def normalize_prompt(prompt):
+    """正規化提示詞：合併空白，避免縮排或換行差異造成快取未命中"""
+    return re.sub(r'\s+', ' ', prompt).strip()
+
+class LLMResponseCache:
+    """LLM 回應快取：完全相同提示詞（行程內 LRU + 可選 Redis）與可選的語意相似層
+
+    以「模型 + 溫度 + 正規化提示詞」為鍵，並依呼叫位置（site）統計命中率
+    """
+
+    def __init__(self, max_size=512, ttl=86400, redis_url=None,
+                 semantic_threshold=None, semantic_size=256):
+        self.ttl = ttl
+        self.local = LRUCache(max_size=max_size, ttl=ttl)
+        self.redis = get_redis_client(redis_url)
+        self.semantic_threshold = semantic_threshold
+        self.semantic_size = semantic_size
+        self._semantic = OrderedDict()  # key -> (命名空間, 正規化向量)
+        # 提示詞向量另外快取，不佔用（也不逐出）檢索用的查詢向量快取
+        self._prompt_vectors = LRUCache(max_size=semantic_size, ttl=ttl)
+        self._counters = defaultdict(lambda: {'hits': 0, 'semantic_hits': 0, 'misses': 0})
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def namespace(model, temperature):
+        return f"{model}:{temperature}"
+
+    def make_key(self, prompt, model, temperature):
+        raw = f"{self.namespace(model, temperature)}\n{normalize_prompt(prompt)}"
+        return f"quiz:llm:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    def get(self, site, prompt, model, temperature):
+        key = self.make_key(prompt, model, temperature)
+        response = self._get_exact(key)
+        if response is not None:
+            self._record(site, 'hits')
+            return response
+
+        if self.semantic_threshold:
+            similar_key = self._find_similar(prompt, model, temperature)
+            response = self._get_exact(similar_key) if similar_key else None
+            if response is not None:
+                self._record(site, 'semantic_hits')
+                return response
+
+        self._record(site, 'misses')
+        return None
+
+    def set(self, site, prompt, model, temperature, response):
+        key = self.make_key(prompt, model, temperature)
+        self.local.set(key, response)
+        if self.redis is not None:
+            try:
+                self.redis.setex(key, self.ttl, response.encode('utf-8'))
+            except Exception as e:
+                logger.warning(f"寫入 Redis 回應快取失敗: {e}")
+
+        if self.semantic_threshold:
+            vector = self._embed(prompt, key)
+            if vector is not None:
+                with self._lock:
+                    self._semantic[key] = (self.namespace(model, temperature), vector)
+                    while len(self._semantic) > self.semantic_size:
+                        self._semantic.popitem(last=False)
+
+    def _get_exact(self, key):
+        response = self.local.get(key)
+        if response is None and self.redis is not None:
+            try:
+                data = self.redis.get(key)
+            except Exception as e:
+                logger.warning(f"讀取 Redis 回應快取失敗: {e}")
+                data = None
+            if data is not None:
+                response = data.decode('utf-8')
+                self.local.set(key, response)
+        return response
+
+    def _embed(self, prompt, key):
+        """以嵌入模型計算正規化向量，失敗（例如模型未載入）時返回 None"""
+        import numpy as np
+        from .rag_utils import get_embedding_service
+
+        # 未命中時查詢與寫入是同一提示詞，只需編碼一次
+        vector = self._prompt_vectors.get(key)
+        if vector is not None:
+            return vector
+
+        try:
+            vector = get_embedding_service().encode(normalize_prompt(prompt))
+        except Exception as e:
+            logger.warning(f"計算提示詞向量失敗，略過語意快取: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        vector = vector / norm
+        self._prompt_vectors.set(key, vector)
+        return vector
+
+    def _find_similar(self, prompt, model, temperature):
+        """找出同模型、同溫度下最相似且超過門檻的已快取提示詞"""
+        import numpy as np
+
+        namespace = self.namespace(model, temperature)
+        with self._lock:
+            candidates = [(key, vector) for key, (ns, vector) in self._semantic.items() if ns == namespace]
+        if not candidates:
+            return None
+
+        vector = self._embed(prompt, self.make_key(prompt, model, temperature))
+        if vector is None:
+            return None
+
+        similarities = np.stack([v for _, v in candidates]) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.semantic_threshold:
+            return candidates[best][0]
+        return None
+
+    def _record(self, site, outcome):
+        with self._lock:
+            self._counters[site][outcome] += 1
+        if self.redis is not None:
+            try:
+                self.redis.hincrby(STATS_KEY, f"{site}:{outcome}", 1)
+            except Exception:
+                pass
+
+    def stats(self, shared=False):
+        """各呼叫位置的命中統計；shared=True 時讀取 Redis 中所有行程的累計值"""
+        counters = {site: dict(values) for site, values in self._counters.items()}
+        if shared and self.redis is not None:
+            counters = defaultdict(lambda: {'hits': 0, 'semantic_hits': 0, 'misses': 0})
+            for field, value in self.redis.hgetall(STATS_KEY).items():
+                site, outcome = field.decode('utf-8').rsplit(':', 1)
+                counters[site][outcome] = int(value)
+
+        result = {}
+        for site, values in counters.items():
+            total = sum(values.values())
+            hits = values['hits'] + values['semantic_hits']
+            result[site] = {**values, 'hit_rate': round(hits / total, 3) if total else 0}
+        return result
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    """取得行程共用的 LLM 回應快取"""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache(
+                max_size=settings.LLM_CACHE_SIZE,
+                ttl=settings.LLM_CACHE_TTL,
+                redis_url=settings.REDIS_URL if settings.LLM_CACHE_REDIS else None,
+                semantic_threshold=settings.LLM_CACHE_SEMANTIC_THRESHOLD or None
+            )
+        return _llm_cache
+
+def cached_generate(site, prompt, model, temperature, generate, validate=None):
+    """經由回應快取呼叫 LLM；generate() 只在未命中時呼叫
+
+    空回應或未通過 validate(回應) 檢查的回應不寫入快取
+    """
+    if not settings.LLM_CACHE_ENABLED:
+        return generate()
+
+    cache = get_llm_cache()
+    response = cache.get(site, prompt, model, temperature)
+    if response is not None:
+        logger.debug(f"LLM 回應快取命中: {site}")
+        return response
+
+    response = generate()
+    if response and (validate is None or validate(response)):
+        cache.set(site, prompt, model, temperature, response)
+    return response
+
+async def acached_generate(site, prompt, model, temperature, agenerate, validate=None):
+    """cached_generate 的非同步版本；agenerate() 為協程函式
+
+    快取讀寫（Redis、語意向量）在執行緒中進行，不阻塞事件迴圈
+    """
+    if not settings.LLM_CACHE_ENABLED:
+        return await agenerate()
+
+    cache = get_llm_cache()
+    response = await sync_to_async(cache.get, thread_sensitive=False)(site, prompt, model, temperature)
+    if response is not None:
+        logger.debug(f"LLM 回應快取命中: {site}")
+        return response
+
+    response = await agenerate()
+    if response and (validate is None or validate(response)):
+        await sync_to_async(cache.set, thread_sensitive=False)(site, prompt, model, temperature, response)
+    return response
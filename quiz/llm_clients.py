@@ -0,0 +1,185 @@
+import time
+import asyncio
+import hashlib
+import logging
+import weakref
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# (類型, base_url, API 金鑰雜湊) -> 長期共用的客戶端
+_clients = {}
+_clients_lock = threading.Lock()
+
+# 非同步客戶端的連線池綁定建立時的事件迴圈：事件迴圈 -> {客戶端快取鍵: 客戶端}
+_async_clients = weakref.WeakKeyDictionary()
+
+# 可重試的 HTTP 狀態碼（限流與暫時性伺服器錯誤）
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def _client_key(kind, base_url=None, api_key=None):
+    """客戶端快取鍵，API 金鑰只保存雜湊值"""
+    key_hash = hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else ''
+    return (kind, (base_url or '').rstrip('/'), key_hash)
+
+def _get_or_create(key, factory):
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = factory()
+            logger.info(f"建立 LLM 客戶端: {key[0]} {key[1] or '(預設)'}")
+        return _clients[key]
+
+def _pool_limits():
+    """連線池上限；需傳給 transport，httpx 在指定 transport 時會忽略 Client 的 limits 參數"""
+    import httpx
+
+    return httpx.Limits(
+        max_connections=settings.LLM_POOL_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_POOL_CONNECTIONS
+    )
+
+def get_ollama_client(base_url=None):
+    """取得指定 Ollama 服務共用的客戶端（保持連線並設定逾時）"""
+    import httpx
+    from ollama import Client
+
+    base_url = base_url or settings.OLLAMA_BASE_URL
+
+    def create():
+        return Client(
+            host=base_url,
+            timeout=httpx.Timeout(settings.LLM_REQUEST_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+            # 不在 transport 層重試：連線錯誤由 call_with_retry 統一以指數退避重試，避免重試次數相乘
+            transport=httpx.HTTPTransport(limits=_pool_limits())
+        )
+
+    return _get_or_create(_client_key('ollama', base_url), create)
+
+def _get_or_create_async(key, factory):
+    """取得目前事件迴圈共用的非同步客戶端（ASGI worker 只有一個事件迴圈，整個行程共用）"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = factory()
+            logger.info(f"建立非同步 LLM 客戶端: {key[0]} {key[1] or '(預設)'}")
+        return clients[key]
+
+def get_async_ollama_client(base_url=None):
+    """取得指定 Ollama 服務的非同步客戶端（設定與 get_ollama_client 相同）"""
+    import httpx
+    from ollama import AsyncClient
+
+    base_url = base_url or settings.OLLAMA_BASE_URL
+
+    def create():
+        return AsyncClient(
+            host=base_url,
+            timeout=httpx.Timeout(settings.LLM_REQUEST_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+            transport=httpx.AsyncHTTPTransport(limits=_pool_limits())
+        )
+
+    return _get_or_create_async(_client_key('ollama', base_url), create)
+
+def get_gemini_client(api_key):
+    """取得指定 API 金鑰共用的 Gemini 客戶端"""
+    from google import genai
+    from google.genai import types
+
+    def create():
+        return genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(timeout=int(settings.LLM_REQUEST_TIMEOUT * 1000))
+        )
+
+    return _get_or_create(_client_key('gemini', api_key=api_key), create)
+
+def get_async_gemini_client(api_key):
+    """取得指定 API 金鑰的 Gemini 非同步介面（client.aio）"""
+    from google import genai
+    from google.genai import types
+
+    def create():
+        return genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(timeout=int(settings.LLM_REQUEST_TIMEOUT * 1000))
+        )
+
+    return _get_or_create_async(_client_key('gemini', api_key=api_key), create).aio
+
+def get_http_session(base_url=None):
+    """取得指定服務共用的 requests Session（連線池與退避重試）"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    def create():
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=settings.LLM_POOL_CONNECTIONS,
+            pool_maxsize=settings.LLM_POOL_CONNECTIONS,
+            max_retries=Retry(
+                total=settings.LLM_MAX_RETRIES,
+                backoff_factor=settings.LLM_RETRY_BACKOFF,
+                status_forcelist=sorted(RETRYABLE_STATUS_CODES),
+                allowed_methods=['GET', 'POST']
+            )
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    return _get_or_create(_client_key('http', base_url), create)
+
+def is_retryable(error):
+    """判斷錯誤是否為可重試的暫時性錯誤（連線、逾時、限流或 5xx）"""
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    if status in RETRYABLE_STATUS_CODES:
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import httpx
+
+        return isinstance(error, httpx.TransportError)
+    except ImportError:
+        return False
+
+def call_with_retry(func, *args, **kwargs):
+    """呼叫 LLM API，遇到暫時性錯誤時以指數退避重試"""
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt >= settings.LLM_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = settings.LLM_RETRY_BACKOFF * (2 ** attempt)
+            logger.warning(f"LLM 呼叫失敗，{delay:.1f} 秒後重試（第 {attempt + 1} 次）: {e}")
+            time.sleep(delay)
+
+async def acall_with_retry(func, *args, **kwargs):
+    """call_with_retry 的非同步版本，等待重試時不佔用事件迴圈"""
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if attempt >= settings.LLM_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = settings.LLM_RETRY_BACKOFF * (2 ** attempt)
+            logger.warning(f"LLM 呼叫失敗，{delay:.1f} 秒後重試（第 {attempt + 1} 次）: {e}")
+            await asyncio.sleep(delay)
+
+def clear_clients():
+    """關閉並清除所有共用客戶端（測試或設定變更時使用）"""
+    with _clients_lock:
+        for client in _clients.values():
+            close = getattr(client, 'close', None) or getattr(getattr(client, '_client', None), 'close', None)
+            if close:
+                try:
+                    close()
+                except Exception:
+                    pass
+        _clients.clear()
+        # 非同步客戶端需在所屬事件迴圈中關閉，這裡只解除參照
+        _async_clients.clear()
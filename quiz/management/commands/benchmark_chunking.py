@@ -0,0 +1,115 @@
+import time
+import random
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from quiz.chunking import CHUNKERS, get_chunker, iter_sentences
+from quiz.models import KnowledgeBase
+from quiz.rag_utils import get_embedding_service, iter_knowledge_base_text, iter_text_blocks
+
+class Command(BaseCommand):
+    help = '比較不同切分策略的片段數、token 分佈、嵌入時間與檢索 recall@k（在記憶體中計算，不寫入資料庫）'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--kb', type=int, help='使用指定知識庫的原始內容')
+        source.add_argument('--file', help='使用本機 UTF-8 文字檔')
+        parser.add_argument('--strategies', nargs='+', choices=list(CHUNKERS), default=list(CHUNKERS))
+        parser.add_argument('--max-tokens', type=int, default=None, help='token 策略的片段上限')
+        parser.add_argument('--overlap', type=int, default=None, help='token 策略的重疊 token 數')
+        parser.add_argument('--chunk-size', type=int, default=None, help='sentence 策略的片段字元數')
+        parser.add_argument('--limit', type=int, default=settings.CHUNK_MAX_TOKENS,
+                            help='統計超過此 token 數（含特殊 token）的片段數')
+        parser.add_argument('--queries', type=int, default=100, help='抽樣作為查詢的句子數')
+        parser.add_argument('--k', type=int, default=5, help='recall@k 的 k')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        service = get_embedding_service()
+        if not service.is_available():
+            raise CommandError('Embedding 模型未載入，無法比較嵌入時間與檢索品質')
+
+        blocks = self.load_blocks(options)
+        queries = self.sample_queries(blocks, options['queries'], options['seed'])
+        if not queries:
+            raise CommandError('內容中沒有足夠長的句子可作為查詢')
+        query_vectors = self.normalize(service.encode_batch(queries))
+        self.stdout.write(f"內容 {sum(len(b) for b in blocks):,} 字，抽樣 {len(queries)} 個查詢句")
+
+        results = []
+        for name in options['strategies']:
+            results.append(self.run_strategy(name, blocks, queries, query_vectors, service, options))
+
+        self.stdout.write("\n" + "=" * 86)
+        self.stdout.write(f"{'策略':>10} {'片段數':>8} {'平均tokens':>10} {'最大tokens':>10} {'超過上限':>8} "
+                          f"{'切分(s)':>8} {'嵌入(s)':>8} {'片段/秒':>8} {'recall@k':>9}")
+        for row in results:
+            self.stdout.write(
+                f"{row['name']:>10} {row['chunks']:>8,} {row['avg_tokens']:>10.1f} {row['max_tokens']:>10} "
+                f"{row['over_limit']:>8} {row['chunk_seconds']:>8.2f} {row['embed_seconds']:>8.1f} "
+                f"{row['throughput']:>8.1f} {row['recall']:>9.3f}"
+            )
+
+    def load_blocks(self, options):
+        if options['file']:
+            with open(options['file'], 'rb') as f:
+                return list(iter_text_blocks(f))
+        try:
+            knowledge_base = KnowledgeBase.objects.get(id=options['kb'])
+        except KnowledgeBase.DoesNotExist:
+            raise CommandError(f"知識庫 {options['kb']} 不存在")
+        return list(iter_knowledge_base_text(knowledge_base))
+
+    def sample_queries(self, blocks, count, seed, min_chars=15, max_chars=200):
+        """抽樣內容中的句子作為查詢，正確答案為包含該句的片段"""
+        sentences = [s.strip() for s in iter_sentences(blocks) if min_chars <= len(s.strip()) <= max_chars]
+        random.Random(seed).shuffle(sentences)
+        return sentences[:count]
+
+    def normalize(self, vectors):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def run_strategy(self, name, blocks, queries, query_vectors, service, options):
+        chunker_options = {}
+        if name == 'token':
+            if options['max_tokens']:
+                chunker_options['max_tokens'] = options['max_tokens']
+            if options['overlap'] is not None:
+                chunker_options['overlap_tokens'] = options['overlap']
+        elif options['chunk_size']:
+            chunker_options['chunk_size'] = options['chunk_size']
+        chunker = get_chunker(name, **chunker_options)
+
+        self.stdout.write(f"\n=== {name} ===")
+        start = time.perf_counter()
+        chunks = list(chunker.iter_chunks(blocks))
+        chunk_seconds = time.perf_counter() - start
+
+        tokens = service.count_tokens(chunks)
+
+        start = time.perf_counter()
+        chunk_vectors = self.normalize(service.encode_batch(chunks))
+        embed_seconds = time.perf_counter() - start
+
+        # 查詢句所在的片段出現在 top-k 中即算命中
+        k = options['k']
+        top_k = np.argsort(-(query_vectors @ chunk_vectors.T), axis=1)[:, :k]
+        hits = sum(
+            any(query in chunks[i] for i in row)
+            for query, row in zip(queries, top_k)
+        )
+
+        row = {
+            'name': name,
+            'chunks': len(chunks),
+            'avg_tokens': float(np.mean(tokens)) if tokens else 0,
+            'max_tokens': max(tokens, default=0),
+            'over_limit': sum(1 for t in tokens if t > options['limit']),
+            'chunk_seconds': chunk_seconds,
+            'embed_seconds': embed_seconds,
+            'throughput': len(chunks) / embed_seconds if embed_seconds else 0,
+            'recall': hits / len(queries),
+        }
+        self.stdout.write(f"{row['chunks']:,} 個片段，嵌入 {embed_seconds:.1f}s，recall@{k} {row['recall']:.3f}")
+        return row
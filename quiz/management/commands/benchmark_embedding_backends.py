@@ -0,0 +1,77 @@
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from quiz.embedding_backends import cosine_similarities, get_embedding_backend
+from quiz.models import KnowledgeChunk
+
+# 變體名稱 -> (後端, 建立參數)
+VARIANTS = {
+    'torch-fp32': ('torch', {'dtype': 'float32'}),
+    'torch-bf16': ('torch', {'dtype': 'bfloat16'}),
+    'onnx': ('onnx', {}),
+}
+
+class Command(BaseCommand):
+    help = '比較嵌入推論後端的載入時間、吞吐量與輸出一致性（以第一個後端為基準的餘弦相似度）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', choices=list(VARIANTS), default=list(VARIANTS),
+                            help='要比較的後端，第一個作為一致性基準')
+        parser.add_argument('--samples', type=int, default=512, help='抽樣的知識片段數')
+        parser.add_argument('--batch-size', type=int, default=settings.EMBEDDING_BATCH_SIZE)
+        parser.add_argument('--onnx-path', default=settings.EMBEDDING_ONNX_PATH)
+
+    def handle(self, *args, **options):
+        texts = list(KnowledgeChunk.objects.order_by('?').values_list('content', flat=True)[:options['samples']])
+        if not texts:
+            raise CommandError('沒有知識片段可作為測試文本')
+        # 依長度排序分批，與 EmbeddingService.encode_batch 的分桶方式相近
+        texts.sort(key=len)
+        self.stdout.write(f"{len(texts)} 個片段，平均 {np.mean([len(t) for t in texts]):.0f} 字，批次大小 {options['batch_size']}")
+
+        results = []
+        reference = None
+        for name in options['backends']:
+            backend_name, backend_options = VARIANTS[name]
+            if backend_name == 'onnx':
+                backend_options = {**backend_options, 'model_path': options['onnx_path']}
+
+            self.stdout.write(f"\n=== {name} ===")
+            start = time.perf_counter()
+            try:
+                backend = get_embedding_backend(backend_name, **backend_options)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"無法載入：{e}"))
+                continue
+            load_seconds = time.perf_counter() - start
+
+            # 第一批先執行一次預熱，不計入時間
+            backend.encode(texts[:options['batch_size']])
+            start = time.perf_counter()
+            vectors = np.concatenate([
+                backend.encode(texts[i:i + options['batch_size']])
+                for i in range(0, len(texts), options['batch_size'])
+            ])
+            seconds = time.perf_counter() - start
+
+            if reference is None:
+                reference = vectors
+            similarities = cosine_similarities(reference, vectors)
+            row = {
+                'name': name,
+                'load_seconds': load_seconds,
+                'throughput': len(texts) / seconds,
+                'min_cosine': float(similarities.min()),
+                'mean_cosine': float(similarities.mean()),
+            }
+            results.append(row)
+            self.stdout.write(f"吞吐量 {row['throughput']:.1f} chunks/sec，與基準的餘弦相似度 "
+                              f"最低 {row['min_cosine']:.4f} / 平均 {row['mean_cosine']:.4f}")
+            del backend
+
+        self.stdout.write("\n" + "=" * 64)
+        self.stdout.write(f"{'後端':>12} {'載入(s)':>9} {'chunks/sec':>11} {'最低 cos':>9} {'平均 cos':>9}")
+        for row in results:
+            self.stdout.write(f"{row['name']:>12} {row['load_seconds']:>9.1f} {row['throughput']:>11.1f} "
+                              f"{row['min_cosine']:>9.4f} {row['mean_cosine']:>9.4f}")
@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+import http.client
+import numpy as np
+from importlib import import_module
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+# 服務模式 -> 啟動指令（{port} 會被替換）
+SERVER_COMMANDS = {
+    'runserver': [sys.executable, 'manage.py', 'runserver', '--noreload', '127.0.0.1:{port}'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                 '--bind', '127.0.0.1:{port}', 'quiz_system.wsgi:application'],
+    'gunicorn-asgi': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', '127.0.0.1:{port}',
+                      '--worker-class', 'uvicorn_worker.UvicornWorker', 'quiz_system.asgi:application'],
+}
+
+class Command(BaseCommand):
+    help = '以多個並行連線壓測頁面，比較 runserver 與 Gunicorn（WSGI / ASGI）的 requests/sec 與延遲'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=list(SERVER_COMMANDS), default=['runserver', 'gunicorn'])
+        parser.add_argument('--url', default=None, help='改為測試已在執行的伺服器（例如 http://127.0.0.1:8000），不自行啟動')
+        parser.add_argument('--paths', nargs='+', default=['/', '/knowledge/', '/health/'])
+        parser.add_argument('--concurrency', type=int, default=16, help='並行連線數')
+        parser.add_argument('--duration', type=float, default=10, help='每個路徑的壓測秒數')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--user', default=None, help='以此使用者的 session 存取需登入的頁面')
+
+    def handle(self, *args, **options):
+        cookie = self.session_cookie(options['user']) if options['user'] else None
+        if cookie is None:
+            self.stdout.write(self.style.WARNING("未指定 --user，需登入的頁面只會測到登入轉址"))
+
+        results = []
+        if options['url']:
+            results.extend(self.run_paths('external', options['url'], cookie, options))
+        else:
+            for mode in options['modes']:
+                results.extend(self.run_server(mode, cookie, options))
+
+        self.stdout.write("\n" + "=" * 72)
+        self.stdout.write(f"{'模式':>13} {'路徑':>14} {'req/s':>9} {'p50':>9} {'p99':>9} {'非 2xx/3xx':>10} {'錯誤':>6}")
+        for row in results:
+            self.stdout.write(
+                f"{row['mode']:>13} {row['path']:>14} {row['rps']:>9.1f} {row['p50']:>7.1f}ms "
+                f"{row['p99']:>7.1f}ms {row['bad_status']:>10} {row['errors']:>6}"
+            )
+
+    def session_cookie(self, username):
+        """為指定使用者建立登入 session，返回 Cookie 標頭值"""
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"使用者 {username} 不存在")
+
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return f"{settings.SESSION_COOKIE_NAME}={session.session_key}"
+
+    def run_server(self, mode, cookie, options):
+        port = options['port']
+        command = [part.format(port=port) for part in SERVER_COMMANDS[mode]]
+        self.stdout.write(f"\n=== {mode} ===")
+        process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=os.environ.copy(),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            self.wait_until_ready(base_url, process)
+            return self.run_paths(mode, base_url, cookie, options)
+        finally:
+            # SIGTERM：runserver 直接結束，Gunicorn 會平滑關閉 worker
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def wait_until_ready(self, base_url, process, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"伺服器啟動失敗（結束代碼 {process.returncode}）")
+            try:
+                status, _ = self.request(self.connect(base_url), '/health/', None)
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.5)
+        raise CommandError(f"伺服器在 {timeout} 秒內未就緒")
+
+    def connect(self, base_url):
+        host, _, port = base_url.split('://', 1)[1].rstrip('/').partition(':')
+        return http.client.HTTPConnection(host, int(port or 80), timeout=30)
+
+    def request(self, connection, path, cookie):
+        headers = {'Cookie': cookie} if cookie else {}
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status, response.getheader('Connection', '')
+
+    def run_paths(self, mode, base_url, cookie, options):
+        rows = []
+        for path in options['paths']:
+            row = self.load_test(base_url, path, cookie, options['concurrency'], options['duration'])
+            row.update(mode=mode, path=path)
+            self.stdout.write(f"{path}: {row['rps']:.1f} req/s，p50 {row['p50']:.1f}ms，p99 {row['p99']:.1f}ms")
+            rows.append(row)
+        return rows
+
+    def load_test(self, base_url, path, cookie, concurrency, duration):
+        """每個執行緒保持一條連線，在時限內不斷送出請求"""
+        latencies, statuses, errors = [], [], []
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def worker():
+            connection = self.connect(base_url)
+            local_latencies, local_statuses, local_errors = [], [], 0
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    status, connection_header = self.request(connection, path, cookie)
+                except (OSError, http.client.HTTPException):
+                    local_errors += 1
+                    connection.close()
+                    connection = self.connect(base_url)
+                    continue
+                local_latencies.append((time.perf_counter() - start) * 1000)
+                local_statuses.append(status)
+                if connection_header.lower() == 'close':
+                    # runserver 每個請求後關閉連線
+                    connection.close()
+                    connection = self.connect(base_url)
+            connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                statuses.extend(local_statuses)
+                errors.append(local_errors)
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        return {
+            'rps': len(latencies) / elapsed,
+            'p50': float(np.percentile(latencies, 50)) if latencies else 0,
+            'p99': float(np.percentile(latencies, 99)) if latencies else 0,
+            'bad_status': sum(1 for status in statuses if status >= 400),
+            'errors': sum(errors),
+        }
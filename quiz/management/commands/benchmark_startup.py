@@ -0,0 +1,84 @@
+import os
+import re
+import sys
+import time
+import subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# 測試目標 -> 在子行程中執行的參數（每次都是全新的直譯器，不受目前行程已匯入的模組影響）
+TARGETS = {
+    'setup': ['-c', 'import django; django.setup()'],
+    'urls': ['-c', 'import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns'],
+    'wsgi': ['-c', 'from quiz_system.wsgi import application'],
+    'asgi': ['-c', 'from quiz_system.asgi import application'],
+    'check': ['manage.py', 'check'],
+}
+
+# 不應在啟動時載入的重量級套件
+HEAVY_MODULES = ['torch', 'transformers', 'onnxruntime', 'google.genai', 'ollama', 'requests']
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+class Command(BaseCommand):
+    help = '以 python -X importtime 量測 Django 行程的啟動時間，列出最耗時的匯入與意外載入的重量級套件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--targets', nargs='+', choices=list(TARGETS), default=list(TARGETS))
+        parser.add_argument('--repeat', type=int, default=3, help='每個目標執行次數（取最快一次）')
+        parser.add_argument('--top', type=int, default=10, help='列出累計耗時最多的頂層匯入數')
+        parser.add_argument('--budget', type=float, default=1.0, help='啟動時間上限（秒）')
+        parser.add_argument('--strict', action='store_true', help='超過上限或載入重量級套件時以錯誤結束（CI 使用）')
+
+    def handle(self, *args, **options):
+        failures = []
+        rows = []
+        for name in options['targets']:
+            wall, imports = self.profile(TARGETS[name], options['repeat'])
+            heavy = [module for module in HEAVY_MODULES if module in imports]
+            rows.append((name, wall, sum(self_us for self_us, _, _ in imports.values()) / 1e6, heavy))
+
+            self.stdout.write(f"\n=== {name} ===")
+            self.stdout.write(f"啟動 {wall:.3f}s，匯入 {len(imports)} 個模組")
+            top_level = sorted(
+                ((module, cumulative) for module, (_, cumulative, depth) in imports.items() if depth == 0),
+                key=lambda item: -item[1]
+            )[:options['top']]
+            for module, cumulative in top_level:
+                self.stdout.write(f"  {cumulative / 1000:>8.1f} ms  {module}")
+
+            if heavy:
+                self.stdout.write(self.style.WARNING(f"  啟動時載入了重量級套件: {', '.join(heavy)}"))
+                failures.append(f"{name} 載入 {', '.join(heavy)}")
+            if wall > options['budget']:
+                failures.append(f"{name} 啟動 {wall:.2f}s 超過上限 {options['budget']}s")
+
+        self.stdout.write("\n" + "=" * 60)
+        self.stdout.write(f"{'目標':>8} {'啟動(s)':>9} {'匯入(s)':>9}  重量級套件")
+        for name, wall, import_seconds, heavy in rows:
+            self.stdout.write(f"{name:>8} {wall:>9.3f} {import_seconds:>9.3f}  {', '.join(heavy) or '-'}")
+
+        if failures and options['strict']:
+            raise CommandError('；'.join(failures))
+
+    def profile(self, arguments, repeat):
+        """執行子行程並解析 -X importtime 輸出，返回 (最快的秒數, {模組: (self us, cumulative us, 深度)})"""
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'quiz_system.settings')}
+        best, stderr = None, ''
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, '-X', 'importtime', *arguments], cwd=settings.BASE_DIR,
+                                    env=env, capture_output=True, text=True)
+            elapsed = time.perf_counter() - start
+            if result.returncode != 0:
+                raise CommandError(f"{' '.join(arguments)} 執行失敗:\n{result.stderr[-2000:]}")
+            if best is None or elapsed < best:
+                best, stderr = elapsed, result.stderr
+
+        imports = {}
+        for line in stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                self_us, cumulative, indent, module = match.groups()
+                imports[module] = (int(self_us), int(cumulative), (len(indent) - 1) // 2)
+        return best, imports
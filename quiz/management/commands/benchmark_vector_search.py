@@ -0,0 +1,116 @@
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from quiz.rag_utils import apply_vector_search_settings
+from quiz.vector_index import build_index_sql, copy_vectors, default_ivfflat_lists, make_clustered_vectors
+
+BENCH_TABLE = 'bench_vector_chunks'
+BENCH_INDEX = 'bench_vector_chunks_ann'
+
+class Command(BaseCommand):
+    help = '比較 ANN 索引與精確搜尋的 recall@k 及延遲（使用合成資料，不影響正式資料表）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help='測試的片段數量')
+        parser.add_argument('--index', choices=['hnsw', 'ivfflat'], default=settings.VECTOR_INDEX_TYPE)
+        parser.add_argument('--queries', type=int, default=100, help='每個規模的查詢次數')
+        parser.add_argument('--k', type=int, default=10, help='recall@k 的 k')
+        parser.add_argument('--ef-search', type=int, default=settings.VECTOR_SEARCH_EF_SEARCH)
+        parser.add_argument('--probes', type=int, default=settings.VECTOR_SEARCH_PROBES)
+        parser.add_argument('--dim', type=int, default=768)
+        parser.add_argument('--clusters', type=int, default=200, help='合成資料的群集數（模擬主題分佈）')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        centroids = rng.normal(size=(options['clusters'], options['dim'])).astype(np.float32)
+
+        results = []
+        for size in options['sizes']:
+            self.stdout.write(f"\n=== {size:,} 個片段 ===")
+            try:
+                results.append(self.run_size(size, centroids, rng, options))
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+
+        self.stdout.write("\n" + "=" * 78)
+        self.stdout.write(f"{'片段數':>10} {'索引':>8} {'建立(s)':>9} {'recall@k':>9} "
+                          f"{'ANN p50':>9} {'ANN p99':>9} {'精確 p50':>9} {'精確 p99':>9}")
+        for row in results:
+            self.stdout.write(
+                f"{row['size']:>10,} {row['index']:>8} {row['build_seconds']:>9.1f} {row['recall']:>9.3f} "
+                f"{row['ann_p50']:>8.1f}ms {row['ann_p99']:>8.1f}ms {row['exact_p50']:>8.1f}ms {row['exact_p99']:>8.1f}ms"
+            )
+
+    def load_data(self, cursor, size, centroids, rng, batch_size=10_000):
+        """以 COPY 批次載入合成向量"""
+        for start in range(0, size, batch_size):
+            copy_vectors(cursor, BENCH_TABLE, make_clustered_vectors(centroids, rng, min(batch_size, size - start)))
+
+    def timed_query(self, vector, k, exact, options):
+        """執行一次 top-k 查詢，返回 (id 集合, 毫秒)"""
+        with transaction.atomic(), connection.cursor() as cursor:
+            if exact:
+                # 關閉索引掃描以取得精確結果
+                cursor.execute("SET LOCAL enable_indexscan = off")
+            else:
+                apply_vector_search_settings(cursor, ef_search=options['ef_search'], probes=options['probes'])
+
+            start = time.perf_counter()
+            cursor.execute(
+                f"SELECT id FROM {BENCH_TABLE} ORDER BY embedding <-> %s::vector LIMIT %s",
+                [vector, k]
+            )
+            ids = {row[0] for row in cursor.fetchall()}
+            return ids, (time.perf_counter() - start) * 1000
+
+    def run_size(self, size, centroids, rng, options):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+            cursor.execute(
+                f"CREATE UNLOGGED TABLE {BENCH_TABLE} (id bigserial PRIMARY KEY, embedding vector({options['dim']}))"
+            )
+
+            self.stdout.write("載入資料中...")
+            load_start = time.perf_counter()
+            self.load_data(cursor, size, centroids, rng)
+            self.stdout.write(f"載入完成，耗時 {time.perf_counter() - load_start:.1f}s")
+
+            self.stdout.write(f"建立 {options['index']} 索引中...")
+            build_start = time.perf_counter()
+            cursor.execute(build_index_sql(
+                BENCH_TABLE, 'embedding', BENCH_INDEX,
+                index_type=options['index'], lists=default_ivfflat_lists(size)
+            ))
+            cursor.execute(f"ANALYZE {BENCH_TABLE}")
+            build_seconds = time.perf_counter() - build_start
+
+        queries = make_clustered_vectors(centroids, rng, options['queries'])
+        recalls, ann_times, exact_times = [], [], []
+        for vector in queries:
+            vector = vector.tolist()
+            exact_ids, exact_ms = self.timed_query(vector, options['k'], True, options)
+            ann_ids, ann_ms = self.timed_query(vector, options['k'], False, options)
+            recalls.append(len(exact_ids & ann_ids) / max(len(exact_ids), 1))
+            exact_times.append(exact_ms)
+            ann_times.append(ann_ms)
+
+        row = {
+            'size': size,
+            'index': options['index'],
+            'build_seconds': build_seconds,
+            'recall': float(np.mean(recalls)),
+            'ann_p50': float(np.percentile(ann_times, 50)),
+            'ann_p99': float(np.percentile(ann_times, 99)),
+            'exact_p50': float(np.percentile(exact_times, 50)),
+            'exact_p99': float(np.percentile(exact_times, 99)),
+        }
+        self.stdout.write(
+            f"recall@{options['k']} = {row['recall']:.3f}，ANN p50/p99 = {row['ann_p50']:.1f}/{row['ann_p99']:.1f} ms，"
+            f"精確 p50/p99 = {row['exact_p50']:.1f}/{row['exact_p99']:.1f} ms"
+        )
+        return row
@@ -0,0 +1,177 @@
+import json
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from quiz.vector_index import (
+    ann_index_target, ann_query_expression, build_index_sql, copy_vectors,
+    default_ivfflat_lists, make_clustered_vectors, relation_sizes
+)
+
+BASE_TABLE = 'bench_storage_base'
+HALF_TABLE = 'bench_storage_half'
+BENCH_INDEX = 'bench_storage_ann'
+
+# 變體名稱 -> (欄位型別, 索引量化方式)
+VARIANTS = {
+    'vector': ('vector', 'none'),
+    'halfvec': ('halfvec', 'none'),
+    'binary': ('vector', 'binary'),
+    'halfvec+binary': ('halfvec', 'binary'),
+}
+
+class Command(BaseCommand):
+    help = '比較 float32 / halfvec / binary 量化的表與索引大小、buffer 快取命中率及 recall@k（使用合成資料）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100_000], help='測試的片段數量')
+        parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+        parser.add_argument('--index', choices=['hnsw', 'ivfflat'], default=settings.VECTOR_INDEX_TYPE)
+        parser.add_argument('--queries', type=int, default=100, help='每個規模的查詢次數')
+        parser.add_argument('--k', type=int, default=10, help='recall@k 的 k')
+        parser.add_argument('--rerank', type=int, default=settings.VECTOR_RERANK_CANDIDATES,
+                            help='以完整精度重新排序的候選數')
+        parser.add_argument('--ef-search', type=int, default=settings.VECTOR_SEARCH_EF_SEARCH)
+        parser.add_argument('--probes', type=int, default=settings.VECTOR_SEARCH_PROBES)
+        parser.add_argument('--dim', type=int, default=768)
+        parser.add_argument('--clusters', type=int, default=200, help='合成資料的群集數（模擬主題分佈）')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        centroids = rng.normal(size=(options['clusters'], options['dim'])).astype(np.float32)
+
+        results = []
+        for size in options['sizes']:
+            self.stdout.write(f"\n=== {size:,} 個片段 ===")
+            try:
+                results.extend(self.run_size(size, centroids, rng, options))
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {HALF_TABLE}")
+                    cursor.execute(f"DROP TABLE IF EXISTS {BASE_TABLE}")
+
+        self.stdout.write("\n" + "=" * 104)
+        self.stdout.write(f"{'片段數':>10} {'變體':>15} {'表(MB)':>9} {'TOAST(MB)':>10} {'索引(MB)':>9} "
+                          f"{'命中率':>7} {'blocks/查詢':>11} {'p50':>8} {'recall':>7} {'重排recall':>10}")
+        for row in results:
+            self.stdout.write(
+                f"{row['size']:>10,} {row['variant']:>15} {row['heap'] / 2**20:>9.1f} {row['toast'] / 2**20:>10.1f} "
+                f"{row['index'] / 2**20:>9.1f} {row['hit_ratio']:>7.3f} {row['blocks']:>11.1f} "
+                f"{row['p50']:>6.1f}ms {row['recall']:>7.3f} {row['rerank_recall']:>10.3f}"
+            )
+
+    def run_size(self, size, centroids, rng, options):
+        dim = options['dim']
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {HALF_TABLE}")
+            cursor.execute(f"DROP TABLE IF EXISTS {BASE_TABLE}")
+            cursor.execute(f"CREATE UNLOGGED TABLE {BASE_TABLE} (id bigserial PRIMARY KEY, embedding vector({dim}))")
+            self.stdout.write("載入資料中...")
+            for start in range(0, size, 10_000):
+                copy_vectors(cursor, BASE_TABLE, make_clustered_vectors(centroids, rng, min(10_000, size - start)))
+            cursor.execute(f"VACUUM ANALYZE {BASE_TABLE}")
+
+            if any(VARIANTS[name][0] == 'halfvec' for name in options['variants']):
+                # 相同 id 的 halfvec 副本；重新排序時回到 float32 基準表取完整精度向量
+                cursor.execute(
+                    f"CREATE UNLOGGED TABLE {HALF_TABLE} AS "
+                    f"SELECT id, embedding::halfvec({dim}) AS embedding FROM {BASE_TABLE}"
+                )
+                cursor.execute(f"VACUUM ANALYZE {HALF_TABLE}")
+
+        queries = [to_literal(v) for v in make_clustered_vectors(centroids, rng, options['queries'])]
+        exact = [self.exact_ids(vector, options['k']) for vector in queries]
+
+        rows = []
+        for name in options['variants']:
+            storage, quantization = VARIANTS[name]
+            table = HALF_TABLE if storage == 'halfvec' else BASE_TABLE
+            rows.append(self.run_variant(name, table, storage, quantization, size, queries, exact, options))
+        return rows
+
+    def exact_ids(self, vector, k):
+        """float32 精確搜尋的結果（基準）"""
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_indexscan = off")
+            cursor.execute(f"SELECT id FROM {BASE_TABLE} ORDER BY embedding <-> %s::vector LIMIT %s", [vector, k])
+            return {row[0] for row in cursor.fetchall()}
+
+    def run_variant(self, name, table, storage, quantization, size, queries, exact, options):
+        dim, k = options['dim'], options['k']
+        column, opclass, operator = ann_index_target('embedding', storage, quantization, dimensions=dim)
+        ann_query = ann_query_expression('%s::vector', storage, quantization, dimensions=dim)
+
+        with connection.cursor() as cursor:
+            self.stdout.write(f"[{name}] 建立 {options['index']} 索引中...")
+            cursor.execute(build_index_sql(table, column, BENCH_INDEX, index_type=options['index'],
+                                           opclass=opclass, lists=default_ivfflat_lists(size)))
+            cursor.execute(f"ANALYZE {table}")
+            sizes = relation_sizes(cursor, table, BENCH_INDEX)
+
+        approx_sql = f"SELECT id FROM {table} ORDER BY {column} {operator} {ann_query} LIMIT %s"
+        rerank_sql = f"""
+            SELECT cand.id FROM ({approx_sql}) cand
+            JOIN {BASE_TABLE} b ON b.id = cand.id
+            ORDER BY b.embedding <-> %s::vector
+            LIMIT %s
+        """
+        candidates = max(k, options['rerank'])
+
+        recalls, rerank_recalls, times, hits, reads = [], [], [], 0, 0
+        try:
+            for vector, exact_ids in zip(queries, exact):
+                approx_ids = self.fetch_ids(approx_sql, [vector, k], options)
+                rerank_params = [vector, candidates, vector, k]
+                rerank_ids = self.fetch_ids(rerank_sql, rerank_params, options, candidates)
+                recalls.append(len(exact_ids & approx_ids) / max(len(exact_ids), 1))
+                rerank_recalls.append(len(exact_ids & rerank_ids) / max(len(exact_ids), 1))
+
+                # 以 EXPLAIN BUFFERS 取得實際查詢路徑（含重新排序）的 buffer 命中與讀取數
+                plan = self.explain(rerank_sql, rerank_params, options, candidates)
+                times.append(plan['Execution Time'])
+                hits += plan['Plan'].get('Shared Hit Blocks', 0)
+                reads += plan['Plan'].get('Shared Read Blocks', 0)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP INDEX IF EXISTS {BENCH_INDEX}")
+
+        row = {
+            'size': size,
+            'variant': name,
+            **sizes,
+            'hit_ratio': hits / (hits + reads) if hits + reads else 1.0,
+            'blocks': (hits + reads) / len(queries),
+            'p50': float(np.percentile(times, 50)),
+            'recall': float(np.mean(recalls)),
+            'rerank_recall': float(np.mean(rerank_recalls)),
+        }
+        self.stdout.write(
+            f"[{name}] 表 {row['heap'] / 2**20:.1f} MB + TOAST {row['toast'] / 2**20:.1f} MB，"
+            f"索引 {row['index'] / 2**20:.1f} MB，命中率 {row['hit_ratio']:.3f}，"
+            f"recall@{k} {row['recall']:.3f} / 重排後 {row['rerank_recall']:.3f}"
+        )
+        return row
+
+    def apply_settings(self, cursor, options, candidates=0):
+        # HNSW 最多返回 ef_search 筆，需足以涵蓋重新排序的候選數
+        cursor.execute(
+            "SELECT set_config('hnsw.ef_search', %s, true), set_config('ivfflat.probes', %s, true)",
+            [str(max(options['ef_search'], candidates)), str(options['probes'])]
+        )
+
+    def fetch_ids(self, sql, params, options, candidates=0):
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.apply_settings(cursor, options, candidates)
+            cursor.execute(sql, params)
+            return {row[0] for row in cursor.fetchall()}
+
+    def explain(self, sql, params, options, candidates=0):
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.apply_settings(cursor, options, candidates)
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            return (json.loads(plan) if isinstance(plan, str) else plan)[0]
+
+def to_literal(vector):
+    return '[' + ','.join(map(str, vector.tolist())) + ']'
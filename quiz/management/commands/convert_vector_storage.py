@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from quiz.vector_index import (
+    ANN_INDEX_NAME, VECTOR_QUANTIZATIONS, VECTOR_STORAGE_TYPES,
+    convert_vector_storage, get_vector_storage, rebuild_ann_index, relation_sizes
+)
+
+class Command(BaseCommand):
+    help = '轉換知識片段向量的儲存型別（vector / halfvec）並依量化方式重建 ANN 索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=VECTOR_STORAGE_TYPES, default=settings.VECTOR_STORAGE,
+                            help='目標欄位型別（預設取自 VECTOR_STORAGE）')
+        parser.add_argument('--quantization', choices=VECTOR_QUANTIZATIONS, default=settings.VECTOR_QUANTIZATION,
+                            help='索引量化方式（預設取自 VECTOR_QUANTIZATION）')
+        parser.add_argument('--type', choices=['hnsw', 'ivfflat'], default=settings.VECTOR_INDEX_TYPE,
+                            help='索引類型（預設取自 VECTOR_INDEX_TYPE）')
+        parser.add_argument('--m', type=int, default=16, help='HNSW 每層最大連結數')
+        parser.add_argument('--ef-construction', type=int, default=64, help='HNSW 建立時的候選數')
+
+    def handle(self, *args, **options):
+        if options['to'] != settings.VECTOR_STORAGE or options['quantization'] != settings.VECTOR_QUANTIZATION:
+            self.stdout.write(self.style.WARNING(
+                "目標與 VECTOR_STORAGE / VECTOR_QUANTIZATION 設定不一致，完成後請同步更新設定，否則搜尋無法使用索引"
+            ))
+
+        with connection.cursor() as cursor:
+            before = relation_sizes(cursor, 'quiz_knowledgechunk', ANN_INDEX_NAME)
+            current = get_vector_storage(cursor)
+
+            if current != options['to']:
+                self.stdout.write(f"轉換欄位型別 {current} → {options['to']}（重寫整張表，期間會鎖住讀寫）...")
+                convert_vector_storage(cursor, options['to'])
+            else:
+                self.stdout.write(f"欄位型別已是 {current}，只重建索引")
+
+            self.stdout.write(f"重建 {options['type']} 索引（量化：{options['quantization']}）...")
+            rebuild_ann_index(
+                cursor,
+                index_type=options['type'],
+                m=options['m'],
+                ef_construction=options['ef_construction'],
+                storage=options['to'],
+                quantization=options['quantization'],
+            )
+            cursor.execute("VACUUM ANALYZE quiz_knowledgechunk")
+            after = relation_sizes(cursor, 'quiz_knowledgechunk', ANN_INDEX_NAME)
+
+        for part, label in [('heap', '資料表'), ('toast', 'TOAST'), ('index', 'ANN 索引')]:
+            self.stdout.write(f"{label:>8}: {before[part] / 2**20:>10.1f} MB → {after[part] / 2**20:>10.1f} MB")
+        self.stdout.write(self.style.SUCCESS(f"已轉換為 {options['to']}（量化：{options['quantization']}）"))
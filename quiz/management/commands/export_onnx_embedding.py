@@ -0,0 +1,72 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = '匯出嵌入模型為 ONNX 並進行動態 int8 量化（供 EMBEDDING_BACKEND=onnx 使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.EMBEDDING_ONNX_PATH, help='輸出路徑（預設取自 EMBEDDING_ONNX_PATH）')
+        parser.add_argument('--source', choices=['hub', 'torch'], default='hub',
+                            help='hub：下載模型倉庫附帶的 onnx/model.onnx；torch：以 torch.onnx.export 匯出')
+        parser.add_argument('--no-quantize', action='store_true', help='只輸出 float32 模型')
+        parser.add_argument('--opset', type=int, default=17)
+
+    def handle(self, *args, **options):
+        output = options['output']
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+        start = time.perf_counter()
+        if options['source'] == 'hub':
+            fp32_path = self.download_from_hub()
+        else:
+            fp32_path = os.path.splitext(output)[0] + '-fp32.onnx'
+            self.export_from_torch(fp32_path, options['opset'])
+        self.stdout.write(f"float32 模型: {fp32_path}（{os.path.getsize(fp32_path) / 2**20:.0f} MB）")
+
+        if options['no_quantize']:
+            if os.path.abspath(fp32_path) != os.path.abspath(output):
+                import shutil
+
+                shutil.copyfile(fp32_path, output)
+        else:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            self.stdout.write("動態 int8 量化中...")
+            quantize_dynamic(fp32_path, output, weight_type=QuantType.QInt8)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"已輸出 {output}（{os.path.getsize(output) / 2**20:.0f} MB，耗時 {time.perf_counter() - start:.0f}s）；"
+            f"設定 EMBEDDING_BACKEND=onnx 後可執行 benchmark_embedding_backends 確認一致性與吞吐量"
+        ))
+
+    def download_from_hub(self):
+        from huggingface_hub import hf_hub_download
+
+        try:
+            return hf_hub_download(settings.EMBEDDING_MODEL, 'onnx/model.onnx')
+        except Exception as e:
+            raise CommandError(f"模型倉庫沒有可用的 onnx/model.onnx（{e}），請改用 --source torch")
+
+    def export_from_torch(self, path, opset):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.stdout.write("以 torch.onnx.export 匯出中...")
+        model = AutoModel.from_pretrained(settings.EMBEDDING_MODEL, trust_remote_code=True,
+                                          torch_dtype=torch.float32).eval()
+        tokenizer = AutoTokenizer.from_pretrained(settings.EMBEDDING_MODEL)
+        sample = tokenizer(['匯出用的範例文字', '第二段'], padding=True, return_tensors='pt')
+
+        dynamic = {0: 'batch', 1: 'sequence'}
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (sample['input_ids'], sample['attention_mask']),
+                path,
+                input_names=['input_ids', 'attention_mask'],
+                output_names=['last_hidden_state'],
+                dynamic_axes={'input_ids': dynamic, 'attention_mask': dynamic, 'last_hidden_state': dynamic},
+                opset_version=opset,
+            )
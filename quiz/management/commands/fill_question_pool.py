@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from quiz.models import KnowledgeBase
+from quiz.question_pool import fill_pool, POOL_QUESTION_TYPES, POOL_DIFFICULTIES
+
+class Command(BaseCommand):
+    help = '為知識庫預先生成題庫題目（依題型與難度分組）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kb', type=int, nargs='*', help='知識庫 ID（預設為全部）')
+        parser.add_argument('--target', type=int, default=None, help='每個分組的目標題數')
+        parser.add_argument('--types', nargs='*', choices=POOL_QUESTION_TYPES, help='限定題型')
+        parser.add_argument('--difficulties', nargs='*', choices=POOL_DIFFICULTIES, help='限定難度')
+
+    def handle(self, *args, **options):
+        knowledge_bases = KnowledgeBase.objects.all()
+        if options['kb']:
+            knowledge_bases = knowledge_bases.filter(id__in=options['kb'])
+
+        total = 0
+        for kb in knowledge_bases:
+            added = fill_pool(
+                kb,
+                question_types=options['types'],
+                difficulties=options['difficulties'],
+                target=options['target']
+            )
+            total += added
+            self.stdout.write(f"{kb.name}: 新增 {added} 題")
+
+        self.stdout.write(self.style.SUCCESS(f"題庫生成完成，共新增 {total} 題"))
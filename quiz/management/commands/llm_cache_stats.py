@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from quiz.llm_cache import get_llm_cache, STATS_KEY
+
+class Command(BaseCommand):
+    help = '顯示 LLM 回應快取各呼叫位置的命中率（需啟用 Redis 共享快取層）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='顯示後清除累計統計')
+
+    def handle(self, *args, **options):
+        cache = get_llm_cache()
+        if cache.redis is None:
+            raise CommandError('未設定 REDIS_URL 或未啟用 LLM_CACHE_REDIS，無法讀取跨行程統計')
+
+        stats = cache.stats(shared=True)
+        if not stats:
+            self.stdout.write('尚無快取統計資料')
+        for site, values in sorted(stats.items()):
+            self.stdout.write(
+                f"{site:<20} 命中 {values['hits']:>6}  語意命中 {values['semantic_hits']:>6}  "
+                f"未命中 {values['misses']:>6}  命中率 {values['hit_rate']:.1%}"
+            )
+
+        if options['reset']:
+            cache.redis.delete(STATS_KEY)
+            self.stdout.write(self.style.SUCCESS('已清除累計統計'))
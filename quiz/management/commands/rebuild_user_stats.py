@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from quiz.models import UserStats
+from quiz.user_stats import check_user_stats, rebuild_user_stats
+
+class Command(BaseCommand):
+    help = '重新計算使用者統計摘要（UserStats），或以 --check 檢查增量更新的結果是否一致'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', nargs='+', default=None, help='只處理指定的使用者名稱')
+        parser.add_argument('--check', action='store_true', help='只比對不寫入，發現不一致時以錯誤結束')
+        parser.add_argument('--fix', action='store_true', help='搭配 --check：只重建不一致的使用者')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['users']:
+            users = users.filter(username__in=options['users'])
+            missing = set(options['users']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"使用者不存在: {', '.join(sorted(missing))}")
+
+        if not options['check']:
+            count = 0
+            for user in users.iterator():
+                rebuild_user_stats(user.id)
+                count += 1
+            self.stdout.write(self.style.SUCCESS(f"已重建 {count} 位使用者的統計"))
+            return
+
+        stats_by_user = UserStats.objects.in_bulk(list(users.values_list('id', flat=True)))
+        inconsistent = 0
+        for user in users.iterator():
+            stats = stats_by_user.get(user.id)
+            if stats is None:
+                # 尚未建立的統計會在第一次讀取時完整計算，不算不一致
+                continue
+            mismatches = check_user_stats(stats)
+            if not mismatches:
+                continue
+
+            inconsistent += 1
+            detail = '，'.join(f"{field} {current} -> {expected}" for field, (current, expected) in mismatches.items())
+            self.stdout.write(self.style.WARNING(f"{user.username}: {detail}"))
+            if options['fix']:
+                rebuild_user_stats(user.id)
+
+        if inconsistent and not options['fix']:
+            raise CommandError(f"{inconsistent} 位使用者的統計不一致，可加上 --fix 修正")
+        self.stdout.write(self.style.SUCCESS(
+            f"已檢查 {len(stats_by_user)} 筆統計，{inconsistent} 筆不一致" + ("（已修正）" if inconsistent else "")
+        ))
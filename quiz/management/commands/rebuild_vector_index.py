@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from quiz.vector_index import VECTOR_QUANTIZATIONS, rebuild_ann_index
+
+class Command(BaseCommand):
+    help = '重建知識片段的向量 ANN 索引（HNSW 或 IVFFlat）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=['hnsw', 'ivfflat'], default=settings.VECTOR_INDEX_TYPE,
+                            help='索引類型（預設取自 VECTOR_INDEX_TYPE）')
+        parser.add_argument('--m', type=int, default=16, help='HNSW 每層最大連結數')
+        parser.add_argument('--ef-construction', type=int, default=64, help='HNSW 建立時的候選數')
+        parser.add_argument('--lists', type=int, default=None, help='IVFFlat lists 數（預設依資料量計算）')
+        parser.add_argument('--quantization', choices=VECTOR_QUANTIZATIONS, default=settings.VECTOR_QUANTIZATION,
+                            help='索引量化方式（預設取自 VECTOR_QUANTIZATION）')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"重建 {options['type']} 索引中...")
+        with connection.cursor() as cursor:
+            lists = rebuild_ann_index(
+                cursor,
+                index_type=options['type'],
+                m=options['m'],
+                ef_construction=options['ef_construction'],
+                lists=options['lists'],
+                quantization=options['quantization'],
+            )
+
+        detail = f"lists = {lists}" if lists else f"m = {options['m']}, ef_construction = {options['ef_construction']}"
+        self.stdout.write(self.style.SUCCESS(f"已建立 {options['type']} 索引（{detail}）"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from quiz.job_queue import enqueue
+from quiz.models import IngestionJob, KnowledgeBase
+from quiz.tasks import ingest_knowledge_base
+
+class Command(BaseCommand):
+    help = '重新建立知識庫片段（例如更換切分策略後）；內容未變的片段沿用原向量，只編碼新內容'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kb', type=int, nargs='*', help='知識庫 ID（預設為全部）')
+        parser.add_argument('--sync', action='store_true', help='在目前行程中依序執行，不排入背景任務佇列')
+
+    def handle(self, *args, **options):
+        knowledge_bases = KnowledgeBase.objects.all()
+        if options['kb']:
+            knowledge_bases = knowledge_bases.filter(id__in=options['kb'])
+
+        for kb in knowledge_bases:
+            job = kb.ingestion_jobs.first()
+            if job and not job.is_finished:
+                self.stdout.write(self.style.WARNING(f"{kb.name}: 正在建立中，略過"))
+                continue
+
+            job = IngestionJob.objects.create(knowledge_base=kb)
+            if options['sync']:
+                chunk_count = ingest_knowledge_base(job_id=job.id)
+                self.stdout.write(f"{kb.name}: {chunk_count} 個片段")
+            else:
+                enqueue('ingest_knowledge_base', job_id=job.id)
+                self.stdout.write(f"{kb.name}: 已排入背景任務 {job.id}")
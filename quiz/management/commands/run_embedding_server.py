@@ -0,0 +1,41 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from quiz.embedding_server import create_server
+from quiz.rag_utils import EmbeddingService, warm_up_query_cache
+
+class Command(BaseCommand):
+    help = '啟動共用的嵌入模型伺服器（模型只載入一次，web 與 worker 透過 EMBEDDING_SERVER_URL 呼叫）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=settings.EMBEDDING_SERVER_URL or 'http://127.0.0.1:8001',
+                            help='監聽位址：http://host:port 或 unix:///path/to.sock（預設取自 EMBEDDING_SERVER_URL）')
+        parser.add_argument('--max-batch', type=int, default=settings.EMBEDDING_SERVER_MAX_BATCH,
+                            help='合併批次的最大文本數')
+        parser.add_argument('--max-wait-ms', type=float, default=settings.EMBEDDING_SERVER_MAX_WAIT_MS,
+                            help='第一個請求到達後等待合併的毫秒數')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"載入嵌入模型 {settings.EMBEDDING_MODEL}...")
+        start = time.perf_counter()
+        service = EmbeddingService()
+        if not service.is_available():
+            raise CommandError('Embedding 模型載入失敗')
+
+        # 預熱：第一次推論較慢，並預先計算固定查詢向量（有 Redis 時供所有行程共用）
+        warm_up_query_cache(service)
+        self.stdout.write(f"模型載入與預熱完成，耗時 {time.perf_counter() - start:.1f}s")
+
+        try:
+            server = create_server(options['url'], service, max_batch=options['max_batch'],
+                                   max_wait_ms=options['max_wait_ms'])
+        except (ValueError, OSError) as e:
+            raise CommandError(f"無法啟動嵌入伺服器: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"嵌入伺服器已啟動: {options['url']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('嵌入伺服器已停止')
+        finally:
+            server.server_close()
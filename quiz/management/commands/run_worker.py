@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from quiz.job_queue import run_worker
+
+class Command(BaseCommand):
+    help = '啟動背景任務 worker（從 Redis 佇列取出任務執行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-timeout', type=int, default=5, help='每次等待任務的秒數')
+        parser.add_argument('--max-jobs', type=int, default=None, help='處理指定數量的任務後結束（用於 worker 回收）')
+
+    def handle(self, *args, **options):
+        try:
+            processed = run_worker(
+                poll_timeout=options['poll_timeout'],
+                max_jobs=options['max_jobs']
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        except KeyboardInterrupt:
+            self.stdout.write('Worker 已停止')
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Worker 結束，共處理 {processed} 個任務'))
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', '排隊中'), ('running', '處理中'), ('completed', '已完成'), ('failed', '失敗')], default='queued', max_length=20, verbose_name='狀態')),
+                ('stage', models.CharField(choices=[('queued', '等待處理'), ('summarizing', '生成摘要'), ('embedding', '建立向量'), ('done', '完成')], default='queued', max_length=20, verbose_name='階段')),
+                ('total_chunks', models.IntegerField(default=0, verbose_name='片段總數')),
+                ('embedded_chunks', models.IntegerField(default=0, verbose_name='已嵌入片段數')),
+                ('error', models.TextField(blank=True, default='', verbose_name='錯誤訊息')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始時間')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='結束時間')),
+                ('embedding_started_at', models.DateTimeField(blank=True, null=True, verbose_name='嵌入開始時間')),
+                ('knowledge_base', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingestion_jobs', to='quiz.knowledgebase', verbose_name='知識庫')),
+            ],
+            options={
+                'verbose_name': '知識庫建立任務',
+                'verbose_name_plural': '知識庫建立任務',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:00
+
+import pgvector.django.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # HNSW 索引在大表上建立較久，使用 CONCURRENTLY 避免鎖住寫入
+    atomic = False
+
+    dependencies = [
+        ('quiz', '0002_ingestionjob'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='knowledgechunk',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='quiz_chunk_embedding_ann', opclasses=['vector_l2_ops']),
+        ),
+    ]
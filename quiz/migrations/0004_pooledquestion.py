@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0003_knowledgechunk_embedding_ann'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_type', models.CharField(max_length=20, verbose_name='題目類型')),
+                ('difficulty', models.CharField(max_length=20, verbose_name='難度')),
+                ('question_hash', models.CharField(max_length=64, verbose_name='題目雜湊值')),
+                ('question_data', models.JSONField(verbose_name='題目資料')),
+                ('times_served', models.IntegerField(default=0, verbose_name='出題次數')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('knowledge_base', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pooled_questions', to='quiz.knowledgebase', verbose_name='所屬知識庫')),
+            ],
+            options={
+                'verbose_name': '題庫題目',
+                'verbose_name_plural': '題庫題目',
+                'indexes': [models.Index(fields=['knowledge_base', 'question_type', 'difficulty'], name='quiz_pooled_knowled_d61bc3_idx')],
+                'unique_together': {('knowledge_base', 'question_hash')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0004_pooledquestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questionanswer',
+            name='grading_status',
+            field=models.CharField(choices=[('pending', '評分中'), ('graded', '已評分'), ('failed', '評分失敗')], default='graded', max_length=20, verbose_name='評分狀態'),
+        ),
+        migrations.AlterField(
+            model_name='questionanswer',
+            name='score',
+            field=models.IntegerField(blank=True, null=True, verbose_name='得分'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:22
+
+import hashlib
+import pgvector.django.vector
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    """為既有片段補上內容雜湊值，並將其向量寫入共用儲存"""
+    KnowledgeChunk = apps.get_model('quiz', 'KnowledgeChunk')
+
+    batch = []
+    for chunk in KnowledgeChunk.objects.filter(content_hash='').only('id', 'content').iterator(chunk_size=1000):
+        chunk.content_hash = hashlib.md5(chunk.content.encode('utf-8')).hexdigest()
+        batch.append(chunk)
+        if len(batch) >= 1000:
+            KnowledgeChunk.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        KnowledgeChunk.objects.bulk_update(batch, ['content_hash'])
+
+    # 零向量代表當時編碼失敗，不寫入共用儲存
+    schema_editor.execute(
+        """
+        INSERT INTO quiz_chunkembedding (content_hash, model_name, embedding, created_at)
+        SELECT DISTINCT ON (content_hash) content_hash, %s, embedding, NOW()
+        FROM quiz_knowledgechunk
+        WHERE content_hash <> '' AND vector_norm(embedding) > 0
+        ON CONFLICT (content_hash, model_name) DO NOTHING
+        """,
+        [settings.EMBEDDING_MODEL]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0005_questionanswer_grading_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgechunk',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=32, verbose_name='內容雜湊值'),
+        ),
+        migrations.CreateModel(
+            name='ChunkEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=32, verbose_name='內容雜湊值')),
+                ('model_name', models.CharField(max_length=200, verbose_name='嵌入模型')),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=768, verbose_name='向量嵌入')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+            ],
+            options={
+                'verbose_name': '片段向量',
+                'verbose_name_plural': '片段向量',
+                'unique_together': {('content_hash', 'model_name')},
+            },
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:30
+
+import quiz.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0006_chunkembedding_knowledgechunk_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='content_length',
+            field=models.IntegerField(default=0, verbose_name='內容字數'),
+        ),
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='source_file',
+            field=models.FileField(blank=True, storage=quiz.models.knowledge_upload_storage, upload_to='knowledge/%Y/%m/', verbose_name='原始檔案'),
+        ),
+        migrations.RunSQL(
+            "UPDATE quiz_knowledgebase SET content_length = char_length(content)",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:40
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # GIN 索引在大表上建立較久，使用 CONCURRENTLY 避免鎖住寫入
+    atomic = False
+
+    dependencies = [
+        ('quiz', '0007_knowledgebase_source_file_content_length'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='knowledgechunk',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['content'], name='quiz_chunk_content_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
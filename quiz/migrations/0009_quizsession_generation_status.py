@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0008_knowledgechunk_content_trgm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizsession',
+            name='generation_error',
+            field=models.TextField(blank=True, default='', verbose_name='生成錯誤訊息'),
+        ),
+        migrations.AddField(
+            model_name='quizsession',
+            name='generation_progress',
+            field=models.JSONField(blank=True, default=dict, verbose_name='生成進度'),
+        ),
+        migrations.AddField(
+            model_name='quizsession',
+            name='generation_status',
+            field=models.CharField(choices=[('pending', '等待生成'), ('generating', '生成中'), ('completed', '已完成'), ('failed', '生成失敗')], default='completed', max_length=20, verbose_name='題目生成狀態'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0009_quizsession_generation_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='quiz_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='使用者')),
+                ('total_sessions', models.IntegerField(default=0, verbose_name='會話總數')),
+                ('completed_sessions', models.IntegerField(default=0, verbose_name='完成會話數')),
+                ('custom_completed', models.IntegerField(default=0, verbose_name='自定義題目完成數')),
+                ('custom_scored', models.IntegerField(default=0, verbose_name='自定義題目已評分數')),
+                ('custom_score_sum', models.FloatField(default=0, verbose_name='自定義題目分數總和')),
+                ('flashcard_completed', models.IntegerField(default=0, verbose_name='閃卡完成數')),
+                ('flashcard_scored', models.IntegerField(default=0, verbose_name='閃卡已評分數')),
+                ('flashcard_score_sum', models.FloatField(default=0, verbose_name='閃卡分數總和')),
+                ('knowledge_bases', models.IntegerField(default=0, verbose_name='知識庫數量')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+            ],
+            options={
+                'verbose_name': '使用者統計',
+                'verbose_name_plural': '使用者統計',
+            },
+        ),
+    ]
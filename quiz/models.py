@@ -1,13 +1,23 @@
 from django.db import models
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.contrib.auth.models import User
-from pgvector.django import VectorField
+from django.contrib.postgres.indexes import GinIndex
+from pgvector.django import VectorField, HnswIndex
 import json
 
+def knowledge_upload_storage():
+    """上傳原始檔的儲存位置（不在 MEDIA_ROOT 下，避免被公開存取）"""
+    return FileSystemStorage(location=settings.KNOWLEDGE_UPLOAD_ROOT)
+
 class KnowledgeBase(models.Model):
     """知識庫模型"""
     name = models.CharField(max_length=200, verbose_name="知識庫名稱")
     summary = models.TextField(max_length=100, verbose_name="摘要")
-    content = models.TextField(verbose_name="原始內容")
+    content = models.TextField(verbose_name="原始內容")  # 有上傳檔時只保存開頭預覽
+    source_file = models.FileField(upload_to='knowledge/%Y/%m/', storage=knowledge_upload_storage,
+                                   blank=True, verbose_name="原始檔案")
+    content_length = models.IntegerField(default=0, verbose_name="內容字數")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="使用者")
 
@@ -19,12 +29,20 @@ class KnowledgeBase(models.Model):
     def __str__(self):
         return self.name
 
+    @property
+    def latest_ingestion_job(self):
+        """最近一次的背景建立任務（配合 prefetch_related('ingestion_jobs') 使用）"""
+        jobs = list(self.ingestion_jobs.all())
+        return jobs[0] if jobs else None
+
 class KnowledgeChunk(models.Model):
     """知識片段模型（用於向量檢索）"""
     knowledge_base = models.ForeignKey(KnowledgeBase, on_delete=models.CASCADE, 
                                      related_name='chunks', verbose_name="所屬知識庫")
     content = models.TextField(verbose_name="片段內容")
-    embedding = VectorField(dimensions=768, verbose_name="向量嵌入")  # jina-v2-base-zh 維度
+    content_hash = models.CharField(max_length=32, blank=True, db_index=True, verbose_name="內容雜湊值")
+    # jina-v2-base-zh 維度；halfvec / binary 量化由 convert_vector_storage 以 SQL 轉換，不納入遷移狀態
+    embedding = VectorField(dimensions=768, verbose_name="向量嵌入")
     chunk_index = models.IntegerField(verbose_name="片段索引")
 
     class Meta:
@@ -32,17 +50,118 @@ class KnowledgeChunk(models.Model):
         verbose_name_plural = "知識片段"
         indexes = [
             models.Index(fields=['knowledge_base', 'chunk_index']),
+            # 近似最近鄰索引（可用 rebuild_vector_index 指令改為 IVFFlat）
+            HnswIndex(
+                name='quiz_chunk_embedding_ann',
+                fields=['embedding'],
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_l2_ops'],
+            ),
+            # 關鍵字比對（混合檢索）使用的 trigram 索引，以字元為單位適用中文
+            GinIndex(
+                name='quiz_chunk_content_trgm',
+                fields=['content'],
+                opclasses=['gin_trgm_ops'],
+            ),
         ]
 
     def __str__(self):
         return f"{self.knowledge_base.name} - 片段 {self.chunk_index}"
 
+class ChunkEmbedding(models.Model):
+    """以內容雜湊為鍵的共用向量儲存（相同片段跨知識庫、跨使用者只編碼一次）"""
+    content_hash = models.CharField(max_length=32, verbose_name="內容雜湊值")
+    model_name = models.CharField(max_length=200, verbose_name="嵌入模型")
+    embedding = VectorField(dimensions=768, verbose_name="向量嵌入")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+
+    class Meta:
+        verbose_name = "片段向量"
+        verbose_name_plural = "片段向量"
+        unique_together = ['content_hash', 'model_name']
+
+    def __str__(self):
+        return f"{self.content_hash} ({self.model_name})"
+
+class IngestionJob(models.Model):
+    """知識庫背景建立任務（摘要 + 向量嵌入）"""
+    STATUS_CHOICES = [
+        ('queued', '排隊中'),
+        ('running', '處理中'),
+        ('completed', '已完成'),
+        ('failed', '失敗'),
+    ]
+    STAGE_CHOICES = [
+        ('queued', '等待處理'),
+        ('summarizing', '生成摘要'),
+        ('embedding', '建立向量'),
+        ('done', '完成'),
+    ]
+
+    knowledge_base = models.ForeignKey(KnowledgeBase, on_delete=models.CASCADE,
+                                       related_name='ingestion_jobs', verbose_name="知識庫")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', verbose_name="狀態")
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES, default='queued', verbose_name="階段")
+    total_chunks = models.IntegerField(default=0, verbose_name="片段總數")
+    embedded_chunks = models.IntegerField(default=0, verbose_name="已嵌入片段數")
+    error = models.TextField(blank=True, default='', verbose_name="錯誤訊息")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="開始時間")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="結束時間")
+    embedding_started_at = models.DateTimeField(null=True, blank=True, verbose_name="嵌入開始時間")
+
+    class Meta:
+        verbose_name = "知識庫建立任務"
+        verbose_name_plural = "知識庫建立任務"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.knowledge_base.name} - {self.get_stage_display()}"
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    def eta_seconds(self):
+        """依目前嵌入速度估算剩餘秒數"""
+        from django.utils import timezone
+
+        if self.is_finished:
+            return 0
+        if not self.embedding_started_at or not self.embedded_chunks or not self.total_chunks:
+            return None
+
+        elapsed = (timezone.now() - self.embedding_started_at).total_seconds()
+        rate = self.embedded_chunks / max(elapsed, 1e-6)
+        return round((self.total_chunks - self.embedded_chunks) / rate, 1)
+
+    def to_status_dict(self):
+        """狀態 API 回傳的資料"""
+        return {
+            'job_id': self.id,
+            'knowledge_base_id': self.knowledge_base_id,
+            'status': self.status,
+            'stage': self.stage,
+            'stage_display': self.get_stage_display(),
+            'total_chunks': self.total_chunks,
+            'embedded_chunks': self.embedded_chunks,
+            'eta_seconds': self.eta_seconds(),
+            'error': self.error,
+        }
+
 class QuizSession(models.Model):
     """答題會話模型"""
     QUIZ_TYPES = [
         ('custom', '自定義題目'),
         ('flashcard', '閃卡'),
     ]
+    GENERATION_STATUS_CHOICES = [
+        ('pending', '等待生成'),
+        ('generating', '生成中'),
+        ('completed', '已完成'),
+        ('failed', '生成失敗'),
+    ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="使用者")
     quiz_type = models.CharField(max_length=20, choices=QUIZ_TYPES, verbose_name="答題類型")
@@ -56,14 +175,29 @@ class QuizSession(models.Model):
     score = models.FloatField(null=True, blank=True, verbose_name="總分")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
     completed_at = models.DateTimeField(null=True, blank=True, verbose_name="完成時間")
+    # 背景生成題目的狀態與進度（同步生成的會話建立時即為已完成）
+    generation_status = models.CharField(max_length=20, choices=GENERATION_STATUS_CHOICES,
+                                         default='completed', verbose_name="題目生成狀態")
+    generation_progress = models.JSONField(default=dict, blank=True, verbose_name="生成進度")
+    generation_error = models.TextField(blank=True, default='', verbose_name="生成錯誤訊息")
 
     class Meta:
         verbose_name = "答題會話"
         verbose_name_plural = "答題會話"
         ordering = ['-created_at']
 
+    @property
+    def is_generating(self):
+        return self.generation_status in ('pending', 'generating')
+
 class QuestionAnswer(models.Model):
     """題目回答記錄"""
+    GRADING_STATUS_CHOICES = [
+        ('pending', '評分中'),
+        ('graded', '已評分'),
+        ('failed', '評分失敗'),
+    ]
+    
     session = models.ForeignKey(QuizSession, on_delete=models.CASCADE, 
                                related_name='answers', verbose_name="答題會話")
     question_index = models.IntegerField(verbose_name="題目索引")
@@ -71,7 +205,9 @@ class QuestionAnswer(models.Model):
     question_type = models.CharField(max_length=20, verbose_name="題目類型")
     correct_answer = models.TextField(verbose_name="正確答案")
     user_answer = models.TextField(verbose_name="使用者答案")
-    score = models.IntegerField(verbose_name="得分")  # 0-100
+    score = models.IntegerField(null=True, blank=True, verbose_name="得分")  # 0-100，背景評分完成前為空
+    grading_status = models.CharField(max_length=20, choices=GRADING_STATUS_CHOICES,
+                                      default='graded', verbose_name="評分狀態")
     answered_at = models.DateTimeField(auto_now_add=True, verbose_name="回答時間")
 
     class Meta:
@@ -93,6 +229,69 @@ class HistoryQuestion(models.Model):
         indexes = [
             models.Index(fields=['user', 'knowledge_base_ids']),
         ]
+
+class PooledQuestion(models.Model):
+    """預先生成的題庫題目（依知識庫、題型與難度分組）"""
+    knowledge_base = models.ForeignKey(KnowledgeBase, on_delete=models.CASCADE,
+                                       related_name='pooled_questions', verbose_name="所屬知識庫")
+    question_type = models.CharField(max_length=20, verbose_name="題目類型")
+    difficulty = models.CharField(max_length=20, verbose_name="難度")
+    question_hash = models.CharField(max_length=64, verbose_name="題目雜湊值")
+    question_data = models.JSONField(verbose_name="題目資料")
+    times_served = models.IntegerField(default=0, verbose_name="出題次數")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+
+    class Meta:
+        verbose_name = "題庫題目"
+        verbose_name_plural = "題庫題目"
+        unique_together = ['knowledge_base', 'question_hash']
+        indexes = [
+            models.Index(fields=['knowledge_base', 'question_type', 'difficulty']),
+        ]
+
+    def __str__(self):
+        return f"{self.knowledge_base.name} - {self.question_type} ({self.difficulty})"
+
+class UserStats(models.Model):
+    """使用者統計摘要（會話完成、知識庫增刪時增量更新，首頁與個人頁面只需一次主鍵查詢）"""
+    QUIZ_TYPES = ['custom', 'flashcard']
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='quiz_stats', verbose_name="使用者")
+    total_sessions = models.IntegerField(default=0, verbose_name="會話總數")
+    completed_sessions = models.IntegerField(default=0, verbose_name="完成會話數")
+    # 平均分數以總和 / 已評分數計算，增量更新時不需重新彙總
+    custom_completed = models.IntegerField(default=0, verbose_name="自定義題目完成數")
+    custom_scored = models.IntegerField(default=0, verbose_name="自定義題目已評分數")
+    custom_score_sum = models.FloatField(default=0, verbose_name="自定義題目分數總和")
+    flashcard_completed = models.IntegerField(default=0, verbose_name="閃卡完成數")
+    flashcard_scored = models.IntegerField(default=0, verbose_name="閃卡已評分數")
+    flashcard_score_sum = models.FloatField(default=0, verbose_name="閃卡分數總和")
+    knowledge_bases = models.IntegerField(default=0, verbose_name="知識庫數量")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    class Meta:
+        verbose_name = "使用者統計"
+        verbose_name_plural = "使用者統計"
+
+    def __str__(self):
+        return f"{self.user.username} 的統計"
+
+    def average(self, quiz_type=None):
+        """平均分數（未評分的會話不計入），quiz_type 為 None 時為所有類型"""
+        quiz_types = [quiz_type] if quiz_type else self.QUIZ_TYPES
+        scored = sum(getattr(self, f'{t}_scored') for t in quiz_types)
+        score_sum = sum(getattr(self, f'{t}_score_sum') for t in quiz_types)
+        return score_sum / scored if scored else 0
+
+    @property
+    def avg_score(self):
+        return self.average()
+
+    @property
+    def flashcard_avg_score(self):
+        return self.average('flashcard')
+
 class AIModel(models.Model):
     """AI 模型配置"""
     MODEL_TYPES = [
@@ -138,9 +337,9 @@ class AIModel(models.Model):
     def _test_ollama_connection(self):
         """測試 Ollama 連線"""
         try:
-            from ollama import chat
+            from .llm_clients import get_ollama_client
             
-            response = chat(
+            response = get_ollama_client(self.base_url).chat(
                 model=self.model_id,
                 messages=[{'role': 'user', 'content': 'test'}],
                 options={'temperature': 0.1}
@@ -152,12 +351,12 @@ class AIModel(models.Model):
     def _test_gemini_connection(self):
         """測試 Gemini 連線"""
         try:
-            from google import genai
+            from .llm_clients import get_gemini_client
             
             if not self.api_key:
                 return False, "缺少 API 金鑰"
             
-            client = genai.Client(api_key=self.api_key)
+            client = get_gemini_client(self.api_key)
             response = client.models.generate_content(
                 model=self.model_id,
                 contents="test"
@@ -166,20 +365,103 @@ class AIModel(models.Model):
         except Exception as e:
             return False, f"Gemini 連線失敗: {str(e)}"
     
-    def generate_content(self, prompt):
-        """生成內容"""
+    async def atest_connection(self):
+        """test_connection 的非同步版本"""
+        try:
+            if self.model_type == 'ollama':
+                return await self._atest_ollama_connection()
+            elif self.model_type == 'gemini':
+                return await self._atest_gemini_connection()
+            return False, "不支援的模型類型"
+        except Exception as e:
+            return False, str(e)
+    
+    async def _atest_ollama_connection(self):
+        """非同步測試 Ollama 連線"""
+        try:
+            from .llm_clients import get_async_ollama_client
+            
+            await get_async_ollama_client(self.base_url).chat(
+                model=self.model_id,
+                messages=[{'role': 'user', 'content': 'test'}],
+                options={'temperature': 0.1}
+            )
+            return True, "連線成功"
+        except Exception as e:
+            return False, f"Ollama 連線失敗: {str(e)}"
+    
+    async def _atest_gemini_connection(self):
+        """非同步測試 Gemini 連線"""
+        try:
+            from .llm_clients import get_async_gemini_client
+            
+            if not self.api_key:
+                return False, "缺少 API 金鑰"
+            
+            await get_async_gemini_client(self.api_key).models.generate_content(
+                model=self.model_id,
+                contents="test"
+            )
+            return True, "連線成功"
+        except Exception as e:
+            return False, f"Gemini 連線失敗: {str(e)}"
+    
+    def generate_content(self, prompt, cache_site=None):
+        """生成內容；結果可重複使用的呼叫位置（如評分、解析）傳入 cache_site 以使用 LLM 回應快取"""
+        from .llm_cache import cached_generate
+        
+        if self.model_type == 'ollama':
+            generate = lambda: self._generate_with_ollama(prompt)
+        elif self.model_type == 'gemini':
+            generate = lambda: self._generate_with_gemini(prompt)
+        else:
+            raise ValueError("不支援的模型類型")
+        
+        if cache_site is None:
+            return generate()
+        cache_model = f"{self.model_type}:{self.base_url or ''}:{self.model_id}"
+        return cached_generate(cache_site, prompt, cache_model, self.temperature, generate)
+    
+    async def agenerate_content(self, prompt, cache_site=None):
+        """generate_content 的非同步版本，等待模型回應時不佔用執行緒"""
+        from .llm_cache import acached_generate
+        
+        if self.model_type == 'ollama':
+            agenerate = lambda: self._agenerate_with_ollama(prompt)
+        elif self.model_type == 'gemini':
+            agenerate = lambda: self._agenerate_with_gemini(prompt)
+        else:
+            raise ValueError("不支援的模型類型")
+        
+        if cache_site is None:
+            return await agenerate()
+        cache_model = f"{self.model_type}:{self.base_url or ''}:{self.model_id}"
+        return await acached_generate(cache_site, prompt, cache_model, self.temperature, agenerate)
+    
+    def generate_content_stream(self, prompt):
+        """串流生成內容，逐段產生文字"""
+        if self.model_type == 'ollama':
+            return self._stream_with_ollama(prompt)
+        elif self.model_type == 'gemini':
+            return self._stream_with_gemini(prompt)
+        else:
+            raise ValueError("不支援的模型類型")
+    
+    def agenerate_content_stream(self, prompt):
+        """非同步串流生成內容，返回逐段產生文字的非同步迭代器"""
         if self.model_type == 'ollama':
-            return self._generate_with_ollama(prompt)
+            return self._astream_with_ollama(prompt)
         elif self.model_type == 'gemini':
-            return self._generate_with_gemini(prompt)
+            return self._astream_with_gemini(prompt)
         else:
             raise ValueError("不支援的模型類型")
     
     def _generate_with_ollama(self, prompt):
         """使用 Ollama 生成內容"""
-        from ollama import chat
+        from .llm_clients import get_ollama_client, call_with_retry
         
-        response = chat(
+        response = call_with_retry(
+            get_ollama_client(self.base_url).chat,
             model=self.model_id,
             messages=[{'role': 'user', 'content': prompt}],
             options={
@@ -191,18 +473,114 @@ class AIModel(models.Model):
     
     def _generate_with_gemini(self, prompt):
         """使用 Gemini 生成內容"""
-        from google import genai
+        from .llm_clients import get_gemini_client, call_with_retry
         
         if not self.api_key:
             raise ValueError("缺少 API 金鑰")
         
-        client = genai.Client(api_key=self.api_key)
-        response = client.models.generate_content(
+        client = get_gemini_client(self.api_key)
+        response = call_with_retry(
+            client.models.generate_content,
             model=self.model_id,
             contents=prompt
         )
         return response.text
 
+    async def _agenerate_with_ollama(self, prompt):
+        """使用 Ollama 非同步生成內容"""
+        from .llm_clients import get_async_ollama_client, acall_with_retry
+        
+        response = await acall_with_retry(
+            get_async_ollama_client(self.base_url).chat,
+            model=self.model_id,
+            messages=[{'role': 'user', 'content': prompt}],
+            options={
+                'temperature': self.temperature,
+                'max_tokens': self.max_tokens
+            }
+        )
+        return response['message']['content']
+    
+    async def _agenerate_with_gemini(self, prompt):
+        """使用 Gemini 非同步生成內容"""
+        from .llm_clients import get_async_gemini_client, acall_with_retry
+        
+        if not self.api_key:
+            raise ValueError("缺少 API 金鑰")
+        
+        response = await acall_with_retry(
+            get_async_gemini_client(self.api_key).models.generate_content,
+            model=self.model_id,
+            contents=prompt
+        )
+        return response.text
+
+    def _stream_with_ollama(self, prompt):
+        """使用 Ollama 串流生成內容"""
+        from .llm_clients import get_ollama_client
+        
+        stream = get_ollama_client(self.base_url).chat(
+            model=self.model_id,
+            messages=[{'role': 'user', 'content': prompt}],
+            options={
+                'temperature': self.temperature,
+                'max_tokens': self.max_tokens
+            },
+            stream=True
+        )
+        for chunk in stream:
+            content = chunk['message']['content']
+            if content:
+                yield content
+    
+    def _stream_with_gemini(self, prompt):
+        """使用 Gemini 串流生成內容"""
+        from .llm_clients import get_gemini_client
+        
+        if not self.api_key:
+            raise ValueError("缺少 API 金鑰")
+        
+        client = get_gemini_client(self.api_key)
+        for chunk in client.models.generate_content_stream(
+            model=self.model_id,
+            contents=prompt
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    async def _astream_with_ollama(self, prompt):
+        """使用 Ollama 非同步串流生成內容"""
+        from .llm_clients import get_async_ollama_client
+        
+        stream = await get_async_ollama_client(self.base_url).chat(
+            model=self.model_id,
+            messages=[{'role': 'user', 'content': prompt}],
+            options={
+                'temperature': self.temperature,
+                'max_tokens': self.max_tokens
+            },
+            stream=True
+        )
+        async for chunk in stream:
+            content = chunk['message']['content']
+            if content:
+                yield content
+    
+    async def _astream_with_gemini(self, prompt):
+        """使用 Gemini 非同步串流生成內容"""
+        from .llm_clients import get_async_gemini_client
+        
+        if not self.api_key:
+            raise ValueError("缺少 API 金鑰")
+        
+        stream = await get_async_gemini_client(self.api_key).models.generate_content_stream(
+            model=self.model_id,
+            contents=prompt
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
 class UserModelPreference(models.Model):
     """使用者模型偏好設定"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name="使用者")
@@ -220,4 +598,21 @@ class UserModelPreference(models.Model):
         verbose_name_plural = "使用者模型偏好"
 
     def __str__(self):
-        return f"{self.user.username} 的模型偏好"
\ No newline at end of file
+        return f"{self.user.username} 的模型偏好"
+
+def get_user_default_model(user):
+    """獲取使用者的預設模型"""
+    try:
+        preference = UserModelPreference.objects.get(user=user)
+        if preference.default_model and preference.default_model.is_available:
+            return preference.default_model
+    except UserModelPreference.DoesNotExist:
+        pass
+    
+    # 如果沒有預設模型，返回第一個可用的模型
+    available_model = AIModel.objects.filter(
+        user=user, 
+        is_available=True
+    ).first()
+    
+    return available_model
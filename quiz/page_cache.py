@@ -0,0 +1,60 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# 頁面片段依使用者與資料範圍快取；資料異動時由 signals 遞增該範圍的版本號，舊片段自然失效
+SCOPE_KNOWLEDGE_BASES = 'knowledge_bases'
+SCOPE_QUIZZES = 'quizzes'
+SCOPE_MODELS = 'models'
+
+def version_key(user_id, scope):
+    return f"quiz:version:{user_id}:{scope}"
+
+def get_cache_version(user_id, *scopes):
+    """取得使用者各範圍的版本號，組成 {% cache %} 的鍵值"""
+    keys = [version_key(user_id, scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # 版本號被逐出時以目前時間重新起算，不會與先前快取的片段相同
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+def bump_cache_version(user_id, *scopes):
+    """使用者資料異動後遞增版本號，使相關片段失效
+
+    在交易提交後才遞增，避免其他請求在提交前以新版本號快取到舊資料
+    """
+    def bump():
+        for scope in scopes:
+            try:
+                cache.incr(version_key(user_id, scope))
+            except ValueError:
+                # 尚未讀取過（沒有版本號）時不需處理，下次讀取會建立新的版本號
+                pass
+
+    transaction.on_commit(bump)
+
+def fragment_cache_context(user, *scopes):
+    """模板 {% cache %} 所需的逾時秒數與版本號（停用時逾時為 0，不寫入快取）"""
+    if not settings.PAGE_CACHE_ENABLED:
+        return {'cache_timeout': 0, 'cache_version': ''}
+    return {
+        'cache_timeout': settings.PAGE_CACHE_TIMEOUT,
+        'cache_version': get_cache_version(user.pk, *scopes),
+    }
+
+def get_cached_ollama_models(client, refresh=False):
+    """快取 Ollama 模型清單（依服務位址）；取得失敗的空清單不快取，服務恢復後即可重新取得"""
+    key = f"quiz:ollama_models:{client.base_url}"
+    if not refresh:
+        models = cache.get(key)
+        if models is not None:
+            return models
+
+    models = client.get_models()
+    if models:
+        cache.set(key, models, settings.OLLAMA_MODELS_CACHE_TIMEOUT)
+    return models
@@ -0,0 +1,138 @@
+import math
+import logging
+from django.conf import settings
+from django.db.models import F
+from .models import KnowledgeBase, PooledQuestion, HistoryQuestion, get_user_default_model
+from .utils import generate_prompt
+from .rag_utils import get_relevant_content, generate_content_hash
+from .generation import generate_questions_parallel
+
+logger = logging.getLogger(__name__)
+
+POOL_QUESTION_TYPES = ['multiple_choice', 'true_false', 'short_answer', 'essay']
+POOL_DIFFICULTIES = ['easy', 'medium', 'hard']
+
+def unseen_questions(user, queryset=None):
+    """排除使用者已作答過（已記錄於 HistoryQuestion）的題庫題目"""
+    queryset = PooledQuestion.objects.all() if queryset is None else queryset
+    return queryset.exclude(
+        question_hash__in=HistoryQuestion.objects.filter(user=user).values('question_hash')
+    )
+
+def fill_pool(knowledge_base, model=None, question_types=None, difficulties=None, target=None):
+    """為知識庫補足每個（題型, 難度）分組中使用者尚未作答的題目，返回新增題數"""
+    model = model or get_user_default_model(knowledge_base.user)
+    if not model:
+        logger.warning(f"知識庫 {knowledge_base.name} 的使用者沒有可用模型，略過題庫生成")
+        return 0
+
+    target = target or settings.QUESTION_POOL_TARGET
+    added = 0
+
+    for question_type in question_types or POOL_QUESTION_TYPES:
+        content = get_relevant_content([knowledge_base.id], question_type)
+        if not content:
+            logger.warning(f"知識庫 {knowledge_base.name} 沒有可用片段，略過題庫生成")
+            return added
+
+        for difficulty in difficulties or POOL_DIFFICULTIES:
+            group = PooledQuestion.objects.filter(
+                knowledge_base=knowledge_base,
+                question_type=question_type,
+                difficulty=difficulty
+            )
+            need = target - unseen_questions(knowledge_base.user, group).count()
+            if need <= 0:
+                continue
+
+            # 以現有題目作為歷史，避免生成重複內容
+            existing = [{
+                'question_text': q['question_text'],
+                'question_type': q['question_type']
+            } for q in group.order_by('-created_at').values_list('question_data', flat=True)[:20]]
+
+            def build_prompt(count, history):
+                return generate_prompt(
+                    count=count,
+                    question_types=question_type,
+                    difficulty=difficulty,
+                    content=content,
+                    history=(existing + history)[-20:]
+                )
+
+            try:
+                questions = generate_questions_parallel(model, need, build_prompt)
+            except Exception as e:
+                logger.error(f"知識庫 {knowledge_base.name} 題庫生成失敗（{question_type}/{difficulty}）: {e}")
+                continue
+
+            # ignore_conflicts 時 bulk_create 會返回所有物件（含因重複而未寫入的），以寫入前後的題數計算實際新增數
+            before = group.count()
+            PooledQuestion.objects.bulk_create([
+                PooledQuestion(
+                    knowledge_base=knowledge_base,
+                    question_type=question['question_type'],
+                    difficulty=difficulty,
+                    question_hash=generate_content_hash(question['question_text']),
+                    question_data=question
+                ) for question in questions if question['question_type'] == question_type
+            ], ignore_conflicts=True)
+            added += group.count() - before
+
+    logger.info(f"知識庫 {knowledge_base.name} 題庫新增 {added} 題")
+    return added
+
+def sample_from_pool(user, knowledge_base_ids, question_types, difficulty, count):
+    """從題庫抽題：排除使用者已作答過的題目，優先抽出題次數少的題目，各題型平均分配"""
+    types = [t.strip() for t in question_types.split(',') if t.strip()]
+    if not types or count <= 0:
+        return []
+
+    candidates = unseen_questions(user, PooledQuestion.objects.filter(
+        knowledge_base_id__in=knowledge_base_ids,
+        knowledge_base__user=user,
+        difficulty=difficulty
+    ))
+
+    quota = math.ceil(count / len(types))
+    picked = []
+    picked_hashes = set()
+    for question_type in types:
+        for pooled in candidates.filter(question_type=question_type).order_by('times_served', '?')[:quota]:
+            if pooled.question_hash not in picked_hashes:
+                picked.append(pooled)
+                picked_hashes.add(pooled.question_hash)
+
+    # 某題型不足時由其他題型補上
+    if len(picked) < count:
+        for pooled in candidates.exclude(id__in=[p.id for p in picked]).filter(
+            question_type__in=types
+        ).order_by('times_served', '?')[:count - len(picked)]:
+            if pooled.question_hash not in picked_hashes:
+                picked.append(pooled)
+                picked_hashes.add(pooled.question_hash)
+
+    picked = picked[:count]
+    PooledQuestion.objects.filter(id__in=[p.id for p in picked]).update(times_served=F('times_served') + 1)
+    return [p.question_data for p in picked]
+
+def needs_refill(user, knowledge_base_ids, question_types, difficulty):
+    """題庫中任一請求分組的未作答題數低於補充門檻時返回 True"""
+    threshold = settings.QUESTION_POOL_REFILL_THRESHOLD
+    types = [t.strip() for t in question_types.split(',') if t.strip()]
+    for kb_id in knowledge_base_ids:
+        for question_type in types:
+            if unseen_questions(user, PooledQuestion.objects.filter(
+                knowledge_base_id=kb_id,
+                question_type=question_type,
+                difficulty=difficulty
+            )).count() < threshold:
+                return True
+    return False
+
+def refill_pool_async(knowledge_base_ids):
+    """排入背景補充題庫的任務"""
+    from .job_queue import enqueue
+
+    for kb_id in KnowledgeBase.objects.filter(id__in=knowledge_base_ids).values_list('id', flat=True):
+        enqueue('fill_question_pool', knowledge_base_id=kb_id)
@@ -1,19 +1,125 @@
-import torch
 import numpy as np
-from transformers import AutoModel
 from django.conf import settings
-from django.db import connection
-from .models import KnowledgeBase, KnowledgeChunk
+from django.db import connection, transaction
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from .models import KnowledgeBase, KnowledgeChunk, ChunkEmbedding
+from .cache_utils import LRUCache, get_redis_client
+from .chunking import SentenceChunker, get_chunker, iter_batches
+from .embedding_backends import get_embedding_backend
+from .vector_index import ann_index_target, ann_query_expression, needs_rerank
+import codecs
 import hashlib
-import re
+import time
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+# 各題型用於檢索的固定查詢
+TYPE_QUERIES = {
+    'multiple_choice': '選擇題 概念 定義',
+    'true_false': '判斷 對錯 是非',
+    'short_answer': '簡答 解釋 說明',
+    'essay': '論述 分析 評論'
+}
+
+class EmbeddingCache:
+    """查詢向量快取：行程內 LRU + 可選的 Redis 共享層
+    
+    以「模型名稱 + 文本雜湊」為鍵；固定查詢可釘選（不過期、不被淘汰）
+    """
+    
+    def __init__(self, model_name, max_size=1024, ttl=3600, redis_url=None):
+        self.model_name = model_name
+        self.ttl = ttl
+        self.local = LRUCache(max_size=max_size, ttl=ttl)
+        self.redis = get_redis_client(redis_url)
+        self.hits = 0
+        self.misses = 0
+        self.redis_hits = 0
+        self._pinned = {}
+    
+    def make_key(self, text):
+        text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return f"quiz:emb:{self.model_name}:{text_hash}"
+    
+    def get(self, text):
+        key = self.make_key(text)
+        vector = self._pinned.get(key)
+        if vector is None:
+            vector = self.local.get(key)
+        if vector is None and self.redis is not None:
+            vector = self._get_shared(key)
+            if vector is not None:
+                # 共享層命中時回填行程內快取
+                self.redis_hits += 1
+                self.local.set(key, vector)
+        
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return vector
+    
+    def _get_shared(self, key):
+        try:
+            data = self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"讀取 Redis 向量快取失敗: {e}")
+            return None
+        if data is None:
+            return None
+        return np.frombuffer(data, dtype=np.float32).copy()
+    
+    def set(self, text, vector, pin=False):
+        key = self.make_key(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        if pin:
+            self._pinned[key] = vector
+        else:
+            self.local.set(key, vector)
+        
+        if self.redis is not None:
+            try:
+                if pin or not self.ttl:
+                    self.redis.set(key, vector.tobytes())
+                else:
+                    self.redis.setex(key, self.ttl, vector.tobytes())
+            except Exception as e:
+                logger.warning(f"寫入 Redis 向量快取失敗: {e}")
+    
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0,
+            'redis_hits': self.redis_hits,
+            'size': len(self.local),
+            'pinned': len(self._pinned),
+        }
+
+_embedding_cache = None
+
+def get_embedding_cache():
+    """取得行程共用的查詢向量快取"""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(
+            settings.EMBEDDING_MODEL,
+            max_size=settings.EMBEDDING_CACHE_SIZE,
+            ttl=settings.EMBEDDING_CACHE_TTL,
+            redis_url=settings.REDIS_URL if settings.EMBEDDING_CACHE_REDIS else None
+        )
+    return _embedding_cache
+
 class EmbeddingService:
-    """向量嵌入服務"""
+    """向量嵌入服務（推論後端由 EMBEDDING_BACKEND 選擇：torch 或 onnx）"""
     _instance = None
     _model = None
+    _tokenizer = None
+    _load_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
@@ -21,148 +127,394 @@ class EmbeddingService:
         return cls._instance
     
     def __init__(self):
+        # 多執行緒 worker 的第一批請求可能同時建立服務，避免重複載入模型
+        with self._load_lock:
+            self._load()
+    
+    def _load(self):
         if self._model is None:
             try:
                 # 載入 Jina 嵌入模型
-                self._model = AutoModel.from_pretrained(
-                    settings.EMBEDDING_MODEL,
-                    trust_remote_code=True,
-                    torch_dtype=torch.bfloat16
-                )
-                logger.info("Embedding 模型載入成功")
+                self._model = get_embedding_backend()
+                logger.info(f"Embedding 模型載入成功（{self._model.name} 後端）")
             except Exception as e:
                 logger.error(f"Embedding 模型載入失敗: {e}")
                 self._model = None
+        
+        if self._tokenizer is None:
+            try:
+                # 分詞器僅用於計算 token 長度以便分桶（transformers 在第一次使用時才匯入）
+                from transformers import AutoTokenizer
+                
+                self._tokenizer = AutoTokenizer.from_pretrained(settings.EMBEDDING_MODEL)
+            except Exception as e:
+                logger.warning(f"Embedding 分詞器載入失敗，改用字元長度分桶: {e}")
+                self._tokenizer = None
+    
+    def is_available(self):
+        """模型是否已載入"""
+        return self._model is not None
+    
+    def _zeros(self, count):
+        """預設向量（768維度的零向量）"""
+        return np.zeros((count, 768), dtype=np.float32)
+    
+    def _encode(self, texts):
+        """批次編碼，固定返回二維 numpy 數組"""
+        if self._model is None:
+            return self._zeros(len(texts))
+        
+        try:
+            return self._model.encode(texts)
+        except Exception as e:
+            logger.error(f"文本編碼失敗: {e}")
+            return self._zeros(len(texts))
     
     def encode(self, texts):
         """文本轉向量"""
         if self._model is None:
             logger.warning("Embedding 模型未載入，返回預設向量")
-            # 返回預設向量（768維度的零向量）
-            if isinstance(texts, str):
-                return np.zeros(768, dtype=np.float32)
-            else:
-                return np.zeros((len(texts), 768), dtype=np.float32)
         
-        if isinstance(texts, str):
+        single = isinstance(texts, str)
+        if single:
             texts = [texts]
         
+        embeddings = self._encode(texts)
+        return embeddings[0] if single or len(texts) == 1 else embeddings
+    
+    def encode_query(self, text):
+        """查詢文本轉向量（經過查詢向量快取）"""
+        cache = get_embedding_cache()
+        vector = cache.get(text)
+        if vector is not None:
+            return vector
+        
+        vector = self.encode(text)
+        # 模型未載入時的零向量不快取，避免之後一直命中無效結果
+        if vector.any():
+            cache.set(text, vector, pin=text in TYPE_QUERIES.values())
+        return vector
+    
+    def count_tokens(self, texts, add_special_tokens=True):
+        """計算每段文本的 token 長度（分詞器不可用時以字元數代替）"""
+        if self._tokenizer is None:
+            return [len(text) for text in texts]
         try:
-            with torch.no_grad():
-                embeddings = self._model.encode(texts)
-                
-            # 確保返回 numpy 數組
-            if torch.is_tensor(embeddings):
-                embeddings = embeddings.cpu().numpy()
-            
-            # 確保數據類型為 float32
-            embeddings = embeddings.astype(np.float32)
-            
-            return embeddings if len(texts) > 1 else embeddings[0]
+            encoded = self._tokenizer(texts, add_special_tokens=add_special_tokens, truncation=False)
+            return [len(ids) for ids in encoded['input_ids']]
         except Exception as e:
-            logger.error(f"文本編碼失敗: {e}")
-            # 返回預設向量
-            if len(texts) == 1:
-                return np.zeros(768, dtype=np.float32)
-            else:
-                return np.zeros((len(texts), 768), dtype=np.float32)
+            logger.warning(f"計算 token 長度失敗，改用字元長度: {e}")
+            return [len(text) for text in texts]
+    
+    def encode_batch(self, texts, batch_size=None, progress_callback=None, log_stats=True):
+        """依 token 長度排序分桶後批次編碼，返回與輸入順序一致的二維數組
+        
+        progress_callback(已完成數, 總數) 會在每個批次完成後呼叫；
+        log_stats=False 時不記錄吞吐量（嵌入伺服器處理大量小批次時使用）
+        """
+        if not texts:
+            return self._zeros(0)
+        
+        batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        if self._model is None:
+            logger.warning("Embedding 模型未載入，返回預設向量")
+            return self._zeros(len(texts))
+        
+        # 長度相近的文本放在同一批，減少 padding 浪費
+        lengths = self.count_tokens(texts)
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        
+        embeddings = self._zeros(len(texts))
+        start_time = time.perf_counter()
+        padded_tokens = 0
+        
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            embeddings[bucket] = self._encode([texts[i] for i in bucket])
+            padded_tokens += lengths[bucket[-1]] * len(bucket)
+            if progress_callback:
+                progress_callback(min(start + batch_size, len(texts)), len(texts))
+        
+        if not log_stats:
+            return embeddings
+        
+        elapsed = max(time.perf_counter() - start_time, 1e-6)
+        throughput = len(texts) / elapsed
+        padding_ratio = 1 - sum(lengths) / padded_tokens if padded_tokens else 0
+        logger.info(
+            f"批次嵌入完成：{len(texts)} 個片段，批次大小 {batch_size}，"
+            f"耗時 {elapsed:.2f}s，吞吐量 {throughput:.1f} chunks/sec，padding 比例 {padding_ratio:.1%}"
+        )
+        if throughput < settings.EMBEDDING_TARGET_THROUGHPUT:
+            logger.warning(
+                f"嵌入吞吐量 {throughput:.1f} chunks/sec 低於目標 "
+                f"{settings.EMBEDDING_TARGET_THROUGHPUT} chunks/sec"
+            )
+        
+        return embeddings
 
-def split_text(text, chunk_size=500, overlap=50):
-    """文本分割成片段"""
-    sentences = re.split(r'[。！？\n]', text)
-    chunks = []
-    current_chunk = ""
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-            
-        if len(current_chunk) + len(sentence) < chunk_size:
-            current_chunk += sentence + "。"
-        else:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            current_chunk = sentence + "。"
+def get_embedding_service():
+    """取得嵌入服務：設定 EMBEDDING_SERVER_URL 時呼叫共用的嵌入伺服器，否則在本行程載入模型"""
+    if settings.EMBEDDING_SERVER_URL:
+        from .embedding_server import get_remote_embedding_service
+        return get_remote_embedding_service(settings.EMBEDDING_SERVER_URL)
+    return EmbeddingService()
+
+def iter_text_blocks(file, block_size=1024 * 1024, encoding='utf-8'):
+    """逐段讀取並解碼檔案（增量解碼器可處理跨區塊的多位元組字元，編碼錯誤時拋出 UnicodeDecodeError）"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    while True:
+        data = file.read(block_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+def split_text(text, chunk_size=500):
+    """文本分割成片段（以字元計算長度的句子切分，新的建立流程改用 get_chunker）"""
+    return list(SentenceChunker(chunk_size).iter_chunks([text]))
+
+def inspect_text_upload(uploaded_file, preview_chars=5000):
+    """以串流方式檢查上傳檔是否為 UTF-8，返回 (開頭預覽, 總字數)，讀取後將檔案指標移回開頭"""
+    preview = []
+    preview_length = 0
+    content_length = 0
     
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+    for block in iter_text_blocks(uploaded_file):
+        if preview_length < preview_chars:
+            preview.append(block[:preview_chars - preview_length])
+            preview_length += len(preview[-1])
+        content_length += len(block)
     
-    return [chunk for chunk in chunks if len(chunk) > 10]  # 過濾太短的片段
+    uploaded_file.seek(0)
+    return ''.join(preview), content_length
+
+def iter_knowledge_base_text(knowledge_base):
+    """逐段讀取知識庫原始內容：有上傳檔時從檔案串流讀取，否則使用資料庫中的內容"""
+    if knowledge_base.source_file:
+        with knowledge_base.source_file.open('rb') as f:
+            yield from iter_text_blocks(f)
+    else:
+        yield knowledge_base.content
+
+def load_stored_embeddings(content_hashes):
+    """從共用向量儲存取出已編碼的片段向量，返回 {內容雜湊: 向量}"""
+    stored = ChunkEmbedding.objects.filter(
+        content_hash__in=set(content_hashes),
+        model_name=settings.EMBEDDING_MODEL
+    ).values_list('content_hash', 'embedding')
+    return {content_hash: np.asarray(embedding, dtype=np.float32) for content_hash, embedding in stored}
 
-def create_embeddings(knowledge_base):
-    """為知識庫建立向量嵌入"""
+def iter_chunk_batches(knowledge_base):
+    """逐批切分知識庫內容，返回 [(片段索引, 內容, 內容雜湊)]；相同內容每次切分結果相同"""
+    chunks = enumerate(get_chunker().iter_chunks(iter_knowledge_base_text(knowledge_base)))
+    for batch in iter_batches(chunks, settings.EMBEDDING_INGEST_BATCH):
+        yield [(i, text, generate_content_hash(text)) for i, text in batch]
+
+def create_embeddings(knowledge_base, progress_callback=None):
+    """為知識庫建立向量嵌入（串流、增量更新），新建與重新建立共用
+    
+    分兩階段進行，記憶體用量不隨檔案大小增加：
+    1. 逐批切分並只編碼共用儲存中沒有的內容，寫入 ChunkEmbedding（可重複執行，中斷時不影響既有片段）
+    2. 在單一交易中以內容雜湊比對既有片段：內容未變的保留（只更新索引）、新增其餘片段並刪除不再需要的舊片段，
+       失敗時回滾，知識庫維持原本的片段
+    progress_callback(已完成數, 預估總數) 用於回報編碼進度（背景任務使用）
+    """
     try:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
+        # 片段向量與共用儲存中目前模型的向量相同時才可沿用：
+        # 更換 EMBEDDING_MODEL 或編碼失敗（零向量）的片段都會重建
+        chunks = KnowledgeChunk.objects.filter(knowledge_base=knowledge_base).alias(
+            current=RawSQL(
+                f"""EXISTS (
+                    SELECT 1 FROM quiz_chunkembedding ce
+                    WHERE ce.content_hash = quiz_knowledgechunk.content_hash AND ce.model_name = %s
+                      AND ce.embedding::{settings.VECTOR_STORAGE} = quiz_knowledgechunk.embedding
+                )""",
+                [settings.EMBEDDING_MODEL], output_field=BooleanField()
+            )
+        )
         
-        # 分割文本
-        chunks = split_text(knowledge_base.content)
+        # 既有片段依內容雜湊分組（只保存 ID 與索引）
+        existing = {}
+        for chunk_id, content_hash, chunk_index in chunks.filter(current=True).values_list(
+            'id', 'content_hash', 'chunk_index'
+        ):
+            existing.setdefault(content_hash, []).append((chunk_id, chunk_index))
+        stale_ids = list(chunks.filter(current=False).values_list('id', flat=True))
         
-        if not chunks:
-            logger.warning(f"知識庫 {knowledge_base.name} 沒有有效的文本片段")
-            return 0
+        total_chars = knowledge_base.content_length or len(knowledge_base.content)
+        processed_chars = 0
+        stored_chunks = 0  # 共用儲存中已有向量的片段數（含沿用的片段）
+        stats = {'total': 0, 'kept': 0, 'reused': 0, 'encoded': 0, 'failed': 0}
         
-        # 刪除舊的嵌入
-        KnowledgeChunk.objects.filter(knowledge_base=knowledge_base).delete()
+        # 第一階段：編碼共用向量儲存中沒有的內容（可沿用的片段其向量必定已在儲存中）
+        for batch in iter_chunk_batches(knowledge_base):
+            stored = set(ChunkEmbedding.objects.filter(
+                content_hash__in={content_hash for _, _, content_hash in batch},
+                model_name=settings.EMBEDDING_MODEL
+            ).values_list('content_hash', flat=True))
+            stored_chunks += sum(1 for _, _, content_hash in batch if content_hash in stored)
+            texts = {content_hash: text for _, text, content_hash in batch if content_hash not in stored}
+            
+            if texts:
+                # 批次生成向量（依 token 長度分桶）；失敗的零向量不寫入，第二階段以預設向量建立片段
+                fresh = dict(zip(texts, embedding_service.encode_batch(list(texts.values()))))
+                ChunkEmbedding.objects.bulk_create([
+                    ChunkEmbedding(
+                        content_hash=content_hash,
+                        model_name=settings.EMBEDDING_MODEL,
+                        embedding=vector.tolist()
+                    ) for content_hash, vector in fresh.items() if vector.any()
+                ], ignore_conflicts=True)
+                stats['encoded'] += len(texts)
+            
+            stats['total'] += len(batch)
+            processed_chars += sum(len(text) for _, text, _ in batch)
+            if progress_callback:
+                # 總片段數要讀完檔案才知道，依已處理字數比例估計
+                estimate = round(stats['total'] * total_chars / processed_chars) if processed_chars else 0
+                progress_callback(stats['total'], max(stats['total'], estimate))
         
-        # 建立新的嵌入
-        chunk_objects = []
-        successful_chunks = 0
+        if not stats['total']:
+            logger.warning(f"知識庫 {knowledge_base.name} 沒有有效的文本片段")
+            return 0
         
-        for i, chunk_text in enumerate(chunks):
-            try:
-                # 生成向量
-                embedding = embedding_service.encode(chunk_text)
+        # 第二階段：以單一交易替換片段（檢索只會看到完整的舊版本或新版本）
+        with transaction.atomic():
+            for batch in iter_chunk_batches(knowledge_base):
+                moved, new_items = [], []
+                for i, text, content_hash in batch:
+                    if existing.get(content_hash):
+                        chunk_id, chunk_index = existing[content_hash].pop()
+                        stats['kept'] += 1
+                        if chunk_index != i:
+                            moved.append(KnowledgeChunk(id=chunk_id, chunk_index=i))
+                    else:
+                        new_items.append((i, text, content_hash))
                 
-                # 確保向量是正確的格式
-                if embedding is not None and len(embedding) == 768:
-                    # 轉換為 Python list 格式儲存
-                    embedding_list = embedding.tolist()
-                    
-                    chunk_objects.append(KnowledgeChunk(
-                        knowledge_base=knowledge_base,
-                        content=chunk_text,
-                        embedding=embedding_list,
-                        chunk_index=i
-                    ))
-                    successful_chunks += 1
-                else:
-                    logger.warning(f"片段 {i} 的向量生成失敗，使用預設向量")
-                    # 使用零向量作為預設
-                    default_embedding = [0.0] * 768
-                    
+                vectors = load_stored_embeddings(content_hash for _, _, content_hash in new_items)
+                chunk_objects = []
+                for i, text, content_hash in new_items:
+                    embedding = vectors.get(content_hash)
+                    if embedding is None:
+                        stats['failed'] += 1
+                        logger.warning(f"片段 {i} 的向量生成失敗，使用預設向量")
+                        embedding = embedding_service._zeros(1)[0]
                     chunk_objects.append(KnowledgeChunk(
                         knowledge_base=knowledge_base,
-                        content=chunk_text,
-                        embedding=default_embedding,
+                        content=text,
+                        content_hash=content_hash,
+                        embedding=embedding.tolist(),
                         chunk_index=i
                     ))
-                    
-            except Exception as e:
-                logger.error(f"處理片段 {i} 時發生錯誤: {e}")
-                # 跳過有問題的片段
-                continue
-        
-        # 批量儲存
-        if chunk_objects:
-            KnowledgeChunk.objects.bulk_create(chunk_objects)
-            logger.info(f"成功建立 {len(chunk_objects)} 個知識片段，其中 {successful_chunks} 個有有效向量")
-            return len(chunk_objects)
-        else:
-            logger.error("沒有成功建立任何知識片段")
-            return 0
+                
+                KnowledgeChunk.objects.bulk_update(moved, ['chunk_index'])
+                KnowledgeChunk.objects.bulk_create(chunk_objects)
+            
+            # 刪除內容已不存在的舊片段
+            stale_ids.extend(chunk_id for entries in existing.values() for chunk_id, _ in entries)
+            for ids in iter_batches(stale_ids, 1000):
+                KnowledgeChunk.objects.filter(id__in=ids).delete()
+        
+        stats['reused'] = stored_chunks - stats['kept']
+        logger.info(f"知識庫 {knowledge_base.name} 共 {stats['total']} 個片段：沿用 {stats['kept']} 個、"
+                    f"重用共用向量 {stats['reused']} 個、新編碼 {stats['encoded']} 個"
+                    f"（{stats['failed']} 個向量生成失敗，刪除舊片段 {len(stale_ids)} 個）")
+        return stats['total']
             
     except Exception as e:
         logger.error(f"建立向量嵌入失敗: {e}")
         return 0
 
-def search_similar_chunks(query, knowledge_base_ids, top_k=5):
-    """搜尋相似的知識片段"""
+def apply_vector_search_settings(cursor, ef_search=None, probes=None):
+    """設定本次交易的 ANN 搜尋參數（需在 transaction.atomic() 內呼叫）"""
+    ef_search = ef_search or settings.VECTOR_SEARCH_EF_SEARCH
+    probes = probes or settings.VECTOR_SEARCH_PROBES
+    if needs_rerank():
+        # HNSW 最多返回 ef_search 筆，需足以涵蓋重新排序的候選數
+        ef_search = max(ef_search, settings.VECTOR_RERANK_CANDIDATES)
+    
+    cursor.execute(
+        "SELECT set_config('hnsw.ef_search', %s, true), set_config('ivfflat.probes', %s, true)",
+        [str(ef_search), str(probes)]
+    )
+    
+    # pgvector 0.8+：過濾條件導致結果不足 top_k 時繼續掃描索引
+    if settings.VECTOR_SEARCH_ITERATIVE_SCAN:
+        cursor.execute(
+            "SELECT set_config('hnsw.iterative_scan', %s, true), set_config('ivfflat.iterative_scan', %s, true)",
+            [settings.VECTOR_SEARCH_ITERATIVE_SCAN, settings.VECTOR_SEARCH_ITERATIVE_SCAN]
+        )
+
+def apply_text_search_settings(cursor):
+    """設定本次交易的 trigram 關鍵字比對門檻（需在 transaction.atomic() 內呼叫）"""
+    cursor.execute(
+        "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+        [str(settings.HYBRID_TEXT_THRESHOLD)]
+    )
+
+def nearest_chunks_sql(query_vector, knowledge_base_ids, limit):
+    """產生取得最近 limit 個片段的子查詢 SQL 與參數，欄位為 id、content、knowledge_base_id、distance
+
+    query_vector 為 vector 型別的 SQL 運算式（例如 'queries.vec'）。
+    使用 halfvec 儲存或 binary 量化索引時，先由索引取 VECTOR_RERANK_CANDIDATES 筆候選，
+    再以共用向量儲存中的完整精度向量重新計算距離排序
+    """
+    if not needs_rerank():
+        return f"""
+            SELECT qkc.id, qkc.content, qkc.knowledge_base_id,
+                   (qkc.embedding <-> {query_vector}) AS distance
+            FROM quiz_knowledgechunk qkc
+            WHERE qkc.knowledge_base_id = ANY(%s)
+            ORDER BY qkc.embedding <-> {query_vector}
+            LIMIT %s
+        """, [knowledge_base_ids, limit]
+
+    column, _, operator = ann_index_target(column='qkc.embedding')
+    ann_query = ann_query_expression(query_vector)
+    if settings.VECTOR_STORAGE == 'vector':
+        # 欄位本身即為完整精度，直接重新排序
+        full_precision, rerank_join, join_params = 'cand.embedding', '', []
+    else:
+        full_precision = 'COALESCE(ce.embedding, cand.embedding::vector)'
+        rerank_join = "LEFT JOIN quiz_chunkembedding ce ON ce.content_hash = cand.content_hash AND ce.model_name = %s"
+        join_params = [settings.EMBEDDING_MODEL]
+
+    return f"""
+        SELECT cand.id, cand.content, cand.knowledge_base_id,
+               ({full_precision} <-> {query_vector}) AS distance
+        FROM (
+            SELECT qkc.id, qkc.content, qkc.knowledge_base_id, qkc.content_hash, qkc.embedding
+            FROM quiz_knowledgechunk qkc
+            WHERE qkc.knowledge_base_id = ANY(%s)
+            ORDER BY {column} {operator} {ann_query}
+            LIMIT %s
+        ) cand
+        {rerank_join}
+        ORDER BY distance
+        LIMIT %s
+    """, [knowledge_base_ids, max(limit, settings.VECTOR_RERANK_CANDIDATES), *join_params, limit]
+
+def search_similar_chunks(query, knowledge_base_ids, top_k=5, ef_search=None, probes=None):
+    """搜尋相似的知識片段
+    
+    ef_search / probes 可覆寫設定中的 ANN 召回參數（越大越準確但越慢）；
+    RETRIEVAL_MODE 為 hybrid 時同時使用關鍵字比對並以 RRF 融合排序
+    """
+    if settings.RETRIEVAL_MODE == 'hybrid':
+        return search_similar_chunks_multi([query], knowledge_base_ids, top_k=top_k,
+                                           ef_search=ef_search, probes=probes)
+    
     try:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
         
-        # 將查詢轉換為向量
-        query_embedding = embedding_service.encode(query)
+        # 將查詢轉換為向量（固定查詢與重複查詢會命中快取）
+        query_embedding = embedding_service.encode_query(query)
         
         # 確保向量為正確格式
         if query_embedding is None or len(query_embedding) == 0:
@@ -172,17 +524,17 @@ def search_similar_chunks(query, knowledge_base_ids, top_k=5):
         # 轉換為列表格式用於 PostgreSQL
         query_vector_list = query_embedding.tolist()
         
-        # 使用 pgvector 進行相似度搜尋
-        with connection.cursor() as cursor:
-            # 修正的 SQL 查詢，確保向量類型匹配
-            cursor.execute("""
-                SELECT qkc.content, qkc.knowledge_base_id, 
-                       (qkc.embedding <-> %s::vector) as distance
-                FROM quiz_knowledgechunk qkc
-                WHERE qkc.knowledge_base_id = ANY(%s)
-                ORDER BY qkc.embedding <-> %s::vector
-                LIMIT %s
-            """, [query_vector_list, knowledge_base_ids, query_vector_list, top_k])
+        # 使用 pgvector 近似最近鄰索引進行相似度搜尋
+        with transaction.atomic(), connection.cursor() as cursor:
+            apply_vector_search_settings(cursor, ef_search=ef_search, probes=probes)
+            nearest_sql, nearest_params = nearest_chunks_sql('queries.vec', knowledge_base_ids, top_k)
+            cursor.execute(f"""
+                WITH queries AS (SELECT %s::vector AS vec)
+                SELECT c.content, c.knowledge_base_id, c.distance
+                FROM queries
+                CROSS JOIN LATERAL ({nearest_sql}) c
+                ORDER BY c.distance
+            """, [query_vector_list, *nearest_params])
             
             results = cursor.fetchall()
         
@@ -197,8 +549,158 @@ def search_similar_chunks(query, knowledge_base_ids, top_k=5):
         # 返回基於文本的備用搜尋
         return fallback_text_search(query, knowledge_base_ids, top_k)
 
+def to_vector_literal(vector):
+    """numpy 向量轉為 pgvector 文字格式 '[x1,x2,...]'"""
+    return '[' + ','.join(map(str, np.asarray(vector, dtype=np.float32).tolist())) + ']'
+
+def search_similar_chunks_multi(queries, knowledge_base_ids, top_k=3, max_results=None,
+                                ef_search=None, probes=None):
+    """以單一 SQL 同時搜尋多個查詢的 top_k 片段，並在資料庫內去重
+    
+    每個查詢透過 LATERAL 子查詢使用 ANN 索引；重複片段保留查詢順序最前、距離最近的一筆，
+    結果依查詢順序與距離排序，與逐一呼叫 search_similar_chunks 後在 Python 去重的結果一致
+    """
+    if not queries:
+        return []
+    
+    if settings.RETRIEVAL_MODE == 'hybrid':
+        try:
+            return search_hybrid_chunks(queries, knowledge_base_ids, top_k=top_k, max_results=max_results,
+                                        ef_search=ef_search, probes=probes)
+        except Exception as e:
+            logger.error(f"混合搜尋失敗，改用純向量搜尋: {e}")
+    
+    try:
+        embedding_service = get_embedding_service()
+        query_vectors = [to_vector_literal(embedding_service.encode_query(query)) for query in queries]
+        
+        with transaction.atomic(), connection.cursor() as cursor:
+            apply_vector_search_settings(cursor, ef_search=ef_search, probes=probes)
+            nearest_sql, nearest_params = nearest_chunks_sql('queries.vec', knowledge_base_ids, top_k)
+            cursor.execute(f"""
+                WITH queries AS (
+                    SELECT q.ord, q.vec::vector AS vec
+                    FROM unnest(%s::text[]) WITH ORDINALITY AS q(vec, ord)
+                ),
+                hits AS (
+                    SELECT queries.ord, c.content, c.knowledge_base_id, c.distance
+                    FROM queries
+                    CROSS JOIN LATERAL ({nearest_sql}) c
+                ),
+                unique_hits AS (
+                    SELECT DISTINCT ON (content) content, knowledge_base_id, distance, ord
+                    FROM hits
+                    ORDER BY content, ord, distance
+                )
+                SELECT content, knowledge_base_id, distance, ord
+                FROM unique_hits
+                ORDER BY ord, distance
+                LIMIT %s
+            """, [query_vectors, *nearest_params, max_results])
+            
+            results = cursor.fetchall()
+        
+        return [{
+            'content': row[0],
+            'knowledge_base_id': row[1],
+            'similarity': max(0, 1 - row[2]),
+            'query_index': row[3] - 1
+        } for row in results]
+        
+    except Exception as e:
+        logger.error(f"多查詢向量搜尋失敗: {e}")
+        # 逐一使用備用文本搜尋，並在 Python 去重
+        seen_content = set()
+        unique_chunks = []
+        for query_index, query in enumerate(queries):
+            for chunk in fallback_text_search(query, knowledge_base_ids, top_k):
+                if chunk['content'] not in seen_content:
+                    seen_content.add(chunk['content'])
+                    chunk['query_index'] = query_index
+                    unique_chunks.append(chunk)
+        return unique_chunks[:max_results] if max_results else unique_chunks
+
+def search_hybrid_chunks(queries, knowledge_base_ids, top_k=3, max_results=None,
+                         ef_search=None, probes=None, candidates=None, rrf_k=None):
+    """以單一 SQL 執行向量 + 關鍵字混合搜尋，並以 reciprocal rank fusion 融合排序
+    
+    每個查詢各取 candidates 筆向量結果（HNSW/IVFFlat 索引）與關鍵字結果
+    （pg_trgm GIN 索引的 word_similarity），依 1 / (rrf_k + 名次) 加總後取前 top_k 筆；
+    跨查詢的重複片段與 search_similar_chunks_multi 相同，保留查詢順序最前的一筆
+    """
+    candidates = candidates or settings.HYBRID_CANDIDATES
+    rrf_k = rrf_k or settings.HYBRID_RRF_K
+    
+    embedding_service = get_embedding_service()
+    query_vectors = [to_vector_literal(embedding_service.encode_query(query)) for query in queries]
+    
+    with transaction.atomic(), connection.cursor() as cursor:
+        apply_vector_search_settings(cursor, ef_search=ef_search, probes=probes)
+        apply_text_search_settings(cursor)
+        nearest_sql, nearest_params = nearest_chunks_sql('queries.vec', knowledge_base_ids, candidates)
+        cursor.execute(f"""
+            WITH queries AS (
+                SELECT q.ord, q.vec::vector AS vec, q.txt
+                FROM unnest(%s::text[], %s::text[]) WITH ORDINALITY AS q(vec, txt, ord)
+            ),
+            vector_hits AS (
+                SELECT queries.ord, v.id, v.distance,
+                       row_number() OVER (PARTITION BY queries.ord ORDER BY v.distance) AS rank
+                FROM queries
+                CROSS JOIN LATERAL ({nearest_sql}) v
+            ),
+            text_hits AS (
+                SELECT queries.ord, t.id,
+                       row_number() OVER (PARTITION BY queries.ord ORDER BY t.score DESC) AS rank
+                FROM queries
+                CROSS JOIN LATERAL (
+                    SELECT qkc.id, word_similarity(queries.txt, qkc.content) AS score
+                    FROM quiz_knowledgechunk qkc
+                    WHERE qkc.knowledge_base_id = ANY(%s)
+                      AND queries.txt <%% qkc.content
+                    ORDER BY score DESC
+                    LIMIT %s
+                ) t
+            ),
+            fused AS (
+                SELECT ord, id, SUM(1.0 / (%s + rank)) AS score,
+                       row_number() OVER (PARTITION BY ord ORDER BY SUM(1.0 / (%s + rank)) DESC) AS rank
+                FROM (
+                    SELECT ord, id, rank FROM vector_hits
+                    UNION ALL
+                    SELECT ord, id, rank FROM text_hits
+                ) ranked
+                GROUP BY ord, id
+            ),
+            unique_hits AS (
+                SELECT DISTINCT ON (c.content) c.content, c.knowledge_base_id,
+                       vector_hits.distance, fused.ord, fused.score
+                FROM fused
+                JOIN quiz_knowledgechunk c ON c.id = fused.id
+                LEFT JOIN vector_hits ON vector_hits.ord = fused.ord AND vector_hits.id = fused.id
+                WHERE fused.rank <= %s
+                ORDER BY c.content, fused.ord, fused.score DESC
+            )
+            SELECT content, knowledge_base_id, distance, ord, score
+            FROM unique_hits
+            ORDER BY ord, score DESC
+            LIMIT %s
+        """, [query_vectors, list(queries), *nearest_params,
+              knowledge_base_ids, candidates, rrf_k, rrf_k, top_k, max_results])
+        
+        results = cursor.fetchall()
+    
+    return [{
+        'content': row[0],
+        'knowledge_base_id': row[1],
+        # 只由關鍵字比對找到的片段沒有向量距離
+        'similarity': max(0, 1 - row[2]) if row[2] is not None else 0,
+        'query_index': row[3] - 1,
+        'score': float(row[4])
+    } for row in results]
+
 def fallback_text_search(query, knowledge_base_ids, top_k=5):
-    """備用文本搜尋（當向量搜尋失敗時）"""
+    """備用文本搜尋（當向量搜尋失敗時；ILIKE 可使用 pg_trgm GIN 索引）"""
     try:
         with connection.cursor() as cursor:
             cursor.execute("""
@@ -236,34 +738,27 @@ def fallback_text_search(query, knowledge_base_ids, top_k=5):
 
 def get_relevant_content(knowledge_base_ids, question_types, max_chunks=10):
     """獲取相關內容用於題目生成"""
-    # 根據題目類型建立查詢
-    type_queries = {
-        'multiple_choice': '選擇題 概念 定義',
-        'true_false': '判斷 對錯 是非',
-        'short_answer': '簡答 解釋 說明',
-        'essay': '論述 分析 評論'
-    }
-    
-    all_chunks = []
+    # 根據題目類型建立查詢（保留順序並去除重複題型）
+    queries = []
     for q_type in question_types.split(','):
-        q_type = q_type.strip()
-        if q_type in type_queries:
-            query = type_queries[q_type]
-            chunks = search_similar_chunks(query, knowledge_base_ids, top_k=3)
-            all_chunks.extend(chunks)
-    
-    # 去重並限制數量
-    seen_content = set()
-    unique_chunks = []
-    for chunk in all_chunks:
-        if chunk['content'] not in seen_content:
-            seen_content.add(chunk['content'])
-            unique_chunks.append(chunk)
-            if len(unique_chunks) >= max_chunks:
-                break
+        query = TYPE_QUERIES.get(q_type.strip())
+        if query and query not in queries:
+            queries.append(query)
+    
+    # 單次資料庫查詢取得所有題型的相關片段（已去重並限制數量）
+    unique_chunks = search_similar_chunks_multi(
+        queries, knowledge_base_ids, top_k=3, max_results=max_chunks
+    )
     
     return '\n\n'.join([chunk['content'] for chunk in unique_chunks])
 
+def warm_up_query_cache(embedding_service=None):
+    """預先計算各題型固定查詢的向量（啟動時呼叫）"""
+    embedding_service = embedding_service or get_embedding_service()
+    for query in TYPE_QUERIES.values():
+        embedding_service.encode_query(query)
+    logger.info(f"查詢向量快取預熱完成: {get_embedding_cache().stats()}")
+
 def generate_content_hash(content):
     """生成內容雜湊值"""
     return hashlib.md5(content.encode('utf-8')).hexdigest()
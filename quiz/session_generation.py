@@ -0,0 +1,229 @@
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .models import HistoryQuestion, get_user_default_model
+from .utils import generate_prompt, parse_questions
+from .rag_utils import generate_content_hash, get_relevant_content
+from .generation import generate_questions_parallel, agenerate_questions_parallel
+from .question_pool import sample_from_pool, needs_refill, refill_pool_async
+from .llm_clients import get_ollama_client, call_with_retry
+
+# 答題會話的出題流程（題庫抽題 + 模型補生成），供視圖與背景任務共用，不依賴 HTTP 層
+
+logger = logging.getLogger(__name__)
+
+def pooled_hashes(questions):
+    """題庫抽出題目的內容雜湊，補生成時用來排除相同的題目"""
+    return {generate_content_hash(q['question_text']) for q in questions}
+
+def generate_questions_with_model(session, model=None, on_question=None, on_progress=None):
+    """使用指定模型生成題目
+    
+    先從知識庫的預生成題庫抽題，不足的部分才由模型補生成；
+    各批次並行串流生成，每解析出一題就寫入 session.questions_data，
+    並呼叫 on_question(題目, 目前題數)，讓答題頁面可在其餘題目生成時先顯示第一題；
+    on_progress(進度) 回報批次進度（見 generation.progress_event）
+    """
+    kb_ids = list(session.knowledge_bases.values_list('id', flat=True))
+    
+    # 從題庫抽題（排除使用者已作答過的題目）
+    pooled_questions = sample_from_pool(
+        session.user, kb_ids, session.question_types, session.difficulty, session.total_questions
+    )
+    session.questions_data = list(pooled_questions)
+    if pooled_questions:
+        session.save(update_fields=['questions_data'])
+        logger.info(f"從題庫取得 {len(pooled_questions)} 個題目")
+        if on_question:
+            for count, question in enumerate(pooled_questions, start=1):
+                on_question(question, count)
+    
+    shortfall = session.total_questions - len(pooled_questions)
+    if shortfall > 0:
+        if not model:
+            model = get_user_default_model(session.user)
+            
+        if not model:
+            # 如果沒有可用的模型，使用傳統方式
+            return generate_quiz_questions_fallback(session)
+        
+        # 獲取相關內容
+        content = get_relevant_content(kb_ids, session.question_types)
+        
+        if not content:
+            raise Exception("無法找到相關內容")
+        
+        logger.info(f"使用模型 {model.name} 補生成 {shortfall} 個題目")
+        
+        pooled_history = [{
+            'question_text': q['question_text'],
+            'question_type': q['question_type']
+        } for q in pooled_questions]
+        
+        def build_prompt(count, history):
+            return generate_prompt(
+                count=count,
+                question_types=session.question_types,
+                difficulty=session.difficulty,
+                content=content,
+                history=(pooled_history + history)[-20:]
+            )
+        
+        def save_question(question, count):
+            # 每解析出一題就寫入，答題頁面可先顯示已完成的題目
+            session.questions_data.append(question)
+            session.save(update_fields=['questions_data'])
+            if on_question:
+                on_question(question, len(pooled_questions) + count)
+        
+        # 多個批次並行生成，並以內容雜湊去除重複題目
+        generated_questions = generate_questions_parallel(
+            model, shortfall, build_prompt, on_question=save_question, on_progress=on_progress,
+            exclude_hashes=pooled_hashes(pooled_questions)
+        )
+        logger.info(f"使用 {model.name} 成功生成 {len(generated_questions)} 個題目")
+    else:
+        generated_questions = []
+    
+    # 儲存題目
+    final_questions = (list(pooled_questions) + generated_questions)[:session.total_questions]
+    finish_generation(session, kb_ids, final_questions)
+    return final_questions
+
+def finish_generation(session, kb_ids, final_questions):
+    """儲存題目，記錄已出過的題目，並在題庫不足時於背景補充"""
+    session.questions_data = final_questions
+    # 只更新題目欄位，背景生成時使用者可能已在作答
+    session.save(update_fields=['questions_data'])
+    
+    save_history_questions(session.user, kb_ids, final_questions)
+    if settings.QUESTION_POOL_ENABLED and needs_refill(
+        session.user, kb_ids, session.question_types, session.difficulty
+    ):
+        refill_pool_async(kb_ids)
+
+async def agenerate_questions_with_model(session, model=None):
+    """generate_questions_with_model 的非同步版本
+    
+    題庫抽題、檢索與資料庫寫入在執行緒中進行；模型生成以協程並行，
+    等待 LLM 回應的期間不佔用執行緒，同一個 ASGI worker 可同時處理多個出題請求
+    """
+    kb_ids = [kb_id async for kb_id in session.knowledge_bases.values_list('id', flat=True)]
+    
+    # 從題庫抽題（排除使用者已作答過的題目）
+    pooled_questions = await sync_to_async(sample_from_pool)(
+        session.user, kb_ids, session.question_types, session.difficulty, session.total_questions
+    )
+    session.questions_data = list(pooled_questions)
+    if pooled_questions:
+        await session.asave(update_fields=['questions_data'])
+        logger.info(f"從題庫取得 {len(pooled_questions)} 個題目")
+    
+    shortfall = session.total_questions - len(pooled_questions)
+    if shortfall > 0:
+        if not model:
+            model = await sync_to_async(get_user_default_model)(session.user)
+            
+        if not model:
+            # 備用方式很少使用，維持同步呼叫
+            return await sync_to_async(generate_quiz_questions_fallback)(session)
+        
+        # 獲取相關內容
+        content = await sync_to_async(get_relevant_content)(kb_ids, session.question_types)
+        
+        if not content:
+            raise Exception("無法找到相關內容")
+        
+        logger.info(f"使用模型 {model.name} 非同步補生成 {shortfall} 個題目")
+        
+        pooled_history = [{
+            'question_text': q['question_text'],
+            'question_type': q['question_type']
+        } for q in pooled_questions]
+        
+        def build_prompt(count, history):
+            return generate_prompt(
+                count=count,
+                question_types=session.question_types,
+                difficulty=session.difficulty,
+                content=content,
+                history=(pooled_history + history)[-20:]
+            )
+        
+        async def save_question(question, count):
+            # 每解析出一題就寫入，答題頁面可先顯示已完成的題目
+            session.questions_data.append(question)
+            await session.asave(update_fields=['questions_data'])
+        
+        generated_questions = await agenerate_questions_parallel(
+            model, shortfall, build_prompt, on_question=save_question,
+            exclude_hashes=pooled_hashes(pooled_questions)
+        )
+        logger.info(f"使用 {model.name} 成功生成 {len(generated_questions)} 個題目")
+    else:
+        generated_questions = []
+    
+    final_questions = (list(pooled_questions) + generated_questions)[:session.total_questions]
+    await sync_to_async(finish_generation)(session, kb_ids, final_questions)
+    return final_questions
+
+def generate_quiz_questions_fallback(session):
+    """備用的題目生成方式（當沒有可用模型時）"""
+    # 使用原來的 ollama 客戶端方式
+    from ollama import ChatResponse
+    
+    # 獲取相關內容
+    kb_ids = list(session.knowledge_bases.values_list('id', flat=True))
+    content = get_relevant_content(kb_ids, session.question_types)
+    
+    if not content:
+        raise Exception("無法找到相關內容")
+    
+    logger.info(f"使用備用方式生成 {session.total_questions} 個題目")
+    
+    # 生成提示詞
+    prompt = generate_prompt(
+        count=session.total_questions,
+        question_types=session.question_types,
+        difficulty=session.difficulty,
+        content=content
+    )
+    
+    try:
+        # 使用 ollama 客戶端
+        response: ChatResponse = call_with_retry(
+            get_ollama_client().chat,
+            model="gemma3:4b",  # 預設模型
+            messages=[{'role': 'user', 'content': prompt}],
+            options={'temperature': 0.7}
+        )
+        
+        questions = parse_questions(response['message']['content'])
+        
+        if not questions:
+            raise Exception("無法生成有效題目")
+        
+        # 儲存題目
+        session.questions_data = questions[:session.total_questions]
+        session.save(update_fields=['questions_data'])
+        
+        logger.info(f"備用方式成功生成 {len(session.questions_data)} 個題目")
+        
+    except Exception as e:
+        raise Exception(f"備用方式生成題目失敗: {str(e)}")
+    
+    return session.questions_data
+
+
+def save_history_questions(user, knowledge_base_ids, questions):
+    """儲存歷史題目（用於統計，不影響生成邏輯）"""
+    kb_ids_str = ','.join(map(str, sorted(knowledge_base_ids)))
+    
+    for question in questions:
+        question_hash = generate_content_hash(question['question_text'])
+        HistoryQuestion.objects.get_or_create(
+            user=user,
+            knowledge_base_ids=kb_ids_str,
+            question_hash=question_hash,
+            defaults={'question_data': question}
+        )
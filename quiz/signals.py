@@ -0,0 +1,77 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .models import AIModel, IngestionJob, KnowledgeBase, QuizSession, UserModelPreference
+from .page_cache import SCOPE_KNOWLEDGE_BASES, SCOPE_MODELS, SCOPE_QUIZZES, bump_cache_version
+from .user_stats import SESSION_STATS_FIELDS, apply_delta, apply_session_change, stored_session_values
+
+# 增量更新 UserStats：寫入前讀取資料庫中會話原本的值，寫入後只套用差值
+# （不使用載入時的快照：實例可能經 refresh_from_db() 更新，或以 update_fields 只寫入部分欄位）
+
+@receiver(pre_save, sender=QuizSession)
+def remember_session_stats(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(SESSION_STATS_FIELDS):
+        # 未寫入統計相關欄位（例如答題進度），不需查詢
+        instance._stats_before = False
+    elif instance._state.adding:
+        instance._stats_before = None
+    else:
+        instance._stats_before = stored_session_values(instance.pk)
+
+@receiver(post_save, sender=QuizSession)
+def update_stats_on_session_save(sender, instance, update_fields=None, **kwargs):
+    before = instance.__dict__.pop('_stats_before', False)
+    if before is False:
+        return
+
+    # 未寫入的欄位維持資料庫中的值（以 only() / defer() 載入時 Django 只寫入已載入的欄位）
+    written = SESSION_STATS_FIELDS if update_fields is None else set(update_fields) & set(SESSION_STATS_FIELDS)
+    after = {**(before or {}), **{field: getattr(instance, field) for field in written}}
+    apply_session_change(before, after)
+
+@receiver(pre_delete, sender=QuizSession)
+def remember_deleted_session_stats(sender, instance, **kwargs):
+    instance._stats_before = stored_session_values(instance.pk)
+
+@receiver(post_delete, sender=QuizSession)
+def update_stats_on_session_delete(sender, instance, **kwargs):
+    before = instance.__dict__.pop('_stats_before', None)
+    if before is not None:
+        apply_session_change(before, None)
+
+@receiver(post_save, sender=KnowledgeBase)
+def update_stats_on_knowledge_base_save(sender, instance, created, **kwargs):
+    if created:
+        apply_delta(instance.user_id, {'knowledge_bases': 1})
+
+@receiver(post_delete, sender=KnowledgeBase)
+def update_stats_on_knowledge_base_delete(sender, instance, **kwargs):
+    apply_delta(instance.user_id, {'knowledge_bases': -1})
+
+# 頁面片段快取：資料異動時遞增使用者對應範圍的版本號
+
+@receiver(post_save, sender=KnowledgeBase)
+@receiver(post_delete, sender=KnowledgeBase)
+def invalidate_knowledge_base_pages(sender, instance, **kwargs):
+    # 知識庫名稱也出現在答題歷史中
+    bump_cache_version(instance.user_id, SCOPE_KNOWLEDGE_BASES, SCOPE_QUIZZES)
+
+@receiver(post_save, sender=IngestionJob)
+def invalidate_ingestion_pages(sender, instance, **kwargs):
+    # 知識庫列表顯示處理進度（背景任務以 select_related 載入知識庫，不另外查詢）
+    bump_cache_version(instance.knowledge_base.user_id, SCOPE_KNOWLEDGE_BASES)
+
+@receiver(post_save, sender=QuizSession)
+def invalidate_session_pages(sender, instance, **kwargs):
+    # 頁面只顯示已完成會話的統計與歷史，答題過程中的儲存不影響
+    if instance.is_completed:
+        bump_cache_version(instance.user_id, SCOPE_QUIZZES)
+
+@receiver(post_delete, sender=QuizSession)
+def invalidate_deleted_session_pages(sender, instance, **kwargs):
+    bump_cache_version(instance.user_id, SCOPE_QUIZZES)
+
+@receiver(post_save, sender=AIModel)
+@receiver(post_delete, sender=AIModel)
+@receiver(post_save, sender=UserModelPreference)
+def invalidate_model_pages(sender, instance, **kwargs):
+    bump_cache_version(instance.user_id, SCOPE_MODELS)
@@ -0,0 +1,129 @@
+import logging
+from django.conf import settings
+from django.utils import timezone
+from .job_queue import task, enqueue
+from .models import IngestionJob, KnowledgeBase, QuestionAnswer, QuizSession
+
+logger = logging.getLogger(__name__)
+
+@task('ingest_knowledge_base')
+def ingest_knowledge_base(job_id):
+    """背景建立知識庫：生成摘要並建立向量嵌入"""
+    from .utils import generate_summary
+    from .rag_utils import create_embeddings
+
+    try:
+        job = IngestionJob.objects.select_related('knowledge_base').get(id=job_id)
+    except IngestionJob.DoesNotExist:
+        logger.warning(f"建立任務 {job_id} 不存在（知識庫可能已刪除）")
+        return 0
+
+    kb = job.knowledge_base
+
+    def update_job(**fields):
+        for key, value in fields.items():
+            setattr(job, key, value)
+        job.save(update_fields=list(fields))
+
+    update_job(status='running', stage='summarizing', started_at=timezone.now())
+
+    try:
+        # 生成摘要
+        kb.summary = generate_summary(kb.content)
+        kb.save(update_fields=['summary'])
+
+        # 建立向量嵌入
+        update_job(stage='embedding', embedding_started_at=timezone.now())
+
+        def on_progress(done, total):
+            update_job(embedded_chunks=done, total_chunks=total)
+
+        chunk_count = create_embeddings(kb, progress_callback=on_progress)
+        if chunk_count == 0:
+            raise Exception("沒有成功建立任何知識片段")
+
+        update_job(status='completed', stage='done', total_chunks=chunk_count,
+                   embedded_chunks=chunk_count, finished_at=timezone.now())
+        logger.info(f"知識庫 {kb.name} 背景建立完成，共 {chunk_count} 個片段")
+        
+        if settings.QUESTION_POOL_ENABLED:
+            enqueue('fill_question_pool', knowledge_base_id=kb.id)
+        return chunk_count
+    except Exception as e:
+        logger.error(f"知識庫 {kb.name} 背景建立失敗: {e}")
+        update_job(status='failed', error=str(e), finished_at=timezone.now())
+        return 0
+
+@task('fill_question_pool')
+def fill_question_pool(knowledge_base_id):
+    """背景為知識庫補足預先生成的題目"""
+    from .question_pool import fill_pool
+
+    try:
+        kb = KnowledgeBase.objects.get(id=knowledge_base_id)
+    except KnowledgeBase.DoesNotExist:
+        logger.warning(f"知識庫 {knowledge_base_id} 不存在，略過題庫生成")
+        return 0
+
+    return fill_pool(kb)
+
+@task('grade_answer')
+def grade_answer_task(answer_id):
+    """背景評分主觀題答案"""
+    from .grading import grade_pending_answer
+
+    try:
+        answer = QuestionAnswer.objects.select_related('session').get(id=answer_id)
+    except QuestionAnswer.DoesNotExist:
+        logger.warning(f"答案 {answer_id} 不存在，略過評分")
+        return None
+
+    if answer.grading_status != 'pending':
+        return answer.score
+
+    return grade_pending_answer(answer)
+
+@task('grade_session')
+def grade_session_task(session_id):
+    """背景批次評分會話中待評分的主觀題"""
+    from .grading import grade_session_answers
+
+    try:
+        session = QuizSession.objects.get(id=session_id)
+    except QuizSession.DoesNotExist:
+        logger.warning(f"答題會話 {session_id} 不存在，略過評分")
+        return None
+
+    return grade_session_answers(session)
+
+@task('generate_quiz')
+def generate_quiz_task(session_id):
+    """背景生成答題會話的題目，進度寫入會話供答題頁面以 SSE 接收"""
+    from .session_generation import generate_questions_with_model
+
+    try:
+        session = QuizSession.objects.get(id=session_id)
+    except QuizSession.DoesNotExist:
+        logger.warning(f"答題會話 {session_id} 不存在，略過出題")
+        return 0
+
+    def update_session(**fields):
+        for key, value in fields.items():
+            setattr(session, key, value)
+        # 只更新生成相關欄位，使用者可能已開始作答
+        session.save(update_fields=list(fields))
+
+    update_session(generation_status='generating')
+
+    try:
+        questions = generate_questions_with_model(
+            session, on_progress=lambda progress: update_session(generation_progress=progress)
+        )
+        if not questions:
+            raise Exception("無法生成有效題目")
+        update_session(generation_status='completed')
+        return len(questions)
+    except Exception as e:
+        logger.error(f"答題會話 {session_id} 出題失敗: {e}")
+        update_session(generation_status='failed', generation_error=str(e))
+        return 0
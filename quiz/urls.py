@@ -15,10 +15,14 @@ urlpatterns = [
     path('flashcard/<int:session_id>/', views.flashcard_interface, name='flashcard_interface'),
     path('flashcard/<int:session_id>/answer/', views.flashcard_answer, name='flashcard_answer'),
     path('quiz/<int:session_id>/result/', views.quiz_result, name='quiz_result'),
+    path('quiz/<int:session_id>/grading-status/', views.quiz_grading_status, name='quiz_grading_status'),
+    path('quiz/<int:session_id>/events/', views.quiz_generation_events, name='quiz_generation_events'),
     
     # 知識庫管理
     path('knowledge/', views.knowledge_base_list, name='knowledge_base_list'),
     path('knowledge/add/', views.knowledge_base_add, name='knowledge_base_add'),
+    path('knowledge/<int:kb_id>/update/', views.knowledge_base_update, name='knowledge_base_update'),
+    path('knowledge/<int:kb_id>/status/', views.knowledge_base_status, name='knowledge_base_status'),
     path('knowledge/<int:kb_id>/delete/', views.knowledge_base_delete, name='knowledge_base_delete'),
     
     # 使用者
@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from .models import KnowledgeBase, QuizSession, UserStats
+
+# 會話對統計的貢獻所需的欄位
+SESSION_STATS_FIELDS = ('user_id', 'quiz_type', 'is_completed', 'score')
+
+def session_contribution(values):
+    """單一會話對 UserStats 各欄位的貢獻，values 為 SESSION_STATS_FIELDS 的欄位值（None 表示會話不存在）"""
+    if values is None:
+        return {}
+    contribution = {'total_sessions': 1}
+    if values['is_completed']:
+        quiz_type = values['quiz_type']
+        contribution['completed_sessions'] = 1
+        if quiz_type in UserStats.QUIZ_TYPES:
+            contribution[f'{quiz_type}_completed'] = 1
+            if values['score'] is not None:
+                contribution[f'{quiz_type}_scored'] = 1
+                contribution[f'{quiz_type}_score_sum'] = values['score']
+    return contribution
+
+def stored_session_values(session_id):
+    """資料庫中會話目前的統計相關欄位值，不存在時返回 None"""
+    return QuizSession.objects.filter(pk=session_id).values(*SESSION_STATS_FIELDS).first()
+
+def contribution_delta(old, new):
+    """兩次貢獻的差值（只保留有變化的欄位）"""
+    delta = {}
+    for field in set(old) | set(new):
+        change = new.get(field, 0) - old.get(field, 0)
+        if change:
+            delta[field] = change
+    return delta
+
+def apply_delta(user_id, delta):
+    """以 F 運算式原子地累加統計；統計列尚未建立時略過，第一次讀取時會完整計算"""
+    if not delta:
+        return
+    UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + change for field, change in delta.items()}
+    )
+
+def apply_session_change(before, after):
+    """依會話寫入前後的欄位值（None 表示不存在）更新統計；會話改屬其他使用者時分別增減"""
+    if before and after and before['user_id'] != after['user_id']:
+        apply_session_change(before, None)
+        before = None
+    user_id = (after or before)['user_id']
+    apply_delta(user_id, contribution_delta(session_contribution(before), session_contribution(after)))
+
+def compute_user_stats(user_id):
+    """從 QuizSession 與 KnowledgeBase 完整計算統計值"""
+    aggregates = {
+        'total_sessions': Count('id'),
+        'completed_sessions': Count('id', filter=Q(is_completed=True)),
+    }
+    for quiz_type in UserStats.QUIZ_TYPES:
+        completed = Q(is_completed=True, quiz_type=quiz_type)
+        aggregates[f'{quiz_type}_completed'] = Count('id', filter=completed)
+        aggregates[f'{quiz_type}_scored'] = Count('score', filter=completed)
+        aggregates[f'{quiz_type}_score_sum'] = Sum('score', filter=completed)
+
+    values = QuizSession.objects.filter(user_id=user_id).aggregate(**aggregates)
+    values = {field: value or 0 for field, value in values.items()}
+    values['knowledge_bases'] = KnowledgeBase.objects.filter(user_id=user_id).count()
+    return values
+
+def rebuild_user_stats(user_id):
+    """重新計算並寫入使用者統計"""
+    with transaction.atomic():
+        stats, _ = UserStats.objects.update_or_create(user_id=user_id, defaults=compute_user_stats(user_id))
+    return stats
+
+def get_user_stats(user):
+    """取得使用者統計（主鍵查詢；尚未建立時完整計算一次）"""
+    try:
+        return UserStats.objects.get(user_id=user.pk)
+    except UserStats.DoesNotExist:
+        return rebuild_user_stats(user.pk)
+
+def check_user_stats(stats):
+    """比對統計列與完整計算的結果，返回 {欄位: (目前值, 正確值)}"""
+    expected = compute_user_stats(stats.user_id)
+    mismatches = {}
+    for field, value in expected.items():
+        current = getattr(stats, field)
+        if abs(current - value) > 1e-6:
+            mismatches[field] = (current, value)
+    return mismatches
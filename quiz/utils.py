@@ -1,7 +1,13 @@
 import json
 import os
-from ollama import chat, ChatResponse
-from typing import List, Dict, Optional
+import re
+from typing import TYPE_CHECKING, List, Dict, Optional, Iterable, Iterator, AsyncIterable, AsyncIterator
+from .llm_clients import get_ollama_client, get_async_ollama_client, call_with_retry, acall_with_retry
+from .llm_cache import cached_generate, acached_generate
+
+if TYPE_CHECKING:
+    # 只用於型別標註，避免匯入 utils 時載入 ollama
+    from ollama import ChatResponse
 
 def generate_prompt(count: int, question_types: str, difficulty: str, 
                    content: str, history: Optional[List[Dict]] = None) -> str:
@@ -94,7 +100,8 @@ def generate_prompt(count: int, question_types: str, difficulty: str,
 def generate_questions_ollama(prompt: str, model: str = "gemma3:4b") -> str:
     """使用 Ollama 生成題目"""
     try:
-        response: ChatResponse = chat(
+        response: ChatResponse = call_with_retry(
+            get_ollama_client().chat,
             model=model,
             messages=[{'role': 'user', 'content': prompt}],
             options={'temperature': 0.7}
@@ -133,6 +140,66 @@ def parse_questions(text: str) -> List[Dict]:
     except json.JSONDecodeError as e:
         raise Exception(f"JSON 解析失敗: {str(e)}")
 
+class IncrementalJSONArrayParser:
+    """增量解析 JSON 陣列：每當一個頂層物件結束就立即返回
+    
+    忽略陣列外的 markdown 標記與說明文字，並正確處理字串中的括號與跳脫字元
+    """
+    
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+    
+    def feed(self, text: str) -> List[Dict]:
+        """送入新的文字片段，返回此次完成的物件"""
+        objects = []
+        for char in text:
+            if self._depth > 0:
+                self._buffer.append(char)
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            
+            if char == '"' and self._depth > 0:
+                self._in_string = True
+            elif char == '{':
+                if self._depth == 0:
+                    self._buffer = [char]
+                self._depth += 1
+            elif char == '}' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        objects.append(json.loads(''.join(self._buffer)))
+                    except json.JSONDecodeError:
+                        pass  # 單一物件格式錯誤時略過，不影響後續題目
+                    self._buffer = []
+        return objects
+
+def iter_questions(text_chunks: Iterable[str]) -> Iterator[Dict]:
+    """從串流文字片段中逐題產生通過驗證的題目"""
+    parser = IncrementalJSONArrayParser()
+    for text in text_chunks:
+        for question in parser.feed(text):
+            if isinstance(question, dict) and validate_question_format(question):
+                yield question
+
+async def aiter_questions(text_chunks: AsyncIterable[str]) -> AsyncIterator[Dict]:
+    """iter_questions 的非同步版本，從非同步串流中逐題產生題目"""
+    parser = IncrementalJSONArrayParser()
+    async for text in text_chunks:
+        for question in parser.feed(text):
+            if isinstance(question, dict) and validate_question_format(question):
+                yield question
+
 def validate_question_format(question: Dict) -> bool:
     """驗證題目格式是否正確"""
     required_fields = ['question_text', 'question_type', 'answer_text', 'explanation']
@@ -154,17 +221,41 @@ def validate_question_format(question: Dict) -> bool:
     
     return True
 
-def grade_answer(question: Dict, user_answer: str, model: str = "gemma3:4b") -> int:
-    """自動評分（簡答題和論述題）"""
-    if question['question_type'] in ['multiple_choice', 'true_false']:
-        # 客觀題直接比對
-        correct_option = next((opt for opt in question['options'] if opt['is_correct']), None)
-        if correct_option:
-            return 100 if user_answer.strip() == correct_option['text'] else 0
-        return 0
+def chat_cached(site: str, prompt: str, model: str, temperature: float, validate=None) -> str:
+    """呼叫 Ollama 並經過 LLM 回應快取，site 用於區分各呼叫位置的命中率"""
+    def generate():
+        response: ChatResponse = call_with_retry(
+            get_ollama_client().chat,
+            model=model,
+            messages=[{'role': 'user', 'content': prompt}],
+            options={'temperature': temperature}
+        )
+        return response['message']['content']
     
-    # 主觀題使用 LLM 評分
-    prompt = f"""
+    return cached_generate(site, prompt, model, temperature, generate, validate)
+
+async def achat_cached(site: str, prompt: str, model: str, temperature: float, validate=None) -> str:
+    """chat_cached 的非同步版本"""
+    async def agenerate():
+        response: ChatResponse = await acall_with_retry(
+            get_async_ollama_client().chat,
+            model=model,
+            messages=[{'role': 'user', 'content': prompt}],
+            options={'temperature': temperature}
+        )
+        return response['message']['content']
+    
+    return await acached_generate(site, prompt, model, temperature, agenerate, validate)
+
+SUBJECTIVE_QUESTION_TYPES = ['short_answer', 'essay']
+
+def is_subjective(question: Dict) -> bool:
+    """是否為需要 LLM 評分的主觀題"""
+    return question['question_type'] in SUBJECTIVE_QUESTION_TYPES
+
+def grade_prompt(question: Dict, user_answer: str) -> str:
+    """主觀題評分提示詞"""
+    return f"""
     請為以下回答評分（0-100分）：
     
     問題：{question['question_text']}
@@ -180,25 +271,108 @@ def grade_answer(question: Dict, user_answer: str, model: str = "gemma3:4b") ->
     
     請直接回答數字分數，不要其他說明。
     """
+
+def parse_grade(score_text: str) -> int:
+    """提取數字分數，無法解析時拋出例外"""
+    numbers = re.findall(r'\d+', score_text.strip())
+    if not numbers:
+        raise ValueError(f"無法從評分回應中取得分數: {score_text.strip()[:50]}")
+    return min(max(int(numbers[0]), 0), 100)  # 限制在 0-100 範圍
+
+def has_grade(text: str) -> bool:
+    """回應中是否有分數（沒有分數的回應不寫入快取）"""
+    return bool(re.search(r'\d+', text))
+
+def grade_subjective_answer(question: Dict, user_answer: str, model: str = "gemma3:4b") -> int:
+    """使用 LLM 評分主觀題，失敗或無法解析分數時拋出例外"""
+    return parse_grade(chat_cached('grade', grade_prompt(question, user_answer), model, 0.3, validate=has_grade))
+
+async def agrade_subjective_answer(question: Dict, user_answer: str, model: str = "gemma3:4b") -> int:
+    """grade_subjective_answer 的非同步版本"""
+    return parse_grade(await achat_cached('grade', grade_prompt(question, user_answer), model, 0.3, validate=has_grade))
+
+def parse_batch_scores(text: str, count: int) -> List[Optional[int]]:
+    """解析批次評分回應，返回依題目順序排列的分數；無法取得有效分數的題目為 None"""
+    scores = [None] * count
+    try:
+        items = json.loads(clean_json_response(text))
+    except json.JSONDecodeError:
+        return scores
+    if not isinstance(items, list):
+        return scores
     
+    for position, item in enumerate(items):
+        if isinstance(item, dict):
+            index, score = item.get('index', position + 1), item.get('score')
+        else:
+            index, score = position + 1, item
+        try:
+            index, score = int(index), round(float(score))
+        except (TypeError, ValueError, OverflowError):
+            continue
+        # 題號或分數超出範圍時視為無效，交由單題評分補救
+        if 1 <= index <= count and 0 <= score <= 100 and scores[index - 1] is None:
+            scores[index - 1] = score
+    return scores
+
+def grade_subjective_answers_batch(items: List[tuple], model: str = "gemma3:4b") -> List[Optional[int]]:
+    """以單次 LLM 呼叫評分多題主觀題，items 為 (題目, 使用者答案) 列表
+
+    返回與 items 順序對應的分數，解析失敗的題目為 None；LLM 呼叫失敗時拋出例外
+    """
+    answers_text = "\n".join(f"""
+    第 {i} 題
+    問題：{question['question_text']}
+    標準答案：{question['answer_text']}
+    學生回答：{user_answer}
+    """ for i, (question, user_answer) in enumerate(items, 1))
+    
+    prompt = f"""
+    請為以下 {len(items)} 題學生回答分別評分（0-100分）：
+    {answers_text}
+    評分標準：
+    - 完全正確：90-100分
+    - 大部分正確：70-89分  
+    - 部分正確：50-69分
+    - 略有相關：30-49分
+    - 完全錯誤：0-29分
+    
+    請只回傳 JSON 陣列，每題一個物件，依題號排序，不要其他說明：
+    [{{"index": 1, "score": 85}}, {{"index": 2, "score": 40}}]
+    """
+    
+    response = chat_cached('grade_batch', prompt, model, 0.3,
+                           validate=lambda text: all(s is not None for s in parse_batch_scores(text, len(items))))
+    return parse_batch_scores(response, len(items))
+
+def grade_objective_answer(question: Dict, user_answer: str) -> int:
+    """客觀題直接比對"""
+    correct_option = next((opt for opt in question['options'] if opt['is_correct']), None)
+    if correct_option:
+        return 100 if user_answer.strip() == correct_option['text'] else 0
+    return 0
+
+def grade_answer(question: Dict, user_answer: str, model: str = "gemma3:4b") -> int:
+    """自動評分（簡答題和論述題）"""
+    if question['question_type'] in ['multiple_choice', 'true_false']:
+        return grade_objective_answer(question, user_answer)
+    
+    # 主觀題使用 LLM 評分
     try:
-        response: ChatResponse = chat(
-            model=model,
-            messages=[{'role': 'user', 'content': prompt}],
-            options={'temperature': 0.3}
-        )
-        # 提取數字分數
-        score_text = response['message']['content'].strip()
-        # 使用正則表達式提取數字
-        import re
-        numbers = re.findall(r'\d+', score_text)
-        if numbers:
-            score = int(numbers[0])
-            return min(max(score, 0), 100)  # 限制在 0-100 範圍
-        return 50  # 如果無法提取數字，給予中等分數
+        return grade_subjective_answer(question, user_answer, model)
     except:
         return 50  # 評分失敗時給予中等分數
 
+async def agrade_answer(question: Dict, user_answer: str, model: str = "gemma3:4b") -> int:
+    """grade_answer 的非同步版本，主觀題等待 LLM 時不佔用執行緒"""
+    if question['question_type'] in ['multiple_choice', 'true_false']:
+        return grade_objective_answer(question, user_answer)
+    
+    try:
+        return await agrade_subjective_answer(question, user_answer, model)
+    except Exception:
+        return 50  # 評分失敗時給予中等分數
+
 def generate_summary(content: str, model: str = "gemma3:4b") -> str:
     """生成知識庫摘要"""
     prompt = f"""
@@ -210,12 +384,7 @@ def generate_summary(content: str, model: str = "gemma3:4b") -> str:
     """
     
     try:
-        response: ChatResponse = chat(
-            model=model,
-            messages=[{'role': 'user', 'content': prompt}],
-            options={'temperature': 0.5}
-        )
-        summary = response['message']['content'].strip()
+        summary = chat_cached('summary', prompt, model, 0.5).strip()
         # 限制字數
         return summary[:50] if len(summary) > 50 else summary
     except:
@@ -0,0 +1,129 @@
+import io
+import math
+from django.conf import settings
+
+# KnowledgeChunk.embedding 上的 ANN 索引名稱（與 models.py 中的 HnswIndex 一致）
+ANN_INDEX_NAME = 'quiz_chunk_embedding_ann'
+EMBEDDING_DIMENSIONS = 768
+
+VECTOR_STORAGE_TYPES = ['vector', 'halfvec']
+VECTOR_QUANTIZATIONS = ['none', 'binary']
+
+def default_ivfflat_lists(row_count):
+    """pgvector 建議的 IVFFlat lists 數：100 萬筆以下用 rows/1000，以上用 sqrt(rows)"""
+    if row_count <= 1_000_000:
+        return max(1, row_count // 1000)
+    return max(1, int(math.sqrt(row_count)))
+
+def build_index_sql(table, column, index_name, index_type='hnsw', opclass='vector_l2_ops',
+                    m=16, ef_construction=64, lists=None, concurrently=False):
+    """產生建立 ANN 索引的 SQL"""
+    if index_type == 'hnsw':
+        with_params = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    elif index_type == 'ivfflat':
+        with_params = f"lists = {int(lists or settings.VECTOR_INDEX_IVFFLAT_LISTS)}"
+    else:
+        raise ValueError(f"不支援的索引類型: {index_type}")
+
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{index_name} "
+        f"ON {table} USING {index_type} ({column} {opclass}) WITH ({with_params})"
+    )
+
+def ann_index_target(column='embedding', storage=None, quantization=None, dimensions=EMBEDDING_DIMENSIONS):
+    """ANN 索引的欄位運算式、運算子類別與距離運算子
+
+    binary 量化時索引建立在 binary_quantize() 運算式上（每維 1 bit），以 Hamming 距離取候選
+    """
+    storage = storage or settings.VECTOR_STORAGE
+    quantization = quantization or settings.VECTOR_QUANTIZATION
+    if storage not in VECTOR_STORAGE_TYPES:
+        raise ValueError(f"不支援的向量儲存型別: {storage}")
+    if quantization == 'binary':
+        return f"(binary_quantize({column})::bit({dimensions}))", 'bit_hamming_ops', '<~>'
+    if quantization != 'none':
+        raise ValueError(f"不支援的量化方式: {quantization}")
+    return column, f"{storage}_l2_ops", '<->'
+
+def ann_query_expression(query_vector, storage=None, quantization=None, dimensions=EMBEDDING_DIMENSIONS):
+    """將 vector 型別的查詢運算式轉為與 ANN 索引相同的型別"""
+    storage = storage or settings.VECTOR_STORAGE
+    quantization = quantization or settings.VECTOR_QUANTIZATION
+    if quantization == 'binary':
+        return f"binary_quantize({query_vector})::bit({dimensions})"
+    if storage == 'vector':
+        return query_vector
+    return f"{query_vector}::{storage}({dimensions})"
+
+def needs_rerank(storage=None, quantization=None):
+    """索引距離不是完整精度時，需取較多候選並重新排序"""
+    storage = storage or settings.VECTOR_STORAGE
+    quantization = quantization or settings.VECTOR_QUANTIZATION
+    return storage != 'vector' or quantization != 'none'
+
+def get_vector_storage(cursor):
+    """讀取 KnowledgeChunk.embedding 目前的欄位型別（vector 或 halfvec）"""
+    cursor.execute("""
+        SELECT t.typname FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid
+        WHERE a.attrelid = 'quiz_knowledgechunk'::regclass AND a.attname = 'embedding'
+    """)
+    return cursor.fetchone()[0]
+
+def convert_vector_storage(cursor, storage, dimensions=EMBEDDING_DIMENSIONS):
+    """變更 KnowledgeChunk.embedding 的欄位型別（會重寫整張表並持有排他鎖，之後需重建 ANN 索引）"""
+    if storage not in VECTOR_STORAGE_TYPES:
+        raise ValueError(f"不支援的向量儲存型別: {storage}")
+    # 舊索引的運算子類別不適用新型別，先移除以免 ALTER 時重建失敗
+    cursor.execute(f"DROP INDEX IF EXISTS {ANN_INDEX_NAME}")
+    cursor.execute(
+        f"ALTER TABLE quiz_knowledgechunk ALTER COLUMN embedding "
+        f"TYPE {storage}({int(dimensions)}) USING embedding::{storage}({int(dimensions)})"
+    )
+
+def rebuild_ann_index(cursor, index_type=None, m=16, ef_construction=64, lists=None,
+                      storage=None, quantization=None):
+    """以指定類型重建 KnowledgeChunk 的 ANN 索引，返回使用的 lists 數（HNSW 為 None）"""
+    index_type = index_type or settings.VECTOR_INDEX_TYPE
+    # 運算子類別必須符合欄位實際型別
+    storage = storage or get_vector_storage(cursor)
+    column, opclass, _ = ann_index_target(storage=storage, quantization=quantization)
+
+    if index_type == 'ivfflat' and not lists:
+        # IVFFlat 需要依資料量決定 lists，且應在資料載入後建立
+        cursor.execute("SELECT count(*) FROM quiz_knowledgechunk")
+        lists = default_ivfflat_lists(cursor.fetchone()[0])
+
+    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {ANN_INDEX_NAME}")
+    cursor.execute(build_index_sql(
+        'quiz_knowledgechunk', column, ANN_INDEX_NAME,
+        index_type=index_type, opclass=opclass, m=m, ef_construction=ef_construction,
+        lists=lists, concurrently=True
+    ))
+    return lists if index_type == 'ivfflat' else None
+
+def relation_sizes(cursor, table, index_name):
+    """資料表本體、TOAST 與指定索引的大小（bytes）"""
+    cursor.execute("""
+        SELECT pg_relation_size(c.oid),
+               COALESCE(pg_total_relation_size(NULLIF(c.reltoastrelid, 0)), 0),
+               COALESCE((SELECT pg_relation_size(i.oid) FROM pg_class i WHERE i.relname = %s), 0)
+        FROM pg_class c
+        WHERE c.oid = %s::regclass
+    """, [index_name, table])
+    heap, toast, index = cursor.fetchone()
+    return {'heap': heap, 'toast': toast, 'index': index}
+
+def make_clustered_vectors(centroids, rng, count):
+    """以群集中心加雜訊產生正規化的合成向量（比均勻隨機更接近真實的嵌入分佈）"""
+    import numpy as np
+
+    labels = rng.integers(0, len(centroids), size=count)
+    vectors = centroids[labels] + rng.normal(scale=0.5, size=(count, centroids.shape[1])).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def copy_vectors(cursor, table, vectors, column='embedding'):
+    """以 COPY 將向量批次寫入資料表"""
+    buffer = io.StringIO('\n'.join(
+        '[' + ','.join(row) + ']' for row in vectors.astype(str)
+    ))
+    cursor.copy_expert(f"COPY {table} ({column}) FROM STDIN", buffer)
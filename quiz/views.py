@@ -1,15 +1,27 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.conf import settings
 import json
 import math
+from asgiref.sync import sync_to_async
 from .models import *
-from .utils import *
-from .rag_utils import *
-import requests
+from .utils import agrade_answer, grade_answer, is_subjective
+# 嵌入模型與 ML 套件在第一次檢索時才載入，不影響 URL 解析與其他頁面
+from .rag_utils import inspect_text_upload
+from .job_queue import enqueue
+from .session_generation import agenerate_questions_with_model
+from .grading import compute_session_score, refresh_session_score
+from .generation_events import generation_event_stream, ageneration_event_stream
+from .user_stats import get_user_stats
+from .page_cache import (SCOPE_KNOWLEDGE_BASES, SCOPE_MODELS, SCOPE_QUIZZES,
+                         fragment_cache_context, get_cached_ollama_models)
+from .llm_clients import get_async_gemini_client, get_http_session
 from django.views.decorators.http import require_http_methods
 from .models import AIModel, UserModelPreference
 def health_check(request):
@@ -18,36 +30,30 @@ def health_check(request):
 
 def home(request):
     """首頁"""
-    user_stats = {}
+    context = {'user_stats': {}}
     
-    # 如果用戶已登入，計算統計數據
+    # 如果用戶已登入，讀取統計摘要（單次主鍵查詢；片段快取命中時不會執行）
     if request.user.is_authenticated:
-        from django.db.models import Avg
-        
-        # 完成的答題數量
-        user_stats['completed_quizzes'] = QuizSession.objects.filter(
-            user=request.user, 
-            is_completed=True
-        ).count()
-        
-        # 知識庫數量
-        user_stats['knowledge_bases'] = KnowledgeBase.objects.filter(
-            user=request.user
-        ).count()
-        
-        # 平均分數
-        avg_score_result = QuizSession.objects.filter(
-            user=request.user, 
-            is_completed=True
-        ).aggregate(avg_score=Avg('score'))
-        
-        user_stats['avg_score'] = avg_score_result['avg_score'] or 0
+        def load_user_stats():
+            stats = get_user_stats(request.user)
+            return {
+                'completed_quizzes': stats.completed_sessions,
+                'knowledge_bases': stats.knowledge_bases,
+                'avg_score': stats.avg_score,
+            }
+        context['user_stats'] = SimpleLazyObject(load_user_stats)
+        context.update(fragment_cache_context(request.user, SCOPE_QUIZZES, SCOPE_KNOWLEDGE_BASES))
     
-    return render(request, 'quiz/home.html', {'user_stats': user_stats})
+    return render(request, 'quiz/home.html', context)
 
 @login_required
-def custom_quiz_setup(request):
-    """自定義題目設置"""
+async def custom_quiz_setup(request):
+    """自定義題目設置
+    
+    預設在背景生成題目並立即轉到答題頁面（以 SSE 顯示進度）；
+    QUIZ_BACKGROUND_GENERATION=False 時在請求中非同步生成，等待模型時不佔用 worker 執行緒
+    """
+    user = await request.auser()
     if request.method == 'POST':
         # 獲取表單資料
         knowledge_base_ids = request.POST.getlist('knowledge_bases')
@@ -56,25 +62,31 @@ def custom_quiz_setup(request):
         total_questions = int(request.POST.get('total_questions', 5))
         
         # 建立答題會話
-        session = QuizSession.objects.create(
-            user=request.user,
+        session = await QuizSession.objects.acreate(
+            user=user,
             quiz_type='custom',
             question_types=question_types,
             difficulty=difficulty,
-            total_questions=total_questions
+            total_questions=total_questions,
+            generation_status='pending' if settings.QUIZ_BACKGROUND_GENERATION else 'completed'
         )
-        session.knowledge_bases.set(knowledge_base_ids)
+        await session.knowledge_bases.aset(knowledge_base_ids)
+        
+        if settings.QUIZ_BACKGROUND_GENERATION:
+            # 背景生成，第一題生成後即可開始作答
+            await sync_to_async(enqueue)('generate_quiz', session_id=session.id)
+            return redirect('quiz_interface', session_id=session.id)
         
         # 生成題目
         try:
-            generate_questions_with_model(session)
+            await agenerate_questions_with_model(session)
             return redirect('quiz_interface', session_id=session.id)
         except Exception as e:
             messages.error(request, f'題目生成失敗：{str(e)}')
-            session.delete()
+            await session.adelete()
     
     # 獲取使用者的知識庫
-    knowledge_bases = KnowledgeBase.objects.filter(user=request.user)
+    knowledge_bases = KnowledgeBase.objects.filter(user=user)
     context = {
         'knowledge_bases': knowledge_bases,
         'question_types': [
@@ -89,56 +101,44 @@ def custom_quiz_setup(request):
             ('hard', '困難'),
         ]
     }
-    return render(request, 'quiz/custom_quiz.html', context)
+    # 模板會查詢資料庫，需在執行緒中渲染
+    return await sync_to_async(render)(request, 'quiz/custom_quiz.html', context)
 
 @login_required
-def flashcard_setup(request):
-    """閃卡設置"""
+async def flashcard_setup(request):
+    """閃卡設置（非同步：等待模型生成閃卡時不佔用 worker 執行緒）"""
+    user = await request.auser()
     if request.method == 'POST':
         knowledge_base_ids = request.POST.getlist('knowledge_bases')
         total_questions = int(request.POST.get('total_questions', 10))
         difficulty = request.POST.get('difficulty')
         
-        session = QuizSession.objects.create(
-            user=request.user,
+        session = await QuizSession.objects.acreate(
+            user=user,
             quiz_type='flashcard',
             question_types='true_false',  # 閃卡固定是非題
             difficulty=difficulty,
             total_questions=total_questions
         )
-        session.knowledge_bases.set(knowledge_base_ids)
+        await session.knowledge_bases.aset(knowledge_base_ids)
         
         try:
-            generate_questions_with_model(session)
+            await agenerate_questions_with_model(session)
             return redirect('flashcard_interface', session_id=session.id)
         except Exception as e:
             messages.error(request, f'閃卡生成失敗：{str(e)}')
-            session.delete()
+            await session.adelete()
     
     # 獲取使用者的知識庫
-    knowledge_bases = KnowledgeBase.objects.filter(user=request.user)
-    
-    # 計算閃卡統計數據
-    flashcard_stats = {}
-    if request.user.is_authenticated:
-        # 閃卡完成次數
-        flashcard_stats['completed_count'] = QuizSession.objects.filter(
-            user=request.user,
-            quiz_type='flashcard',
-            is_completed=True
-        ).count()
-        
-        # 閃卡平均分數
-        flashcard_avg = QuizSession.objects.filter(
-            user=request.user,
-            quiz_type='flashcard',
-            is_completed=True
-        ).aggregate(avg_score=models.Avg('score'))
-        
-        flashcard_stats['avg_score'] = flashcard_avg['avg_score'] or 0
-        
-        # 可用知識庫數量
-        flashcard_stats['knowledge_bases'] = knowledge_bases.count()
+    knowledge_bases = KnowledgeBase.objects.filter(user=user)
+    
+    # 閃卡統計數據
+    stats = await sync_to_async(get_user_stats)(user)
+    flashcard_stats = {
+        'completed_count': stats.flashcard_completed,
+        'avg_score': stats.flashcard_avg_score,
+        'knowledge_bases': stats.knowledge_bases,
+    }
     
     context = {
         'knowledge_bases': knowledge_bases,
@@ -149,18 +149,21 @@ def flashcard_setup(request):
             ('hard', '困難'),
         ]
     }
-    return render(request, 'quiz/flashcard_setup.html', context)
+    return await sync_to_async(render)(request, 'quiz/flashcard_setup.html', context)
 
 class OllamaClient:
     """Ollama 客戶端"""
     
-    def __init__(self, base_url="http://localhost:11434"):
-        self.base_url = base_url
+    def __init__(self, base_url=None):
+        self.base_url = (base_url or settings.OLLAMA_BASE_URL).rstrip('/')
+        self.session = get_http_session(self.base_url)
     
     def get_models(self):
         """獲取可用的模型清單"""
+        import requests
+        
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=10)
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 return [model['name'] for model in data.get('models', [])]
@@ -185,7 +188,7 @@ class OllamaClient:
                 "prompt": "test",
                 "stream": False
             }
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/api/generate", 
                 json=payload, 
                 timeout=30
@@ -203,14 +206,15 @@ def model_management(request):
     # 獲取使用者偏好
     preference, created = UserModelPreference.objects.get_or_create(user=request.user)
     
-    # 獲取可用的 Ollama 模型
+    # 獲取可用的 Ollama 模型（短暫快取，避免每次開啟頁面都呼叫 Ollama API）
     ollama_client = OllamaClient()
-    available_ollama_models = ollama_client.get_models()
+    available_ollama_models = get_cached_ollama_models(ollama_client)
     
     context = {
         'user_models': user_models,
         'preference': preference,
         'available_ollama_models': available_ollama_models,
+        **fragment_cache_context(request.user, SCOPE_MODELS),
     }
     return render(request, 'quiz/model_management.html', context)
 
@@ -237,7 +241,7 @@ def add_model(request):
         
         # 設定預設 base_url
         if model_type == 'ollama' and not base_url:
-            base_url = "http://localhost:11434"
+            base_url = settings.OLLAMA_BASE_URL
         
         # 建立模型
         model = AIModel.objects.create(
@@ -274,18 +278,18 @@ def add_model(request):
 
 @login_required
 @csrf_exempt
-def test_model_connection(request, model_id):
-    """測試模型連線 API"""
+async def test_model_connection(request, model_id):
+    """測試模型連線 API（非同步）"""
     if request.method != 'POST':
         return JsonResponse({'error': '無效的請求方法'}, status=405)
     
     try:
-        model = get_object_or_404(AIModel, id=model_id, user=request.user)
-        success, message = model.test_connection()
+        model = await aget_object_or_404(AIModel, id=model_id, user=await request.auser())
+        success, message = await model.atest_connection()
         
         # 更新可用狀態
         model.is_available = success
-        model.save()
+        await model.asave()
         
         return JsonResponse({
             'success': success,
@@ -357,10 +361,11 @@ def fetch_ollama_models_api(request):
     
     try:
         data = json.loads(request.body)
-        base_url = data.get('base_url', 'http://localhost:11434')
+        base_url = data.get('base_url', settings.OLLAMA_BASE_URL)
         
+        # 使用者手動重新整理，略過快取並更新
         ollama_client = OllamaClient(base_url)
-        models = ollama_client.get_models()
+        models = get_cached_ollama_models(ollama_client, refresh=True)
         
         if models:
             return JsonResponse({
@@ -384,8 +389,8 @@ def fetch_ollama_models_api(request):
 
 @login_required
 @csrf_exempt
-def fetch_gemini_models(request):
-    """獲取 Gemini 可用模型 API"""
+async def fetch_gemini_models(request):
+    """獲取 Gemini 可用模型 API（非同步）"""
     if request.method != 'POST':
         return JsonResponse({'error': '無效的請求方法'}, status=405)
     
@@ -396,8 +401,7 @@ def fetch_gemini_models(request):
         if not api_key:
             return JsonResponse({'error': '缺少 API 金鑰'}, status=400)
         
-        from google import genai
-        client = genai.Client(api_key=api_key)
+        client = get_async_gemini_client(api_key)
         
         # 嘗試獲取模型列表
         try:
@@ -410,7 +414,7 @@ def fetch_gemini_models(request):
             ]
             
             # 測試第一個模型來驗證 API 金鑰
-            test_response = client.models.generate_content(
+            test_response = await client.models.generate_content(
                 model=common_models[0],
                 contents="test"
             )
@@ -435,160 +439,13 @@ def fetch_gemini_models(request):
             'message': str(e)
         }, status=500)
 
-# 修改現有的題目生成函數以支援模型選擇
-def get_user_default_model(user):
-    """獲取使用者的預設模型"""
-    try:
-        preference = UserModelPreference.objects.get(user=user)
-        if preference.default_model and preference.default_model.is_available:
-            return preference.default_model
-    except UserModelPreference.DoesNotExist:
-        pass
-    
-    # 如果沒有預設模型，返回第一個可用的模型
-    available_model = AIModel.objects.filter(
-        user=user, 
-        is_available=True
-    ).first()
-    
-    return available_model
-
-def generate_questions_with_model(session, model=None):
-    """使用指定模型生成題目"""
-    if not model:
-        model = get_user_default_model(session.user)
-        
-    if not model:
-        # 如果沒有可用的模型，使用傳統方式
-        return generate_quiz_questions_fallback(session)
-    
-    # 獲取相關內容
-    kb_ids = list(session.knowledge_bases.values_list('id', flat=True))
-    content = get_relevant_content(kb_ids, session.question_types)
-    
-    if not content:
-        raise Exception("無法找到相關內容")
-    
-    print(f"使用模型 {model.name} 生成 {session.total_questions} 個題目")
-    
-    # 批量生成題目
-    questions = []
-    remaining = session.total_questions
-    temp_history = []
-    
-    while remaining > 0:
-        batch_size = min(remaining, 10)
-        print(f"生成批次：{batch_size} 題，剩餘：{remaining} 題")
-        
-        # 生成提示詞
-        prompt = generate_prompt(
-            count=batch_size,
-            question_types=session.question_types,
-            difficulty=session.difficulty,
-            content=content,
-            history=temp_history
-        )
-        
-        try:
-            # 使用指定模型生成
-            response = model.generate_content(prompt)
-            batch_questions = parse_questions(response)
-            
-            if not batch_questions:
-                raise Exception("本批次無法生成有效題目")
-            
-            print(f"本批次生成 {len(batch_questions)} 個題目")
-            
-            questions.extend(batch_questions)
-            temp_history.extend([{
-                'question_text': q['question_text'],
-                'question_type': q['question_type']
-            } for q in batch_questions])
-            
-            remaining -= len(batch_questions)
-            
-            if len(temp_history) > 20:
-                temp_history = temp_history[-20:]
-                
-        except Exception as e:
-            print(f"批次生成失敗：{str(e)}")
-            if batch_size > 1:
-                batch_size = max(1, batch_size // 2)
-                continue
-            else:
-                raise Exception(f"使用模型 {model.name} 生成題目失敗: {str(e)}")
-    
-    # 儲存題目
-    final_questions = questions[:session.total_questions]
-    session.questions_data = final_questions
-    session.save()
-    
-    print(f"使用 {model.name} 成功生成 {len(final_questions)} 個題目")
-    
-    return final_questions
-
-def generate_quiz_questions_fallback(session):
-    """備用的題目生成方式（當沒有可用模型時）"""
-    # 使用原來的 ollama 客戶端方式
-    from ollama import chat, ChatResponse
-    
-    # 獲取相關內容
-    kb_ids = list(session.knowledge_bases.values_list('id', flat=True))
-    content = get_relevant_content(kb_ids, session.question_types)
-    
-    if not content:
-        raise Exception("無法找到相關內容")
-    
-    print(f"使用備用方式生成 {session.total_questions} 個題目")
-    
-    # 生成提示詞
-    prompt = generate_prompt(
-        count=session.total_questions,
-        question_types=session.question_types,
-        difficulty=session.difficulty,
-        content=content
-    )
-    
-    try:
-        # 使用 ollama 客戶端
-        response: ChatResponse = chat(
-            model="gemma3:4b",  # 預設模型
-            messages=[{'role': 'user', 'content': prompt}],
-            options={'temperature': 0.7}
-        )
-        
-        questions = parse_questions(response['message']['content'])
-        
-        if not questions:
-            raise Exception("無法生成有效題目")
-        
-        # 儲存題目
-        session.questions_data = questions[:session.total_questions]
-        session.save()
-        
-        print(f"備用方式成功生成 {len(session.questions_data)} 個題目")
-        
-    except Exception as e:
-        raise Exception(f"備用方式生成題目失敗: {str(e)}")
-    
-    return session.questions_data
-def save_history_questions(user, knowledge_base_ids, questions):
-    """儲存歷史題目（用於統計，不影響生成邏輯）"""
-    kb_ids_str = ','.join(map(str, sorted(knowledge_base_ids)))
-    
-    for question in questions:
-        question_hash = generate_content_hash(question['question_text'])
-        HistoryQuestion.objects.get_or_create(
-            user=user,
-            knowledge_base_ids=kb_ids_str,
-            question_hash=question_hash,
-            defaults={'question_data': question}
-        )
-
 @login_required
-def quiz_interface(request, session_id):
-    """答題介面"""
-    session = get_object_or_404(QuizSession, id=session_id, user=request.user)
+async def quiz_interface(request, session_id):
+    """答題介面（非同步：即時評分主觀題時等待 LLM 不佔用 worker 執行緒）
+    
+    背景生成中的會話可先作答已生成的題目，頁面以 SSE 接收後續題目
+    """
+    session = await aget_object_or_404(QuizSession, id=session_id, user=await request.auser())
     
     if session.is_completed:
         return redirect('quiz_result', session_id=session.id)
@@ -601,51 +458,95 @@ def quiz_interface(request, session_id):
         if question_index < len(session.questions_data):
             question = session.questions_data[question_index]
             
-            # 評分
-            score = grade_answer(question, user_answer)
+            # 評分：主觀題交由背景任務評分，不阻塞答題流程
+            if settings.ASYNC_GRADING and is_subjective(question):
+                score, grading_status = None, 'pending'
+            else:
+                score, grading_status = await agrade_answer(question, user_answer), 'graded'
             
-            # 儲存答案
-            QuestionAnswer.objects.create(
-                session=session,
-                question_index=question_index,
-                question_text=question['question_text'],
-                question_type=question['question_type'],
-                correct_answer=question['answer_text'],
-                user_answer=user_answer,
-                score=score
+            await sync_to_async(save_quiz_answer)(
+                session, question_index, question, user_answer, score, grading_status
             )
-            
-            # 更新進度
-            session.current_question += 1
-            if session.current_question >= len(session.questions_data):
-                # 答題完成
-                session.is_completed = True
-                session.completed_at = timezone.now()
-                # 計算總分
-                total_score = session.answers.aggregate(
-                    avg_score=models.Avg('score')
-                )['avg_score'] or 0
-                session.score = round(total_score, 1)
-            
-            session.save()
-            
-            if session.is_completed:
-                return redirect('quiz_result', session_id=session.id)
+    elif (not session.is_generating and session.questions_data
+          and session.current_question >= len(session.questions_data)):
+        # 作答到最後一題時生成才結束（例如生成失敗只產生部分題目）
+        await sync_to_async(complete_session)(session)
     
-    # 取得當前題目
+    if session.is_completed:
+        return redirect('quiz_result', session_id=session.id)
+    
+    return await sync_to_async(render_quiz_interface)(request, session)
+
+def save_quiz_answer(session, question_index, question, user_answer, score, grading_status):
+    """儲存答案並更新答題進度"""
+    answer = QuestionAnswer.objects.create(
+        session=session,
+        question_index=question_index,
+        question_text=question['question_text'],
+        question_type=question['question_type'],
+        correct_answer=question['answer_text'],
+        user_answer=user_answer,
+        score=score,
+        grading_status=grading_status
+    )
+    if grading_status == 'pending' and not settings.GRADING_BATCH_ENABLED:
+        enqueue('grade_answer', answer_id=answer.id)
+    
+    # 更新進度（背景生成中的會話要等生成結束才算作答完成）
+    session.current_question += 1
+    if not session.is_generating and session.current_question >= len(session.questions_data):
+        complete_session(session)
+    else:
+        # 不覆寫背景任務正在寫入的題目資料
+        session.save(update_fields=['current_question'])
+
+def complete_session(session):
+    """標記答題完成並計算總分"""
+    session.is_completed = True
+    session.completed_at = timezone.now()
+    # 計算總分（仍有評分中的答案時待背景評分完成後補上）
+    session.score = compute_session_score(session)
+    session.save(update_fields=['current_question', 'is_completed', 'completed_at', 'score'])
+    
+    # 批次模式下，答題完成後一次評分所有主觀題
+    if session.score is None and settings.GRADING_BATCH_ENABLED:
+        enqueue('grade_session', session_id=session.id)
+
+def render_quiz_interface(request, session):
+    """顯示當前題目（背景生成中且尚未生成下一題時顯示等待畫面）"""
     current_question = None
     if session.current_question < len(session.questions_data):
         current_question = session.questions_data[session.current_question]
     
+    # 生成中以設定的總題數計算進度
+    total_questions = session.total_questions if session.is_generating else len(session.questions_data)
+    
     context = {
         'session': session,
         'current_question': current_question,
         'question_number': session.current_question + 1,
-        'total_questions': len(session.questions_data),
-        'progress': (session.current_question / len(session.questions_data)) * 100
+        'total_questions': total_questions,
+        'generated_questions': len(session.questions_data),
+        'progress': (session.current_question / total_questions) * 100 if total_questions else 0
     }
     return render(request, 'quiz/quiz_interface.html', context)
 
+@login_required
+async def quiz_generation_events(request, session_id):
+    """題目生成進度 SSE 串流（批次進度、已生成題數與錯誤）"""
+    session = await aget_object_or_404(QuizSession, id=session_id, user=await request.auser())
+    
+    # ASGI 使用非同步串流；WSGI 下非同步迭代器會被整個讀完才送出，改用同步串流
+    if isinstance(request, ASGIRequest):
+        stream = ageneration_event_stream(session.id)
+    else:
+        stream = generation_event_stream(session.id)
+    
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 停用 nginx 等反向代理的緩衝
+    return response
+
 @login_required
 def flashcard_interface(request, session_id):
     """閃卡介面"""
@@ -722,9 +623,11 @@ def quiz_result(request, session_id):
     """答題結果"""
     session = get_object_or_404(QuizSession, id=session_id, user=request.user)
     answers = session.answers.all().order_by('question_index')
+    refresh_session_score(session)
     
     correct_count = answers.filter(score=100).count()
     total_count = answers.count()
+    pending_count = answers.filter(grading_status='pending').count()
     accuracy_rate = round((correct_count / total_count * 100), 1) if total_count > 0 else 0
     
     # 將題目資料與答案配對，方便模板使用
@@ -748,20 +651,48 @@ def quiz_result(request, session_id):
         'answer_details': answer_details,
         'correct_count': correct_count,
         'total_count': total_count,
-        'accuracy_rate': accuracy_rate
+        'accuracy_rate': accuracy_rate,
+        'pending_count': pending_count
     }
     return render(request, 'quiz/quiz_result.html', context)
 
+@login_required
+def quiz_grading_status(request, session_id):
+    """答題評分進度 API"""
+    session = get_object_or_404(QuizSession, id=session_id, user=request.user)
+    score = refresh_session_score(session)
+    answers = session.answers.all()
+    
+    return JsonResponse({
+        'pending': answers.filter(grading_status='pending').count(),
+        'failed': answers.filter(grading_status='failed').count(),
+        'score': score,
+    })
+
 @login_required
 def knowledge_base_list(request):
     """知識庫列表 - 條列式視圖"""
-    knowledge_bases = KnowledgeBase.objects.filter(user=request.user).order_by('-created_at')
+    knowledge_bases = KnowledgeBase.objects.filter(
+        user=request.user
+    ).prefetch_related('ingestion_jobs').order_by('-created_at')
     
     context = {
         'knowledge_bases': knowledge_bases,
+        **fragment_cache_context(request.user, SCOPE_KNOWLEDGE_BASES),
     }
     return render(request, 'quiz/knowledge_base_list.html', context)
 
+def validate_knowledge_upload(uploaded_file):
+    """檢查上傳的知識庫檔案，返回錯誤訊息（通過時為 None）"""
+    if not uploaded_file:
+        return '請選擇要上傳的檔案'
+    if not uploaded_file.name.lower().endswith('.txt'):
+        return '請上傳 .txt 格式的檔案'
+    max_size = settings.KNOWLEDGE_BASE_MAX_UPLOAD_SIZE
+    if uploaded_file.size > max_size:
+        return f'檔案大小不能超過 {max_size // (1024 * 1024)}MB'
+    return None
+
 @login_required
 def knowledge_base_add(request):
     """新增知識庫 - 處理表單提交"""
@@ -774,47 +705,39 @@ def knowledge_base_add(request):
             messages.error(request, '請輸入知識庫名稱')
             return redirect('knowledge_base_list')
             
-        if not uploaded_file:
-            messages.error(request, '請選擇要上傳的檔案')
-            return redirect('knowledge_base_list')
-        
         # 檔案驗證
-        if not uploaded_file.name.lower().endswith('.txt'):
-            messages.error(request, '請上傳 .txt 格式的檔案')
-            return redirect('knowledge_base_list')
-            
-        if uploaded_file.size > 10 * 1024 * 1024:  # 10MB
-            messages.error(request, '檔案大小不能超過 10MB')
+        error = validate_knowledge_upload(uploaded_file)
+        if error:
+            messages.error(request, error)
             return redirect('knowledge_base_list')
         
         try:
-            # 讀取檔案內容
-            content = uploaded_file.read().decode('utf-8')
-            
             # 檢查是否已存在同名知識庫
             if KnowledgeBase.objects.filter(user=request.user, name=name).exists():
                 messages.warning(request, f'知識庫「{name}」已存在，請使用其他名稱')
                 return redirect('knowledge_base_list')
             
-            # 生成摘要
-            summary = generate_summary(content)
+            # 以串流方式檢查編碼並取得預覽，不將整個檔案讀入記憶體
+            preview, content_length = inspect_text_upload(
+                uploaded_file, settings.KNOWLEDGE_BASE_PREVIEW_CHARS
+            )
             
-            # 建立知識庫
-            kb = KnowledgeBase.objects.create(
+            # 建立知識庫（原始檔逐段寫入磁碟，摘要與向量嵌入由背景 worker 處理）
+            kb = KnowledgeBase(
                 name=name,
-                summary=summary,
-                content=content,
+                summary='摘要生成中...',
+                content=preview,
+                content_length=content_length,
                 user=request.user
             )
+            kb.source_file.save(uploaded_file.name, uploaded_file, save=False)
+            kb.save()
             
-            # 建立向量嵌入（在背景執行）
-            try:
-                chunk_count = create_embeddings(kb)
-                messages.success(request, 
-                    f'知識庫「{name}」建立成功！已建立 {chunk_count} 個知識片段，可用於題目生成。')
-            except Exception as e:
-                messages.warning(request, 
-                    f'知識庫「{name}」建立成功，但向量索引建立失敗：{str(e)}。仍可使用基本功能。')
+            # 排入背景建立任務
+            job = IngestionJob.objects.create(knowledge_base=kb)
+            enqueue('ingest_knowledge_base', job_id=job.id)
+            messages.success(request, 
+                f'知識庫「{name}」已上傳，正在背景生成摘要與建立知識片段，完成後即可用於題目生成。')
                 
         except UnicodeDecodeError:
             messages.error(request, '檔案編碼錯誤，請確保檔案為 UTF-8 編碼的文本檔案')
@@ -823,11 +746,75 @@ def knowledge_base_add(request):
     
     return redirect('knowledge_base_list')
 
+@login_required
+@require_http_methods(["POST"])
+def knowledge_base_update(request, kb_id):
+    """以新檔案更新知識庫內容，背景重新建立時只重新編碼有變動的片段"""
+    kb = get_object_or_404(KnowledgeBase, id=kb_id, user=request.user)
+    uploaded_file = request.FILES.get('file')
+    
+    error = validate_knowledge_upload(uploaded_file)
+    if error:
+        messages.error(request, error)
+        return redirect('knowledge_base_list')
+    
+    job = kb.ingestion_jobs.first()
+    if job and not job.is_finished:
+        messages.warning(request, f'知識庫「{kb.name}」正在建立中，請待完成後再更新')
+        return redirect('knowledge_base_list')
+    
+    try:
+        preview, content_length = inspect_text_upload(
+            uploaded_file, settings.KNOWLEDGE_BASE_PREVIEW_CHARS
+        )
+        
+        # 替換原始檔；既有片段在重新建立完成前仍可用於檢索
+        if kb.source_file:
+            kb.source_file.delete(save=False)
+        kb.source_file.save(uploaded_file.name, uploaded_file, save=False)
+        kb.content = preview
+        kb.content_length = content_length
+        kb.save()
+        
+        job = IngestionJob.objects.create(knowledge_base=kb)
+        enqueue('ingest_knowledge_base', job_id=job.id)
+        messages.success(request, f'知識庫「{kb.name}」已更新，正在背景重新建立知識片段')
+    except UnicodeDecodeError:
+        messages.error(request, '檔案編碼錯誤，請確保檔案為 UTF-8 編碼的文本檔案')
+    except Exception as e:
+        messages.error(request, f'更新知識庫失敗：{str(e)}')
+    
+    return redirect('knowledge_base_list')
+
+@login_required
+def knowledge_base_status(request, kb_id):
+    """知識庫背景建立進度 API"""
+    kb = get_object_or_404(KnowledgeBase, id=kb_id, user=request.user)
+    job = kb.ingestion_jobs.first()
+    
+    if job is None:
+        # 舊資料沒有建立任務，視為已完成
+        return JsonResponse({
+            'knowledge_base_id': kb.id,
+            'status': 'completed',
+            'stage': 'done',
+            'total_chunks': kb.chunks.count(),
+            'embedded_chunks': kb.chunks.count(),
+            'eta_seconds': 0,
+            'error': '',
+        })
+    
+    data = job.to_status_dict()
+    data['summary'] = kb.summary
+    return JsonResponse(data)
+
 @login_required
 def knowledge_base_delete(request, kb_id):
     """刪除知識庫"""
     kb = get_object_or_404(KnowledgeBase, id=kb_id, user=request.user)
     kb_name = kb.name
+    if kb.source_file:
+        kb.source_file.delete(save=False)
     kb.delete()
     messages.success(request, f'已刪除知識庫「{kb_name}」')
     return redirect('knowledge_base_list')
@@ -841,15 +828,12 @@ def user_profile(request):
         is_completed=True
     ).order_by('-completed_at')[:20]
     
-    # 統計資料
-    total_quizzes = quiz_sessions.count()
-    avg_score = quiz_sessions.aggregate(
-        avg=models.Avg('score')
-    )['avg'] or 0
+    # 統計資料（所有已完成的會話，不限於上方列出的 20 筆；片段快取命中時不會查詢）
+    stats = SimpleLazyObject(lambda: get_user_stats(request.user))
     
     context = {
         'quiz_sessions': quiz_sessions,
-        'total_quizzes': total_quizzes,
-        'avg_score': round(avg_score, 1)
+        'stats': stats,
+        **fragment_cache_context(request.user, SCOPE_QUIZZES, SCOPE_KNOWLEDGE_BASES),
     }
     return render(request, 'quiz/user_profile.html', context)
\ No newline at end of file
@@ -0,0 +1,17 @@
+"""
+Django 的 ASGI 設定檔 - 智能答題系統
+
+本檔案包含 ASGI 可調用物件，作為 Django 專案的 ASGI 應用程式。
+
+出題、評分與模型測試等非同步視圖在 ASGI 伺服器上執行時，
+等待 LLM 回應的期間不佔用執行緒，單一 worker 可同時保持多個生成請求。
+"""
+
+import os
+from django.core.asgi import get_asgi_application
+
+# 設定 Django 設定模組
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quiz_system.settings')
+
+# 取得 ASGI 應用程式
+application = get_asgi_application()
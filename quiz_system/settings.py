@@ -19,6 +19,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'quiz',
 ]
 
@@ -51,6 +52,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'quiz_system.wsgi.application'
+ASGI_APPLICATION = 'quiz_system.asgi.application'
 
 # 資料庫設定 (PostgreSQL + pgvector)
 DATABASES = {
@@ -86,9 +88,119 @@ LOGIN_URL = '/admin/login/'
 LOGIN_REDIRECT_URL = '/'
 
 # 文件上傳設定
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB，超過時 Django 改以暫存檔接收
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
 
+# 知識庫上傳設定（原始檔以串流方式寫入磁碟，背景任務逐段讀取建立片段）
+KNOWLEDGE_UPLOAD_ROOT = os.getenv('KNOWLEDGE_UPLOAD_ROOT', str(BASE_DIR / 'uploads'))  # 需與 worker 共用
+KNOWLEDGE_BASE_MAX_UPLOAD_SIZE = int(os.getenv('KNOWLEDGE_BASE_MAX_UPLOAD_SIZE', str(500 * 1024 * 1024)))  # 500MB
+KNOWLEDGE_BASE_PREVIEW_CHARS = int(os.getenv('KNOWLEDGE_BASE_PREVIEW_CHARS', '5000'))  # 資料庫中保存的內容預覽字數
+EMBEDDING_INGEST_BATCH = int(os.getenv('EMBEDDING_INGEST_BATCH', '256'))  # 每批編碼並寫入的片段數
+
+# 知識片段切分設定（可用 benchmark_chunking 指令比較不同策略）
+CHUNKER = os.getenv('CHUNKER', 'token')  # token：依模型 token 數切分並重疊；sentence：依字元數切分
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '384'))  # 每個片段的 token 上限（含特殊 token）
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '48'))  # 相鄰片段重疊的 token 數
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '500'))  # sentence 策略的片段字元數
+
 # Embedding 模型設定
 EMBEDDING_MODEL = 'jinaai/jina-embeddings-v2-base-zh'
-OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'gemma3:4b')
\ No newline at end of file
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '32'))  # 每批送入模型的片段數
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')  # torch 或 onnx（CPU 節點建議 onnx + int8）
+EMBEDDING_TORCH_DTYPE = os.getenv('EMBEDDING_TORCH_DTYPE', 'bfloat16')  # torch 後端的精度：bfloat16 或 float32
+EMBEDDING_ONNX_PATH = os.getenv('EMBEDDING_ONNX_PATH', str(BASE_DIR / 'models' / 'embedding-int8.onnx'))  # 由 export_onnx_embedding 產生
+EMBEDDING_ONNX_THREADS = int(os.getenv('EMBEDDING_ONNX_THREADS', '0'))  # ONNX Runtime 執行緒數，0 為自動
+EMBEDDING_MAX_LENGTH = int(os.getenv('EMBEDDING_MAX_LENGTH', '8192'))  # onnx 後端的最大 token 數（與模型 encode 預設相同）
+EMBEDDING_TARGET_THROUGHPUT = float(os.getenv('EMBEDDING_TARGET_THROUGHPUT', '20'))  # chunks/sec，低於此值會記錄警告
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '1024'))  # 行程內查詢向量快取筆數
+EMBEDDING_CACHE_TTL = int(os.getenv('EMBEDDING_CACHE_TTL', '3600'))  # 使用者查詢的快取秒數（固定查詢不過期）
+EMBEDDING_CACHE_REDIS = os.getenv('EMBEDDING_CACHE_REDIS', 'True') == 'True'  # 有 REDIS_URL 時啟用共享快取層
+EMBEDDING_WARMUP = os.getenv('EMBEDDING_WARMUP', 'False') == 'True'  # 啟動時預先載入模型並計算固定查詢向量
+EMBEDDING_SERVER_URL = os.getenv('EMBEDDING_SERVER_URL', '')  # 共用嵌入伺服器（http://host:port 或 unix:///path），留空則在各行程內載入模型
+EMBEDDING_SERVER_MAX_BATCH = int(os.getenv('EMBEDDING_SERVER_MAX_BATCH', '64'))  # 伺服器合併請求的最大文本數
+EMBEDDING_SERVER_MAX_WAIT_MS = float(os.getenv('EMBEDDING_SERVER_MAX_WAIT_MS', '10'))  # 第一個請求到達後等待合併的毫秒數
+EMBEDDING_SERVER_TIMEOUT = float(os.getenv('EMBEDDING_SERVER_TIMEOUT', '60'))  # 呼叫嵌入伺服器的逾時秒數
+
+# 向量搜尋設定（pgvector ANN 索引）
+VECTOR_INDEX_TYPE = os.getenv('VECTOR_INDEX_TYPE', 'hnsw')  # hnsw 或 ivfflat，由 rebuild_vector_index 指令套用
+VECTOR_INDEX_IVFFLAT_LISTS = int(os.getenv('VECTOR_INDEX_IVFFLAT_LISTS', '100'))
+VECTOR_SEARCH_EF_SEARCH = int(os.getenv('VECTOR_SEARCH_EF_SEARCH', '40'))  # HNSW 查詢候選數
+VECTOR_SEARCH_PROBES = int(os.getenv('VECTOR_SEARCH_PROBES', '10'))  # IVFFlat 掃描的 list 數
+VECTOR_SEARCH_ITERATIVE_SCAN = os.getenv('VECTOR_SEARCH_ITERATIVE_SCAN', '')  # pgvector 0.8+：relaxed_order / strict_order
+VECTOR_STORAGE = os.getenv('VECTOR_STORAGE', 'vector')  # vector（float32）或 halfvec（float16），由 convert_vector_storage 指令套用
+VECTOR_QUANTIZATION = os.getenv('VECTOR_QUANTIZATION', 'none')  # none 或 binary（索引以 binary_quantize 建立，需重建索引）
+VECTOR_RERANK_CANDIDATES = int(os.getenv('VECTOR_RERANK_CANDIDATES', '40'))  # halfvec / binary 時以完整精度重新排序的候選數
+
+# 混合檢索設定（向量 + pg_trgm 關鍵字，以 reciprocal rank fusion 融合）
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'hybrid')  # hybrid 或 vector
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '20'))  # 每個查詢兩邊各取的候選數
+HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))  # RRF 平滑常數
+HYBRID_TEXT_THRESHOLD = float(os.getenv('HYBRID_TEXT_THRESHOLD', '0.3'))  # pg_trgm word_similarity 門檻
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'gemma3:4b')
+OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+
+# LLM 客戶端設定（每個服務共用一組保持連線的客戶端）
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '300'))  # 單次請求逾時（秒）
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '10'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BACKOFF = float(os.getenv('LLM_RETRY_BACKOFF', '1.0'))  # 指數退避的基準秒數
+LLM_POOL_CONNECTIONS = int(os.getenv('LLM_POOL_CONNECTIONS', '10'))  # 每個服務保持的連線數
+
+# LLM 回應快取設定（摘要、評分等相同提示詞直接返回先前結果）
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'True') == 'True'
+LLM_CACHE_SIZE = int(os.getenv('LLM_CACHE_SIZE', '512'))  # 行程內快取筆數
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', '86400'))  # 快取秒數
+LLM_CACHE_REDIS = os.getenv('LLM_CACHE_REDIS', 'True') == 'True'  # 有 REDIS_URL 時啟用共享快取層
+LLM_CACHE_SEMANTIC_THRESHOLD = float(os.getenv('LLM_CACHE_SEMANTIC_THRESHOLD', '0'))  # 語意相似門檻（如 0.97），0 表示停用
+
+# 題目生成並行設定（Ollama 需同時設定 OLLAMA_NUM_PARALLEL 才能真正並行）
+LLM_GENERATION_WORKERS = int(os.getenv('LLM_GENERATION_WORKERS', '8'))
+LLM_MAX_CONCURRENCY = {
+    'ollama': int(os.getenv('OLLAMA_NUM_PARALLEL', '4')),
+    'gemini': int(os.getenv('GEMINI_MAX_CONCURRENCY', '5')),
+}
+
+# 題庫設定（知識庫建立後於背景預先生成題目）
+QUESTION_POOL_ENABLED = os.getenv('QUESTION_POOL_ENABLED', 'True') == 'True'
+QUESTION_POOL_TARGET = int(os.getenv('QUESTION_POOL_TARGET', '10'))  # 每個（題型, 難度）分組的目標題數
+QUESTION_POOL_REFILL_THRESHOLD = int(os.getenv('QUESTION_POOL_REFILL_THRESHOLD', '5'))  # 低於此數時背景補充
+
+# 出題設定（背景生成題目，答題頁面以 SSE 接收生成進度）
+QUIZ_BACKGROUND_GENERATION = os.getenv('QUIZ_BACKGROUND_GENERATION', 'True') == 'True'
+QUIZ_EVENTS_POLL_INTERVAL = float(os.getenv('QUIZ_EVENTS_POLL_INTERVAL', '0.5'))  # SSE 檢查進度的間隔（秒）
+QUIZ_EVENTS_KEEPALIVE = float(os.getenv('QUIZ_EVENTS_KEEPALIVE', '15'))  # 無事件時送出心跳的間隔（秒）
+QUIZ_EVENTS_TIMEOUT = float(os.getenv('QUIZ_EVENTS_TIMEOUT', '600'))  # 單一 SSE 連線的最長時間，逾時由瀏覽器重新連線
+
+# 評分設定（簡答、申論題交由背景任務評分）
+ASYNC_GRADING = os.getenv('ASYNC_GRADING', 'True') == 'True'
+GRADING_MAX_RETRIES = int(os.getenv('GRADING_MAX_RETRIES', '3'))
+GRADING_BATCH_ENABLED = os.getenv('GRADING_BATCH_ENABLED', 'True') == 'True'  # 答題完成後一次評分所有主觀題
+GRADING_BATCH_SIZE = int(os.getenv('GRADING_BATCH_SIZE', '10'))  # 每次 LLM 呼叫評分的題數
+
+# 背景任務佇列設定（有 REDIS_URL 時使用 Redis，否則在 Web 行程內以執行緒執行）
+REDIS_URL = os.getenv('REDIS_URL', '')
+JOB_QUEUE_BACKEND = os.getenv('JOB_QUEUE_BACKEND', 'redis' if REDIS_URL else 'local')
+JOB_QUEUE_NAME = os.getenv('JOB_QUEUE_NAME', 'quiz:jobs')
+JOB_QUEUE_LOCAL_WORKERS = int(os.getenv('JOB_QUEUE_LOCAL_WORKERS', '2'))
+JOB_QUEUE_EAGER = os.getenv('JOB_QUEUE_EAGER', 'False') == 'True'  # 測試時同步執行任務
+
+# 快取設定（有 REDIS_URL 時各行程共用 Redis，否則使用行程內記憶體；測試時可設為 locmem）
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'redis' if REDIS_URL else 'locmem')
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'quiz'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'quiz-cache',
+        }
+    }
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', 'True') == 'True'  # 依使用者快取頁面片段，資料異動時由 signals 失效
+PAGE_CACHE_TIMEOUT = int(os.getenv('CACHE_TIMEOUT', '3600'))  # 片段快取秒數（僅作為上限，失效不依賴逾時）
+OLLAMA_MODELS_CACHE_TIMEOUT = int(os.getenv('OLLAMA_MODELS_CACHE_TIMEOUT', '60'))  # Ollama 模型清單快取秒數
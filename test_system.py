@@ -25,6 +25,26 @@ from quiz.models import *
 from quiz.utils import *
 from quiz.rag_utils import *
 
+def test(test_name):
+    """測試裝飾器（記錄結果到 SystemTester 實例）"""
+    def decorator(func):
+        def wrapper(self, *args, **kwargs):
+            print(f"\n🧪 測試: {test_name}")
+            try:
+                result = func(self, *args, **kwargs)
+                print(f"✅ 通過: {test_name}")
+                self.passed += 1
+                self.results.append({"test": test_name, "status": "PASS", "error": None})
+                return result
+            except Exception as e:
+                print(f"❌ 失敗: {test_name}")
+                print(f"   錯誤: {str(e)}")
+                self.failed += 1
+                self.results.append({"test": test_name, "status": "FAIL", "error": str(e)})
+                return None
+        return wrapper
+    return decorator
+
 class SystemTester:
     """系統測試類"""
     
@@ -33,26 +53,6 @@ class SystemTester:
         self.failed = 0
         self.results = []
     
-    def test(self, test_name):
-        """測試裝飾器"""
-        def decorator(func):
-            def wrapper(*args, **kwargs):
-                print(f"\n🧪 測試: {test_name}")
-                try:
-                    result = func(*args, **kwargs)
-                    print(f"✅ 通過: {test_name}")
-                    self.passed += 1
-                    self.results.append({"test": test_name, "status": "PASS", "error": None})
-                    return result
-                except Exception as e:
-                    print(f"❌ 失敗: {test_name}")
-                    print(f"   錯誤: {str(e)}")
-                    self.failed += 1
-                    self.results.append({"test": test_name, "status": "FAIL", "error": str(e)})
-                    return None
-            return wrapper
-        return decorator
-    
     @test("資料庫連接測試")
     def test_database_connection(self):
         """測試資料庫連接"""
@@ -203,6 +203,255 @@ class SystemTester:
         
         return True
     
+    @test("知識庫重新建立測試")
+    def test_reingest_knowledge_base(self):
+        """測試重新建立片段時沿用未變的片段、重用共用向量、重建零向量片段，且替換在單一交易中完成"""
+        from unittest import mock
+        import numpy as np
+        from quiz.rag_utils import create_embeddings, generate_content_hash
+        
+        class FakeEmbeddingService:
+            """依內容產生固定的非零向量，並記錄實際編碼的文本"""
+            def __init__(self):
+                self.encoded = []
+            
+            def _zeros(self, count):
+                return np.zeros((count, 768), dtype=np.float32)
+            
+            def encode_batch(self, texts, **kwargs):
+                self.encoded.extend(texts)
+                vectors = self._zeros(len(texts))
+                for row, text in zip(vectors, texts):
+                    row[int(generate_content_hash(text), 16) % 768] = 1.0
+                return vectors
+        
+        def ingest(kb, sentences, model='test-reingest'):
+            kb.content = ''.join(sentences)
+            kb.save()
+            service = FakeEmbeddingService()
+            with override_settings(CHUNKER='sentence', CHUNK_SIZE=20, EMBEDDING_INGEST_BATCH=2,
+                                   EMBEDDING_MODEL=model), \
+                    mock.patch('quiz.rag_utils.get_embedding_service', return_value=service):
+                count = create_embeddings(kb)
+            return count, service.encoded
+        
+        def chunk_ids(kb):
+            return dict(KnowledgeChunk.objects.filter(knowledge_base=kb).values_list('content', 'id'))
+        
+        user, _ = User.objects.get_or_create(username='test_user', defaults={'email': 'test@example.com'})
+        kb = KnowledgeBase.objects.create(name="重新建立測試", user=user, content='')
+        a, b, c, d = (
+            "甲句說明光合作用的基本原理。", "乙句說明細胞呼吸的能量轉換。",
+            "丙句說明蒸散作用的水分流失。", "丁句說明酵素活性的溫度影響。",
+        )
+        
+        try:
+            count, encoded = ingest(kb, [a, b, c])
+            assert count == 3 and encoded == [a, b, c], f"首次建立結果錯誤: {count}, {encoded}"
+            before = chunk_ids(kb)
+            
+            # 乙句的向量編碼失敗（零向量），重新建立時需以共用儲存的向量重建而不重新編碼
+            KnowledgeChunk.objects.filter(knowledge_base=kb, content=b).update(embedding=[0.0] * 768)
+            count, encoded = ingest(kb, [a, b, d])
+            after = chunk_ids(kb)
+            assert count == 3 and encoded == [d], f"只應編碼新內容: {encoded}"
+            assert after[a] == before[a], "內容未變的片段應沿用"
+            assert after[b] != before[b], "零向量片段應重建"
+            assert c not in after, "已移除的內容應刪除"
+            rebuilt = KnowledgeChunk.objects.get(id=after[b])
+            assert np.any(np.asarray(rebuilt.embedding)), "重建的片段應使用共用儲存中的向量"
+            
+            # 替換片段失敗時整批回滾，保留原本的片段
+            with mock.patch('quiz.rag_utils.load_stored_embeddings', side_effect=RuntimeError("測試中斷")):
+                count, _ = ingest(kb, [a, c])
+            assert count == 0, "替換失敗時應返回 0"
+            assert chunk_ids(kb) == after, "替換失敗後片段應維持原狀"
+            
+            # 更換嵌入模型後不沿用舊模型的向量
+            count, encoded = ingest(kb, [a, b, d], model='test-reingest-v2')
+            assert sorted(encoded) == sorted([a, b, d]), f"更換模型後應全部重新編碼: {encoded}"
+            assert not set(chunk_ids(kb).values()) & set(after.values()), "更換模型後不應沿用舊片段"
+        finally:
+            kb.delete()
+            ChunkEmbedding.objects.filter(model_name__in=['test-reingest', 'test-reingest-v2']).delete()
+        
+        return True
+    
+    def create_retrieval_fixture(self):
+        """建立檢索測試資料：片段向量為單位向量，查詢向量固定，另建一個不應被搜尋到的知識庫
+        
+        返回 (知識庫, 其他知識庫, 片段內容, 查詢向量編碼器)
+        """
+        import numpy as np
+        from quiz.rag_utils import generate_content_hash
+        
+        def unit(*weights):
+            vector = np.zeros(768, dtype=np.float32)
+            for index, weight in weights:
+                vector[index] = weight
+            return vector / np.linalg.norm(vector)
+        
+        class FakeQueryEncoder:
+            """依查詢文字返回固定向量"""
+            vectors = {
+                'q0': unit((0, 1), (1, 0.5)),      # 最接近 c0，其次 c1
+                'q1': unit((2, 1), (1, 0.5)),      # 最接近 c2，其次 c1
+                'mitochondria': unit((0, 1), (1, 0.5)),
+            }
+            
+            def encode_query(self, text):
+                return self.vectors[text]
+        
+        user, _ = User.objects.get_or_create(username='test_user', defaults={'email': 'test@example.com'})
+        kb = KnowledgeBase.objects.create(name="檢索測試", user=user, content='')
+        other = KnowledgeBase.objects.create(name="檢索測試（其他）", user=user, content='')
+        contents = {
+            'c0': "甲片段說明 mitochondria 的能量轉換",
+            'c1': "乙片段說明光合作用的基本原理",
+            'c2': "丙片段說明蒸散作用的水分流失",
+            'c3': "丁片段補充 mitochondria 的構造",
+        }
+        embeddings = {'c0': unit((0, 1)), 'c1': unit((1, 1)), 'c2': unit((2, 1)), 'c3': unit((5, 1))}
+        for index, (key, content) in enumerate(contents.items()):
+            KnowledgeChunk.objects.create(
+                knowledge_base=kb, content=content, content_hash=generate_content_hash(content),
+                embedding=embeddings[key].tolist(), chunk_index=index
+            )
+        # 與 q0 最接近的片段放在其他知識庫，用來確認知識庫過濾條件
+        KnowledgeChunk.objects.create(
+            knowledge_base=other, content="其他知識庫的片段內容", embedding=unit((0, 1)).tolist(), chunk_index=0
+        )
+        return kb, other, contents, FakeQueryEncoder()
+    
+    @test("向量檢索與 ANN 參數測試")
+    def test_vector_search(self):
+        """測試 search_similar_chunks 依距離排序、只搜尋指定知識庫，且 ANN 參數只作用於本次交易"""
+        from unittest import mock
+        from django.db import connection, transaction
+        from quiz.rag_utils import apply_vector_search_settings, search_similar_chunks
+        
+        kb, other, contents, encoder = self.create_retrieval_fixture()
+        try:
+            with override_settings(RETRIEVAL_MODE='vector'), \
+                    mock.patch('quiz.rag_utils.get_embedding_service', return_value=encoder):
+                results = search_similar_chunks('q0', [kb.id], top_k=2, ef_search=100, probes=5)
+            assert [r['content'] for r in results] == [contents['c0'], contents['c1']], f"排序錯誤: {results}"
+            assert all(r['knowledge_base_id'] == kb.id for r in results), "搜尋到其他知識庫的片段"
+            assert results[0]['similarity'] > results[1]['similarity'], "相似度應隨距離遞減"
+            
+            with transaction.atomic(), connection.cursor() as cursor:
+                apply_vector_search_settings(cursor, ef_search=77, probes=3)
+                cursor.execute("SELECT current_setting('hnsw.ef_search'), current_setting('ivfflat.probes')")
+                assert cursor.fetchone() == ('77', '3'), "ANN 參數未套用"
+                
+                # 需重新排序時 ef_search 至少涵蓋候選數
+                with override_settings(VECTOR_QUANTIZATION='binary', VECTOR_RERANK_CANDIDATES=120):
+                    apply_vector_search_settings(cursor, ef_search=10)
+                cursor.execute("SELECT current_setting('hnsw.ef_search')")
+                assert cursor.fetchone()[0] == '120', "重新排序時 ef_search 應不小於候選數"
+            
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT current_setting('hnsw.ef_search', true)")
+                assert cursor.fetchone()[0] != '120', "ANN 參數不應影響交易外的查詢"
+        finally:
+            kb.delete()
+            other.delete()
+        
+        return True
+    
+    @test("多查詢 LATERAL 檢索測試")
+    def test_multi_query_search(self):
+        """測試單一 SQL 的多查詢檢索依查詢順序與距離排序、跨查詢去重並限制總數"""
+        from unittest import mock
+        from quiz.rag_utils import search_similar_chunks_multi
+        
+        kb, other, contents, encoder = self.create_retrieval_fixture()
+        try:
+            with override_settings(RETRIEVAL_MODE='vector'), \
+                    mock.patch('quiz.rag_utils.get_embedding_service', return_value=encoder):
+                results = search_similar_chunks_multi(['q0', 'q1'], [kb.id], top_k=2)
+                limited = search_similar_chunks_multi(['q0', 'q1'], [kb.id], top_k=2, max_results=2)
+            
+            # c1 同時是兩個查詢的第二名，只保留在第一個查詢
+            hits = [(r['content'], r['query_index']) for r in results]
+            assert hits == [(contents['c0'], 0), (contents['c1'], 0), (contents['c2'], 1)], f"結果錯誤: {hits}"
+            assert [r['content'] for r in limited] == [contents['c0'], contents['c1']], "max_results 未生效"
+        finally:
+            kb.delete()
+            other.delete()
+        
+        return True
+    
+    @test("混合檢索測試")
+    def test_hybrid_search(self):
+        """測試向量與 trigram 關鍵字結果以 RRF 融合：只有關鍵字命中的片段也會返回，兩邊都命中的排在最前"""
+        from unittest import mock
+        from quiz.rag_utils import search_hybrid_chunks
+        
+        kb, other, contents, encoder = self.create_retrieval_fixture()
+        try:
+            with mock.patch('quiz.rag_utils.get_embedding_service', return_value=encoder):
+                # 向量只取 1 筆候選（c0），c3 只能由關鍵字比對找到
+                results = search_hybrid_chunks(['mitochondria'], [kb.id], top_k=3, candidates=1)
+            
+            assert [r['content'] for r in results] == [contents['c0'], contents['c3']], f"融合結果錯誤: {results}"
+            assert results[0]['score'] > results[1]['score'], "兩邊都命中的片段分數應較高"
+            assert results[1]['similarity'] == 0, "只由關鍵字找到的片段沒有向量相似度"
+        finally:
+            kb.delete()
+            other.delete()
+        
+        return True
+    
+    @test("向量儲存轉換檢索測試")
+    def test_vector_storage_search(self):
+        """測試 halfvec 儲存與 binary 量化候選重新排序後的結果與 float32 相同
+        
+        欄位轉換在交易中進行並於結束時回滾（會重寫 quiz_knowledgechunk，資料量大時較慢）
+        """
+        from unittest import mock
+        from django.db import connection, transaction
+        from quiz.rag_utils import search_similar_chunks_multi
+        from quiz.vector_index import convert_vector_storage, get_vector_storage
+        
+        class Rollback(Exception):
+            pass
+        
+        kb, other, contents, encoder = self.create_retrieval_fixture()
+        # 重新排序使用共用向量儲存中的完整精度向量
+        for chunk in KnowledgeChunk.objects.filter(knowledge_base=kb):
+            ChunkEmbedding.objects.create(content_hash=chunk.content_hash, model_name='test-retrieval',
+                                          embedding=chunk.embedding)
+        
+        try:
+            with override_settings(RETRIEVAL_MODE='vector', EMBEDDING_MODEL='test-retrieval'), \
+                    mock.patch('quiz.rag_utils.get_embedding_service', return_value=encoder):
+                expected = search_similar_chunks_multi(['q0', 'q1'], [kb.id], top_k=2)
+                try:
+                    with transaction.atomic():
+                        with connection.cursor() as cursor:
+                            convert_vector_storage(cursor, 'halfvec')
+                            assert get_vector_storage(cursor) == 'halfvec', "欄位型別未轉換"
+                        with override_settings(VECTOR_STORAGE='halfvec', VECTOR_QUANTIZATION='binary'):
+                            results = search_similar_chunks_multi(['q0', 'q1'], [kb.id], top_k=2)
+                        raise Rollback()
+                except Rollback:
+                    pass
+            
+            with connection.cursor() as cursor:
+                assert get_vector_storage(cursor) == 'vector', "欄位型別應已回滾"
+            
+            hits = [(r['content'], r['query_index']) for r in results]
+            assert hits == [(r['content'], r['query_index']) for r in expected], f"重新排序結果不同: {hits}"
+            for result, baseline in zip(results, expected):
+                assert abs(result['similarity'] - baseline['similarity']) < 1e-4, "應以完整精度向量計算距離"
+        finally:
+            kb.delete()
+            other.delete()
+            ChunkEmbedding.objects.filter(model_name='test-retrieval').delete()
+        
+        return True
+    
     @test("工具函數測試")
     def test_utility_functions(self):
         """測試工具函數"""
@@ -235,6 +484,508 @@ class SystemTester:
         
         return True
     
+    @test("背景任務佇列測試")
+    def test_job_queue(self):
+        """測試本地任務佇列可在無 Redis 時執行任務"""
+        from quiz.job_queue import LocalJobQueue, task
+        
+        results = []
+        
+        @task('test_append')
+        def test_append(value):
+            results.append(value)
+        
+        queue = LocalJobQueue(eager=True)
+        queue.enqueue('test_append', value=42)
+        assert results == [42], f"任務未執行，結果 {results}"
+        
+        return True
+    
+    @test("查詢向量快取測試")
+    def test_embedding_cache(self):
+        """測試查詢向量快取的命中統計與 TTL"""
+        import numpy as np
+        
+        cache = EmbeddingCache('test-model', max_size=2, ttl=3600)
+        vector = np.ones(768, dtype=np.float32)
+        
+        assert cache.get('查詢') is None, "空快取不應命中"
+        cache.set('查詢', vector)
+        assert cache.get('查詢') is not None, "寫入後應命中"
+        
+        cache.set(TYPE_QUERIES['essay'], vector, pin=True)
+        cache.set('其他1', vector)
+        cache.set('其他2', vector)
+        assert cache.get(TYPE_QUERIES['essay']) is not None, "釘選的固定查詢不應被淘汰"
+        
+        stats = cache.stats()
+        assert stats['hits'] == 2 and stats['misses'] == 1, f"命中統計錯誤: {stats}"
+        
+        return True
+    
+    @test("增量 JSON 解析測試")
+    def test_incremental_json_parser(self):
+        """測試串流回應可逐題解析"""
+        response = '```json\n[{"question_text": "Q1 {?}", "question_type": "short_answer", ' \
+                   '"answer_text": "A1", "explanation": "E1"}, {"question_text": "Q2", ' \
+                   '"question_type": "short_answer", "answer_text": "A2", "explanation": "E2"}]```'
+        
+        parser = IncrementalJSONArrayParser()
+        completed_at = []
+        for i in range(0, len(response), 7):
+            if parser.feed(response[i:i + 7]):
+                completed_at.append(i)
+        assert len(completed_at) == 2, f"應解析出 2 題，實際 {len(completed_at)}"
+        
+        # 第一題應在整個回應結束前就完成
+        assert completed_at[0] < len(response) // 2 + 7, "第一題未能提前解析"
+        
+        questions = list(iter_questions(response[i:i + 5] for i in range(0, len(response), 5)))
+        assert [q['question_text'] for q in questions] == ['Q1 {?}', 'Q2'], "串流題目解析錯誤"
+        
+        return True
+    
+    @test("批次評分解析測試")
+    def test_batch_score_parsing(self):
+        """測試批次評分回應的逐題驗證"""
+        response = '```json\n[{"index": 1, "score": 85}, {"index": 2, "score": "很好"}, ' \
+                   '{"index": 3, "score": 150}, {"index": 4, "score": 72.6}]\n```'
+        scores = parse_batch_scores(response, 5)
+        assert scores == [85, None, None, 73, None], f"批次分數解析錯誤: {scores}"
+        
+        assert parse_batch_scores('[90, 30]', 2) == [90, 30], "純數字陣列解析錯誤"
+        assert parse_batch_scores('無法評分', 3) == [None] * 3, "無效回應應全部返回 None"
+        
+        return True
+    
+    @test("LLM 客戶端連線池測試")
+    def test_llm_client_pool(self):
+        """測試共用的 Ollama 客戶端套用 LLM_POOL_CONNECTIONS 連線池上限，且不在 transport 層重試"""
+        import asyncio
+        from django.conf import settings
+        from quiz.llm_clients import clear_clients, get_async_ollama_client, get_ollama_client
+        
+        base_url = 'http://127.0.0.1:1'
+        try:
+            client = get_ollama_client(base_url)
+            assert get_ollama_client(base_url) is client, "相同服務應共用客戶端"
+            pool = client._client._transport._pool
+            assert pool._max_connections == settings.LLM_POOL_CONNECTIONS, f"連線數上限未套用: {pool._max_connections}"
+            assert pool._max_keepalive_connections == settings.LLM_POOL_CONNECTIONS, "保持連線上限未套用"
+            # 重試只由 call_with_retry 負責，transport 不應再重試
+            assert pool._retries == 0, f"transport 不應重試: {pool._retries}"
+            
+            async def async_pool():
+                return get_async_ollama_client(base_url)._client._transport._pool
+            
+            pool = asyncio.run(async_pool())
+            assert pool._max_connections == settings.LLM_POOL_CONNECTIONS, "非同步客戶端連線數上限未套用"
+        finally:
+            clear_clients()
+        
+        return True
+    
+    @test("LLM 回應快取測試")
+    def test_llm_response_cache(self):
+        """測試提示詞正規化與各呼叫位置的命中統計"""
+        from quiz.llm_cache import LLMResponseCache
+        
+        cache = LLMResponseCache(max_size=2, ttl=60)
+        cache.set('grade', '請評分：\n  答案 A', 'gemma3:4b', 0.3, '85')
+        assert cache.get('grade', '請評分： 答案 A', 'gemma3:4b', 0.3) == '85', "空白差異應命中快取"
+        assert cache.get('grade', '請評分： 答案 A', 'gemma3:4b', 0.7) is None, "不同溫度不應命中"
+        assert cache.get('summary', '其他內容', 'gemma3:4b', 0.5) is None, "未快取的提示詞不應命中"
+        
+        stats = cache.stats()
+        assert stats['grade']['hits'] == 1 and stats['grade']['misses'] == 1, f"命中統計錯誤: {stats}"
+        assert stats['summary']['hit_rate'] == 0, f"命中率計算錯誤: {stats}"
+        
+        return True
+    
+    @test("Token 切分器測試")
+    def test_token_chunker(self):
+        """測試片段不超過 token 上限、相鄰片段重疊，且無標點的長句會被切開"""
+        from quiz.chunking import TokenChunker
+        
+        count_chars = lambda texts: [len(text) for text in texts]
+        chunker = TokenChunker(max_tokens=60, overlap_tokens=15, count_tokens=count_chars)
+        text = ''.join(f'第{i}句說明向量檢索，並介紹嵌入模型。' for i in range(20)) + '沒有任何標點的長句' * 30
+        blocks = [text[i:i + 37] for i in range(0, len(text), 37)]
+        chunks = list(chunker.iter_chunks(blocks))
+        
+        assert len(chunks) > 1, "應切出多個片段"
+        assert all(len(chunk) <= 58 for chunk in chunks), "片段超過 token 上限"
+        for previous, current in zip(chunks, chunks[1:]):
+            assert previous[-5:] in current, f"相鄰片段應有重疊: {previous[-5:]} / {current[:20]}"
+        assert chunks[-1].endswith('長句。'), "長句內容遺失"
+        
+        return True
+    
+    @test("嵌入伺服器動態批次測試")
+    def test_dynamic_batcher(self):
+        """測試同時到達的請求會合併為一次編碼，且各自取回正確的結果"""
+        import threading
+        import numpy as np
+        from quiz.embedding_server import DynamicBatcher
+        
+        calls = []
+        def encode(texts):
+            calls.append(len(texts))
+            return np.array([[len(text)] * 4 for text in texts], dtype=np.float32)
+        
+        batcher = DynamicBatcher(encode, max_batch=32, max_wait=0.2)
+        results = {}
+        def submit(i):
+            results[i] = batcher.encode(['字' * i, '字' * (i + 1)], timeout=5)
+        
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert all(results[i][:, 0].tolist() == [i, i + 1] for i in range(8)), "請求取回的向量順序錯誤"
+        assert sum(calls) == 16 and len(calls) < 8, f"請求未被合併: {calls}"
+        
+        return True
+    
+    @test("ONNX 嵌入一致性測試")
+    def test_onnx_backend_parity(self):
+        """測試 ONNX（int8）後端與 torch 後端輸出的餘弦相似度"""
+        from django.conf import settings
+        from quiz.embedding_backends import cosine_similarities, get_embedding_backend
+        
+        if not os.path.exists(settings.EMBEDDING_ONNX_PATH):
+            print("   警告: 尚未匯出 ONNX 模型，跳過此測試")
+            return True
+        
+        texts = ["向量資料庫以近似最近鄰索引加速檢索。", "光合作用將光能轉換為化學能。", "測試"]
+        expected = get_embedding_backend('torch', dtype='float32').encode(texts)
+        actual = get_embedding_backend('onnx').encode(texts)
+        similarities = cosine_similarities(expected, actual)
+        assert similarities.min() >= 0.98, f"ONNX 與 torch 輸出差異過大: {similarities}"
+        
+        return True
+    
+    @test("啟動延遲載入測試")
+    def test_lazy_ml_imports(self):
+        """測試解析 URL（匯入所有 views）時不會載入 ML 套件"""
+        import subprocess
+        
+        code = (
+            "import sys, django; django.setup(); "
+            "from django.urls import get_resolver; get_resolver().url_patterns; "
+            "print(','.join(m for m in ('torch', 'transformers', 'onnxruntime') if m in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, '-c', code], cwd=BASE_DIR, capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr[-500:]
+        assert not result.stdout.strip(), f"啟動時載入了 {result.stdout.strip()}"
+        
+        return True
+    
+    @test("非同步並行生成測試")
+    def test_async_generation(self):
+        """測試非同步批次以協程並行串流生成並去除重複題目"""
+        import asyncio
+        from quiz.generation import agenerate_questions_parallel
+        from quiz.rag_utils import generate_content_hash
+        
+        class FakeModel:
+            model_type, base_url, model_id, name = 'ollama', '', 'fake', 'fake'
+            
+            async def agenerate_content_stream(self, prompt):
+                text = json.dumps([{
+                    'question_text': f'{prompt}-{i}',
+                    'question_type': 'short_answer',
+                    'answer_text': '答案',
+                    'explanation': '解釋'
+                } for i in range(10)], ensure_ascii=False)
+                for start in range(0, len(text), 16):
+                    await asyncio.sleep(0)
+                    yield text[start:start + 16]
+        
+        prompts = iter(['a', 'b', 'c'])
+        questions = asyncio.run(agenerate_questions_parallel(
+            FakeModel(), 25, lambda count, history: next(prompts)
+        ))
+        assert len(questions) == 25, f"題數錯誤: {len(questions)}"
+        assert len({q['question_text'] for q in questions}) == 25
+        
+        # 已由題庫取得的題目（以內容雜湊排除）不會再出現在生成結果中
+        prompts = iter(['d', 'e'])
+        questions = asyncio.run(agenerate_questions_parallel(
+            FakeModel(), 5, lambda count, history: next(prompts),
+            exclude_hashes={generate_content_hash('d-0'), generate_content_hash('d-1')}
+        ))
+        texts = [q['question_text'] for q in questions]
+        assert texts == ['d-2', 'd-3', 'd-4', 'e-0', 'e-1'], f"題庫題目不應重複生成: {texts}"
+        
+        return True
+    
+    @test("生成進度事件測試")
+    def test_generation_events(self):
+        """測試 SSE 事件只在進度或題數變化時推送，並在生成結束時停止"""
+        from quiz.generation_events import GenerationEventTracker
+        
+        tracker = GenerationEventTracker()
+        state = {
+            'generation_status': 'generating', 'generation_progress': {'round': 1, 'batches_done': 0},
+            'generation_error': '', 'total_questions': 10, 'question_count': 0
+        }
+        assert len(tracker.update(state)) == 2  # 初始進度與題數
+        assert tracker.update(state) == []
+        
+        state['question_count'] = 3
+        events = tracker.update(state)
+        assert len(events) == 1 and events[0].startswith('event: question')
+        
+        state.update(generation_status='failed', generation_error='模型無回應')
+        events = tracker.update(state)
+        assert events[-1].startswith('event: error') and '模型無回應' in events[-1]
+        assert tracker.finished
+        
+        return True
+    
+    @test("非同步視圖測試")
+    def test_async_views(self):
+        """測試非同步的出題設定與答題視圖：只列出自己的知識庫、生成後轉到答題頁、作答後完成會話並計分"""
+        import asyncio
+        from unittest import mock
+        from django.test import AsyncClient
+        from django.urls import reverse
+        
+        user, _ = User.objects.get_or_create(username='test_user', defaults={'email': 'test@example.com'})
+        stranger, _ = User.objects.get_or_create(username='test_stranger', defaults={'email': 'stranger@example.com'})
+        kb = KnowledgeBase.objects.create(name="非同步視圖測試知識庫", user=user, content='')
+        KnowledgeBase.objects.create(name="其他使用者的知識庫", user=stranger, content='')
+        question = {
+            'question_text': "非同步視圖測試題目",
+            'question_type': 'true_false',
+            'options': [{'text': '正確', 'is_correct': True}, {'text': '錯誤', 'is_correct': False}],
+            'answer_text': '正確',
+            'explanation': '解釋',
+        }
+        
+        async def fake_generate(session, model=None):
+            session.questions_data = [question]
+            await session.asave(update_fields=['questions_data'])
+            return session.questions_data
+        
+        async def run():
+            client = AsyncClient()
+            await client.aforce_login(user)
+            setup = await client.get(reverse('custom_quiz_setup'))
+            
+            with override_settings(QUIZ_BACKGROUND_GENERATION=False), \
+                    mock.patch('quiz.views.agenerate_questions_with_model', side_effect=fake_generate):
+                created = await client.post(reverse('custom_quiz_setup'), {
+                    'knowledge_bases': [kb.id], 'question_types': ['true_false'],
+                    'difficulty': 'easy', 'total_questions': 1,
+                })
+            interface = await client.get(created.url)
+            answered = await client.post(created.url, {'answer': '正確'})
+            return setup, created, interface, answered
+        
+        try:
+            setup, created, interface, answered = asyncio.run(run())
+            page = setup.content.decode()
+            assert setup.status_code == 200, f"設定頁狀態碼錯誤: {setup.status_code}"
+            assert kb.name in page and "其他使用者的知識庫" not in page, "設定頁應只列出自己的知識庫"
+            
+            session = QuizSession.objects.filter(user=user, knowledge_bases=kb).get()
+            assert created.status_code == 302 and created.url == reverse('quiz_interface', args=[session.id]), \
+                f"生成後應轉到答題頁: {created.status_code}"
+            assert interface.status_code == 200 and question['question_text'] in interface.content.decode(), \
+                "答題頁應顯示已生成的題目"
+            
+            assert answered.url == reverse('quiz_result', args=[session.id]), "答完最後一題應轉到結果頁"
+            session.refresh_from_db()
+            assert session.is_completed and session.score == 100, f"會話未完成或總分錯誤: {session.score}"
+        finally:
+            kb.delete()
+            stranger.delete()
+        
+        return True
+    
+    @test("題庫抽題與補充測試")
+    def test_question_pool(self):
+        """測試題庫抽題排除已作答題目並優先抽出出題次數少的題目，以及補充門檻與實際新增題數"""
+        from unittest import mock
+        from quiz.question_pool import fill_pool, needs_refill, sample_from_pool
+        from quiz.rag_utils import generate_content_hash
+        
+        user, _ = User.objects.get_or_create(username='test_user', defaults={'email': 'test@example.com'})
+        kb = KnowledgeBase.objects.create(name="題庫測試", user=user, content='')
+        
+        def pooled(text, question_type='true_false', times_served=0):
+            return PooledQuestion.objects.create(
+                knowledge_base=kb, question_type=question_type, difficulty='easy',
+                question_hash=generate_content_hash(text), times_served=times_served,
+                question_data={'question_text': text, 'question_type': question_type}
+            )
+        
+        try:
+            seen = pooled("已作答的題目")
+            fresh = pooled("從未出題的題目")
+            pooled("已出題三次的題目", times_served=3)
+            pooled("選擇題題目", question_type='multiple_choice')
+            HistoryQuestion.objects.create(user=user, knowledge_base_ids=str(kb.id),
+                                           question_hash=seen.question_hash, question_data=seen.question_data)
+            
+            picked = sample_from_pool(user, [kb.id], 'true_false', 'easy', 1)
+            assert picked == [fresh.question_data], f"應抽出出題次數最少的未作答題目: {picked}"
+            fresh.refresh_from_db()
+            assert fresh.times_served == 1, "抽出的題目出題次數應增加"
+            
+            # 各題型平均分配，已作答的題目不會被抽出
+            picked = sample_from_pool(user, [kb.id], 'true_false,multiple_choice', 'easy', 4)
+            texts = [q['question_text'] for q in picked]
+            assert texts == ["從未出題的題目", "已出題三次的題目", "選擇題題目"], f"抽題結果錯誤: {texts}"
+            
+            with override_settings(QUESTION_POOL_REFILL_THRESHOLD=2):
+                assert not needs_refill(user, [kb.id], 'true_false', 'easy'), "是非題未作答題數已達門檻"
+                assert needs_refill(user, [kb.id], 'true_false,multiple_choice', 'easy'), "選擇題不足時應補充"
+            
+            # 生成的題目與題庫重複時不計入新增題數
+            generated = [
+                {'question_text': "從未出題的題目", 'question_type': 'true_false'},
+                {'question_text': "新生成的題目", 'question_type': 'true_false'},
+            ]
+            with mock.patch('quiz.question_pool.get_relevant_content', return_value="內容"), \
+                    mock.patch('quiz.question_pool.generate_questions_parallel', return_value=generated):
+                added = fill_pool(kb, model=mock.Mock(), question_types=['true_false'],
+                                  difficulties=['easy'], target=5)
+            assert added == 1, f"新增題數應只計算實際寫入的題目: {added}"
+        finally:
+            HistoryQuestion.objects.filter(user=user, knowledge_base_ids=str(kb.id)).delete()
+            kb.delete()
+        
+        return True
+    
+    @test("使用者統計增量更新測試")
+    def test_user_stats(self):
+        """測試會話完成、評分與刪除時 UserStats 的增量結果與完整計算一致"""
+        from quiz.user_stats import check_user_stats, get_user_stats
+        
+        user, _ = User.objects.get_or_create(username='test_user', defaults={'email': 'test@example.com'})
+        stats = get_user_stats(user)
+        
+        session = QuizSession.objects.create(
+            user=user, quiz_type='flashcard', question_types='true_false',
+            difficulty='easy', total_questions=1
+        )
+        session.is_completed = True
+        session.save()
+        session.score = 80
+        session.save(update_fields=['score'])
+        
+        # 重新載入的實例刪除時也要扣回貢獻
+        other = QuizSession.objects.create(
+            user=user, quiz_type='custom', question_types='essay',
+            difficulty='easy', total_questions=1, is_completed=True, score=40
+        )
+        QuizSession.objects.get(id=other.id).delete()
+        
+        stats.refresh_from_db()
+        assert not check_user_stats(stats), f"統計不一致: {check_user_stats(stats)}"
+        
+        session.delete()
+        return True
+    
+    @test("背景評分統計一致性測試")
+    def test_user_stats_after_grading(self):
+        """測試答案載入後會話才完成時，背景評分補上總分不會重複計入完成數"""
+        from unittest import mock
+        from quiz.grading import grade_pending_answer
+        from quiz.user_stats import check_user_stats, get_user_stats
+        
+        user, _ = User.objects.get_or_create(username='test_user', defaults={'email': 'test@example.com'})
+        session = QuizSession.objects.create(
+            user=user, quiz_type='custom', question_types='short_answer', difficulty='easy', total_questions=1,
+            questions_data=[{'question_text': '問題', 'answer_text': '答案', 'question_type': 'short_answer'}]
+        )
+        answer = QuestionAnswer.objects.create(
+            session=session, question_index=0, question_text='問題', question_type='short_answer',
+            correct_answer='答案', user_answer='回答', grading_status='pending'
+        )
+        
+        # 背景任務先載入答案（會話尚未完成），之後答題流程才完成會話
+        answer = QuestionAnswer.objects.select_related('session').get(id=answer.id)
+        completed = QuizSession.objects.get(id=session.id)
+        completed.is_completed = True
+        completed.save()
+        
+        stats = get_user_stats(user)
+        completed_before = (stats.completed_sessions, stats.custom_completed)
+        with mock.patch('quiz.utils.grade_subjective_answer', return_value=80):
+            grade_pending_answer(answer)
+        
+        stats.refresh_from_db()
+        assert (stats.completed_sessions, stats.custom_completed) == completed_before, "評分後完成數被重複計入"
+        assert not check_user_stats(stats), f"統計不一致: {check_user_stats(stats)}"
+        
+        session.delete()
+        return True
+    
+    @test("評分失敗總分測試")
+    def test_failed_grading_score(self):
+        """測試主觀題全部評分失敗時總分維持空值，不以 0 分計入使用者統計"""
+        from quiz.grading import refresh_session_score
+        from quiz.user_stats import get_user_stats
+        
+        user, _ = User.objects.get_or_create(username='test_user', defaults={'email': 'test@example.com'})
+        session = QuizSession.objects.create(
+            user=user, quiz_type='custom', question_types='short_answer', difficulty='easy',
+            total_questions=2, is_completed=True
+        )
+        stats = get_user_stats(user)
+        scored_before = stats.custom_scored
+        
+        def add_answer(index, grading_status, score=None):
+            QuestionAnswer.objects.create(
+                session=session, question_index=index, question_text='問題', question_type='short_answer',
+                correct_answer='答案', user_answer='回答', grading_status=grading_status, score=score
+            )
+        
+        add_answer(0, 'failed')
+        assert refresh_session_score(session) is None, "全部評分失敗時不應記為 0 分"
+        stats.refresh_from_db()
+        assert stats.custom_scored == scored_before, "評分失敗的會話不應計入已評分數"
+        
+        # 有評分成功的答案時只以成功的答案計算
+        add_answer(1, 'graded', score=80)
+        assert refresh_session_score(session) == 80.0, f"總分錯誤: {session.score}"
+        stats.refresh_from_db()
+        assert stats.custom_scored == scored_before + 1, "補上總分後應計入已評分數"
+        
+        session.delete()
+        return True
+    
+    @test("頁面快取失效測試")
+    def test_page_cache(self):
+        """測試資料異動時 signals 遞增版本號，使用者的頁面片段快取失效"""
+        from quiz.page_cache import SCOPE_KNOWLEDGE_BASES, SCOPE_QUIZZES, get_cache_version
+        
+        user, _ = User.objects.get_or_create(username='test_user', defaults={'email': 'test@example.com'})
+        before = get_cache_version(user.id, SCOPE_KNOWLEDGE_BASES)
+        
+        kb = KnowledgeBase.objects.create(user=user, name='快取測試', summary='快取測試', content='測試內容')
+        after = get_cache_version(user.id, SCOPE_KNOWLEDGE_BASES)
+        assert after != before, "新增知識庫後版本號未改變"
+        
+        # 未完成的會話不影響頁面內容
+        quizzes = get_cache_version(user.id, SCOPE_QUIZZES)
+        session = QuizSession.objects.create(
+            user=user, quiz_type='flashcard', question_types='true_false',
+            difficulty='easy', total_questions=1
+        )
+        assert get_cache_version(user.id, SCOPE_QUIZZES) == quizzes, "未完成的會話使快取失效"
+        session.delete()
+        
+        kb.delete()
+        assert get_cache_version(user.id, SCOPE_KNOWLEDGE_BASES) != after, "刪除知識庫後版本號未改變"
+        return True
+    
     def run_all_tests(self):
         """執行所有測試"""
         print("🚀 開始執行系統測試...")
@@ -247,7 +998,30 @@ class SystemTester:
         self.test_ollama_connection()
         self.test_models()
         self.test_rag_functionality()
+        self.test_reingest_knowledge_base()
+        self.test_vector_search()
+        self.test_multi_query_search()
+        self.test_hybrid_search()
+        self.test_vector_storage_search()
         self.test_utility_functions()
+        self.test_job_queue()
+        self.test_embedding_cache()
+        self.test_incremental_json_parser()
+        self.test_batch_score_parsing()
+        self.test_llm_client_pool()
+        self.test_llm_response_cache()
+        self.test_token_chunker()
+        self.test_dynamic_batcher()
+        self.test_onnx_backend_parity()
+        self.test_lazy_ml_imports()
+        self.test_async_generation()
+        self.test_generation_events()
+        self.test_async_views()
+        self.test_question_pool()
+        self.test_user_stats()
+        self.test_user_stats_after_grading()
+        self.test_failed_grading_score()
+        self.test_page_cache()
         
         # 清理測試資料
         self.cleanup_test_data()